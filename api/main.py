@@ -1,30 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import sys
 import os
+import asyncio
 from pathlib import Path
 import json
-from typing import Optional
+from typing import List, Optional
 
 # Add parent directory to Python path to import modules
 api_dir = Path(__file__).resolve().parent
 root_dir = api_dir.parent
 sys.path.append(str(root_dir))
 
-from modules.scaffolding.engine import ScaffoldingEngine
-from modules.image_processing.image_processor import ImageProcessor
-from utils.validation import AnswerValidator
-import base64
-from io import BytesIO
-from PIL import Image
-from dotenv import load_dotenv
+from modules.scaffolding.models import Scaffolding
+from utils.env import load_env
+from utils.registry import get_registry
+from utils.metrics import gauge_lines, registry, timed
+from utils.tracing import end_trace, start_trace
+from modules.image_processing.phash_cache import get_ocr_cache
+from utils.logging_utils import validation_logger as logger
 
 # Load environment variables
-load_dotenv()
+load_env()
 
 app = FastAPI(title="AI Math Tutor API")
 
+# Worksheet batch limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Wrong answers allowed before a step is revealed and the session moves on
+MAX_ATTEMPTS_PER_STEP = int(os.getenv("MAX_ATTEMPTS_PER_STEP", "5"))
+
+# Scrapes and probes would otherwise fill the trace file
+UNTRACED_PATHS = {"/metrics"}
+
 # Configure CORS with more permissive settings for development
 app.add_middleware(
     CORSMiddleware,
@@ -35,10 +46,67 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# Initialize components
-scaffolding_engine = ScaffoldingEngine()
-image_processor = ImageProcessor()
-answer_validator = AnswerValidator()
+# Components are built on first use and share one pooled async LLM gateway
+components = get_registry()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Give each request a trace whose id is returned in the X-Trace-Id header.
+
+    A client-supplied X-Trace-Id is reused so mobile and server spans line up.
+    For streamed responses the trace stays open until the last chunk is sent.
+    """
+    if request.url.path in UNTRACED_PATHS:
+        return await call_next(request)
+    root, token = start_trace(
+        f"{request.method} {request.url.path}",
+        trace_id=request.headers.get("x-trace-id"),
+        http_method=request.method,
+        http_path=request.url.path
+    )
+    if root is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        end_trace(root, token, e)
+        raise
+    root.set_attribute("http_status", response.status_code)
+    response.headers["X-Trace-Id"] = root.trace_id
+    body = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            end_trace(root, token)
+    response.body_iterator = traced_body()
+    return response
+
+class UnreadableImage(Exception):
+    """An upload failed the image quality gate, so the client should ask for a retake."""
+    def __init__(self, quality: dict):
+        super().__init__(quality["message"])
+        self.quality = quality
+
+@app.exception_handler(UnreadableImage)
+async def unreadable_image(request: Request, exc: UnreadableImage):
+    # detail stays a plain message for existing clients; retake and the scores are extra
+    return JSONResponse(
+        status_code=422,
+        content={"detail": str(exc), "retake": True, "quality": exc.quality}
+    )
+
+def _check_readable(image_data: Optional[dict]):
+    """Raise UnreadableImage if the image was rejected before the vision call."""
+    quality = (image_data or {}).get("quality")
+    if quality and not quality["passed"]:
+        raise UnreadableImage(quality)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await components.aclose()
 
 @app.get("/")
 async def root():
@@ -47,54 +115,51 @@ async def root():
 @app.post("/process-text-problem")
 async def process_text_problem(problem: str):
     try:
-        steps = scaffolding_engine.generate_scaffolding(
-            concept="unknown",
-            problem_analysis="",
-            knowledge_assessment="",
-            problem_text=problem
-        )
-        return {"success": True, "steps": steps}
+        with timed("scaffolding"):
+            steps = await components.scaffolding_engine.generate_scaffolding(
+                concept="unknown",
+                problem_analysis="",
+                knowledge_assessment="",
+                problem_text=problem
+            )
+        session = components.session_store.create(problem, steps)
+        return {"success": True, "session_id": session.session_id, "steps": steps.to_dict()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process-image-problem")
 async def process_image_problem(file: UploadFile = File(...)):
     try:
-        # Read and process the image
-        contents = await file.read()
-        image = Image.open(BytesIO(contents))
-        
-        # Save image temporarily
-        temp_path = "temp_image.jpg"
-        image.save(temp_path)
+        # Read the upload and extract the problem in memory
+        with timed("upload_read"):
+            contents = await file.read()
+        problem_data = await components.image_processor.process_image(contents, mode="problem")
+        _check_readable(problem_data)
         
-        try:
-            # Extract problem from image
-            problem_data = image_processor.process_image(temp_path, mode="problem")
-            
-            if problem_data and "problem_text" in problem_data:
-                # Generate steps
-                steps = scaffolding_engine.generate_scaffolding(
+        if problem_data and "problem_text" in problem_data:
+            # Generate steps
+            with timed("scaffolding"):
+                steps = await components.scaffolding_engine.generate_scaffolding(
                     concept="unknown",
                     problem_analysis="",
                     knowledge_assessment="",
                     problem_text=problem_data["problem_text"]
                 )
-                return {
-                    "success": True,
-                    "problem": problem_data["problem_text"],
-                    "steps": steps
-                }
-            else:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="Could not extract valid problem text from image"
-                )
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            session = components.session_store.create(problem_data["problem_text"], steps)
+            return {
+                "success": True,
+                "session_id": session.session_id,
+                "problem": problem_data["problem_text"],
+                "steps": steps.to_dict()
+            }
+        else:
+            raise HTTPException(
+                status_code=400, 
+                detail="Could not extract valid problem text from image"
+            )
                 
+    except UnreadableImage:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -110,28 +175,20 @@ async def process_combined_problem(
         problem_text = text or ""
         
         if file:
-            # Read and process the image
-            contents = await file.read()
-            image = Image.open(BytesIO(contents))
-            
-            # Save image temporarily
-            temp_path = "temp_image.jpg"
-            image.save(temp_path)
+            # Read the upload and extract the problem in memory
+            with timed("upload_read"):
+                contents = await file.read()
+            problem_data = await components.image_processor.process_image(contents, mode="problem")
+            # With typed text as well, an unreadable photo is skipped like a failed extraction
+            if not problem_text:
+                _check_readable(problem_data)
             
-            try:
-                # Extract problem from image
-                problem_data = image_processor.process_image(temp_path, mode="problem")
-                
-                if problem_data and "problem_text" in problem_data:
-                    # Combine text and image problem
-                    if problem_text:
-                        problem_text = f"{problem_text}\n{problem_data['problem_text']}"
-                    else:
-                        problem_text = problem_data["problem_text"]
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+            if problem_data and "problem_text" in problem_data:
+                # Combine text and image problem
+                if problem_text:
+                    problem_text = f"{problem_text}\n{problem_data['problem_text']}"
+                else:
+                    problem_text = problem_data["problem_text"]
         
         if not problem_text:
             raise HTTPException(
@@ -140,66 +197,295 @@ async def process_combined_problem(
             )
             
         # Generate steps
-        steps = scaffolding_engine.generate_scaffolding(
-            concept="unknown",
-            problem_analysis="",
-            knowledge_assessment="",
-            problem_text=problem_text
-        )
+        with timed("scaffolding"):
+            steps = await components.scaffolding_engine.generate_scaffolding(
+                concept="unknown",
+                problem_analysis="",
+                knowledge_assessment="",
+                problem_text=problem_text
+            )
+        session = components.session_store.create(problem_text, steps)
         return {
             "success": True,
+            "session_id": session.session_id,
             "problem": problem_text,
-            "steps": steps
+            "steps": steps.to_dict()
         }
                 
+    except UnreadableImage:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing problem: {str(e)}"
         )
 
+def _ndjson(event: dict) -> str:
+    """Serialize one streaming event as a newline-delimited JSON line."""
+    return json.dumps(event) + "\n"
+
+async def _stream_steps(problem_text: str):
+    """Yield NDJSON events for a problem, pushing each step as soon as it is generated."""
+    yield _ndjson({"type": "problem", "problem": problem_text})
+    steps = []
+    index = 0
+    try:
+        async for step in components.scaffolding_engine.stream_scaffolding(
+            concept="unknown",
+            problem_analysis="",
+            knowledge_assessment="",
+            problem_text=problem_text
+        ):
+            yield _ndjson({"type": "step", "index": index, "step": step.to_dict()})
+            steps.append(step)
+            index += 1
+        session = components.session_store.create(problem_text, Scaffolding(steps))
+        yield _ndjson({"type": "done", "total_steps": index, "session_id": session.session_id})
+    except Exception as e:
+        yield _ndjson({"type": "error", "detail": str(e)})
+
+def _steps_response(problem_text: str) -> StreamingResponse:
+    return StreamingResponse(_stream_steps(problem_text), media_type="application/x-ndjson")
+
+@app.post("/process-text-problem/stream")
+async def process_text_problem_stream(problem: str):
+    return _steps_response(problem)
+
+@app.post("/process-image-problem/stream")
+async def process_image_problem_stream(file: UploadFile = File(...)):
+    try:
+        with timed("upload_read"):
+            contents = await file.read()
+        problem_data = await components.image_processor.process_image(contents, mode="problem")
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error processing image: {str(e)}"
+        )
+    
+    _check_readable(problem_data)
+    if not (problem_data and problem_data.get("problem_text")):
+        raise HTTPException(
+            status_code=400, 
+            detail="Could not extract valid problem text from image"
+        )
+    return _steps_response(problem_data["problem_text"])
+
+@app.post("/process-combined-problem/stream")
+async def process_combined_problem_stream(
+    file: Optional[UploadFile] = None,
+    text: Optional[str] = Form(None)
+):
+    problem_text = text or ""
+    
+    if file:
+        try:
+            with timed("upload_read"):
+                contents = await file.read()
+            problem_data = await components.image_processor.process_image(contents, mode="problem")
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error processing problem: {str(e)}"
+            )
+        
+        if not problem_text:
+            _check_readable(problem_data)
+        if problem_data and problem_data.get("problem_text"):
+            # Combine text and image problem
+            if problem_text:
+                problem_text = f"{problem_text}\n{problem_data['problem_text']}"
+            else:
+                problem_text = problem_data["problem_text"]
+    
+    if not problem_text:
+        raise HTTPException(
+            status_code=400,
+            detail="No problem text provided in either text or image"
+        )
+    return _steps_response(problem_text)
+
+@app.post("/process-worksheet-image")
+async def process_worksheet_image(
+    file: UploadFile = File(...),
+    max_concurrency: Optional[int] = Form(None)
+):
+    """Find every problem on a photographed worksheet so the student can pick one.
+    
+    Problems are returned in reading order with their text, type and pixel box;
+    the chosen one is started with /process-text-problem.
+    """
+    try:
+        with timed("upload_read"):
+            contents = await file.read()
+        concurrency = min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+        worksheet = await components.image_processor.process_worksheet(contents, max_concurrency=max(concurrency, 1))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing image: {str(e)}"
+        )
+    
+    _check_readable(worksheet)
+    if not worksheet.get("problems"):
+        raise HTTPException(
+            status_code=400,
+            detail=worksheet.get("error") or "Could not find any problems in the image"
+        )
+    return {
+        "success": True,
+        "problems": [
+            {
+                "index": problem["index"],
+                "problem": problem["problem_text"],
+                "problem_type": problem.get("problem_type", "unknown"),
+                "box": problem["box"]
+            }
+            for problem in worksheet["problems"]
+        ]
+    }
+
+async def _process_batch_item(index: int, source: str, payload, semaphore: asyncio.Semaphore) -> dict:
+    """Extract, analyze and scaffold one worksheet item, capturing any error in the result."""
+    result = {"index": index, "source": source}
+    async with semaphore:
+        try:
+            if source == "image":
+                problem_data = await components.image_processor.process_image(payload, mode="problem")
+                _check_readable(problem_data)
+                problem_text = (problem_data or {}).get("problem_text")
+                if not problem_text:
+                    raise ValueError(
+                        (problem_data or {}).get("error") or "Could not extract valid problem text from image"
+                    )
+            else:
+                problem_text = payload.strip()
+                if not problem_text:
+                    raise ValueError("Empty problem text")
+            
+            # Analysis and scaffolding are independent, so run them side by side
+            analysis, steps = await asyncio.gather(
+                components.problem_analyzer.analyze_problem(problem_text),
+                components.scaffolding_engine.generate_scaffolding(
+                    concept="unknown",
+                    problem_analysis="",
+                    knowledge_assessment="",
+                    problem_text=problem_text
+                )
+            )
+            session = components.session_store.create(problem_text, steps)
+            result.update({
+                "success": True,
+                "session_id": session.session_id,
+                "problem": problem_text,
+                "analysis": analysis,
+                "steps": steps.to_dict()
+            })
+        except UnreadableImage as e:
+            result.update({"success": False, "error": str(e), "retake": True, "quality": e.quality})
+        except Exception as e:
+            result.update({"success": False, "error": str(e)})
+    return result
+
+@app.post("/process-problems-batch")
+async def process_problems_batch(
+    texts: List[str] = Form([]),
+    files: List[UploadFile] = File([]),
+    max_concurrency: Optional[int] = Form(None),
+    stream: bool = Form(False)
+):
+    """Process a worksheet of text and/or image problems concurrently.
+    
+    Items are numbered texts first, then files. Each result carries its own
+    success flag and error, so one bad item never fails the whole batch. With
+    ``stream`` set, results are sent as NDJSON lines in completion order.
+    """
+    items = [("text", text) for text in texts]
+    for file in files:
+        items.append(("image", await file.read()))
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No problems provided")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(items)} items (max {BATCH_MAX_ITEMS})"
+        )
+    
+    concurrency = min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    tasks = [
+        asyncio.create_task(_process_batch_item(index, source, payload, semaphore))
+        for index, (source, payload) in enumerate(items)
+    ]
+    
+    if stream:
+        async def stream_results():
+            try:
+                for completed in asyncio.as_completed(tasks):
+                    yield _ndjson({"type": "result", **(await completed)})
+                yield _ndjson({"type": "done", "total": len(tasks)})
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*tasks)
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "success": True,
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }
+
 @app.post("/validate-answer")
 async def validate_answer(
-    step_data: str = Form(...),
+    session_id: str = Form(...),
+    step_index: Optional[int] = Form(None),
     answer: str = Form(None),
     file: UploadFile = None
 ):
+    """Validate an answer to a step of a tutoring session (the current step by default)."""
+    session = components.session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    if step_index is None:
+        step_index = session.current_step
+    try:
+        step = session.step(step_index)
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
-        step_data_dict = json.loads(step_data)
-        
         # Process image if provided
         answer_text = answer or ""
         if file:
             try:
-                contents = await file.read()
-                image = Image.open(BytesIO(contents))
-                
-                # Save image temporarily
-                temp_path = "temp_answer.jpg"
-                image.save(temp_path)
+                with timed("upload_read"):
+                    contents = await file.read()
                 
-                try:
-                    # Extract answer from image
-                    answer_data = image_processor.process_image(temp_path, mode="answer")
-                    if answer_data and isinstance(answer_data, dict):
-                        # Extract the answer text from the processed image
-                        if 'answer_text' in answer_data:
-                            extracted_text = answer_data['answer_text']
-                            # Clean up the extracted text
-                            if isinstance(extracted_text, str):
-                                # Remove any leading/trailing colons and whitespace
-                                extracted_text = extracted_text.strip(': ')
-                                # Split by commas and take the last equation if multiple are present
-                                equations = [eq.strip() for eq in extracted_text.split(',')]
-                                answer_text = equations[-1]  # Take the last equation as it's likely the final answer
-                            else:
-                                answer_text = str(extracted_text)
-                finally:
-                    # Clean up temp file
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
+                # Extract answer from image
+                answer_data = await components.image_processor.process_image(contents, mode="answer")
+                if not answer_text:
+                    _check_readable(answer_data)
+                if answer_data and isinstance(answer_data, dict):
+                    # Extract the answer text from the processed image
+                    if 'answer_text' in answer_data:
+                        extracted_text = answer_data['answer_text']
+                        # Clean up the extracted text
+                        if isinstance(extracted_text, str):
+                            # Remove any leading/trailing colons and whitespace
+                            extracted_text = extracted_text.strip(': ')
+                            # Split by commas and take the last equation if multiple are present
+                            equations = [eq.strip() for eq in extracted_text.split(',')]
+                            answer_text = equations[-1]  # Take the last equation as it's likely the final answer
+                        else:
+                            answer_text = str(extracted_text)
+            except UnreadableImage:
+                raise
             except Exception as img_error:
-                print(f"Error processing image: {str(img_error)}")
+                logger.error("Error processing image: %s", img_error)
                 # Don't fail completely on image processing error
                 answer_text = "Error processing image"
         
@@ -209,18 +495,78 @@ async def validate_answer(
                 detail="No answer provided in either text or image"
             )
             
-        print(f"Validating answer - Expected: {step_data_dict['expected_answer']}, Got: {answer_text}")
-        result = answer_validator.validate_answer(
-            step_instruction=step_data_dict["instruction"],
-            expected_answer=step_data_dict["expected_answer"],
-            user_answer=answer_text
-        )
-        return {"success": True, "validation": result}
-    except HTTPException:
+        logger.debug("Validating answer - Expected: %s, Got: %s", step.expected_answer, answer_text)
+        with timed("answer_validation"):
+            result = await components.answer_validator.validate_step(step, answer_text)
+        step_done = session.record_attempt(step_index, result["is_correct"], MAX_ATTEMPTS_PER_STEP)
+        components.session_store.save(session)
+        return {
+            "success": True,
+            "validation": result,
+            "step_index": step_index,
+            "step_done": step_done,
+            "session": session.progress()
+        }
+    except (HTTPException, UnreadableImage):
         raise
     except Exception as e:
-        print(f"Error in validate_answer: {str(e)}")
+        logger.error("Error in validate_answer: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _collect_cache_metrics() -> List[str]:
+    """Expose the counters the caches and session store already keep as gauges."""
+    lines = []
+    llm_cache = components.llm.cache
+    if llm_cache is not None:
+        cache_stats = llm_cache.stats()
+        lookups, ratios = {}, {}
+        for namespace, counters in cache_stats["namespaces"].items():
+            for outcome in ("memory_hits", "disk_hits", "misses"):
+                lookups[(namespace, outcome)] = counters[outcome]
+            total = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            ratios[(namespace,)] = (counters["memory_hits"] + counters["disk_hits"]) / total if total else 0.0
+        lines += gauge_lines("tutor_llm_cache_lookups", "LLM cache lookups by namespace and outcome",
+                             lookups, ["namespace", "outcome"])
+        lines += gauge_lines("tutor_llm_cache_hit_ratio", "LLM cache hit ratio (memory and disk)",
+                             ratios, ["namespace"])
+        lines += gauge_lines("tutor_llm_cache_bytes", "LLM cache size per tier",
+                             {("memory",): cache_stats["memory_bytes"], ("disk",): cache_stats["disk_bytes"]},
+                             ["tier"])
+    scheduler = components.llm.scheduler
+    if scheduler is not None:
+        lines += gauge_lines("tutor_llm_queue_depth", "LLM calls waiting for rate-limit capacity",
+                             scheduler.queue_depths(), ["model", "priority"])
+    router = components.llm.router
+    if router is not None:
+        model_stats = router.stats()
+        lines += gauge_lines("tutor_llm_model_latency_seconds", "Smoothed provider latency the model router sees",
+                             {(model,): stats["latency_seconds"] for model, stats in model_stats.items()}, ["model"])
+        lines += gauge_lines("tutor_llm_model_error_rate", "Smoothed error rate the model router sees",
+                             {(model,): stats["error_rate"] for model, stats in model_stats.items()}, ["model"])
+    ocr_stats = get_ocr_cache().stats()
+    lines += gauge_lines("tutor_ocr_cache_hit_ratio", "Perceptual-hash OCR cache hit ratio",
+                         {(mode,): counters["hit_rate"] for mode, counters in ocr_stats.items()}, ["mode"])
+    lines += gauge_lines("tutor_sessions", "Tutoring session store counters",
+                         {(name,): value for name, value in components.session_store.stats().items()}, ["kind"])
+    lines += gauge_lines("tutor_component_build_seconds", "Time taken to build each component on first use",
+                         {(name,): seconds for name, seconds in components.build_seconds.items()}, ["component"])
+    return lines
+
+registry.register_collector(_collect_cache_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of latency, token, cache and fallback metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Return a session's problem, steps and progress so a client can resume it."""
+    session = components.session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"success": True, "session": session.to_dict()}
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
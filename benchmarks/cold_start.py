@@ -0,0 +1,88 @@
+"""Cold-start benchmark for API workers and the CLI tutor.
+
+Each sample runs in a fresh interpreter and measures the time to import the
+app and to serve its first text problem (solved locally, so no LLM is
+involved). Reports the median and worst of ``--runs`` samples.
+
+    python -m benchmarks.cold_start --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+API_PROBE = """
+import time, json, asyncio
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+import httpx
+
+async def first_request():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api") as client:
+        response = await client.post("/process-text-problem", params={"problem": "2x + 5 = 15"})
+        response.raise_for_status()
+
+asyncio.run(first_request())
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_request_s": done - imported}))
+"""
+
+CLI_PROBE = """
+import time, json, asyncio
+start = time.perf_counter()
+import test_main
+tutor = test_main.AITutor()
+imported = time.perf_counter()
+asyncio.run(tutor.components.scaffolding_engine.generate_solution_steps("2x + 5 = 15"))
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_request_s": done - imported}))
+"""
+
+
+def sample(probe: str, cwd: Path) -> Dict[str, float]:
+    env = {**os.environ, "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "cold-start"), "SESSION_DB": "",
+           "LLM_CACHE_ENABLED": "0", "TRACING_ENABLED": "0", "LOG_LEVEL": "WARNING",
+           "PYTHONPATH": str(ROOT_DIR)}
+    output = subprocess.run([sys.executable, "-c", probe], cwd=cwd, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, float]:
+    summary = {}
+    for key in ("import_s", "first_request_s"):
+        values = [s[key] for s in samples]
+        summary[f"{key[:-2]}_median_ms"] = round(statistics.median(values) * 1000, 1)
+        summary[f"{key[:-2]}_max_ms"] = round(max(values) * 1000, 1)
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Measure worker cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, probe, cwd in (("api", API_PROBE, ROOT_DIR / "api"), ("cli", CLI_PROBE, ROOT_DIR)):
+        results[name] = summarize([sample(probe, cwd) for _ in range(args.runs)])
+        print(f"{name:<4} import {results[name]['import_median_ms']:>7} ms (max {results[name]['import_max_ms']}), "
+              f"first request {results[name]['first_request_median_ms']:>7} ms "
+              f"(max {results[name]['first_request_max_ms']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
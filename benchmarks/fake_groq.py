@@ -0,0 +1,291 @@
+"""Local stand-in for the Groq chat completions API, for offline load tests.
+
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>. Responses are
+canned JSON chosen from the prompt (scaffolding, problem analysis, answer
+validation, OCR and the assessment, reinforcement and feedback modules), delayed by a configurable latency distribution, with
+optional injected server errors and 429 rate limits.
+
+    python -m benchmarks.fake_groq --port 8090 --latency lognormal:0.4:0.5 --rate-limit-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SCAFFOLDING_RESPONSE = {
+    "steps": [
+        {
+            "instruction": "Write an equation for the problem, using n for the number.",
+            "expected_answer": "2n + 5 = 15",
+            "hint": "Twice a number is 2n",
+            "explanation": "Translating words into an equation lets us solve it."
+        },
+        {
+            "instruction": "Subtract 5 from both sides.",
+            "expected_answer": "2n = 10",
+            "hint": "Undo the addition first",
+            "explanation": "Isolating the term with n is the first step."
+        },
+        {
+            "instruction": "Divide both sides by 2.",
+            "expected_answer": "n = 5",
+            "hint": "Undo the multiplication",
+            "explanation": "Dividing leaves n on its own."
+        }
+    ]
+}
+
+ANALYSIS_RESPONSE = {
+    "problem_type": "linear_equation",
+    "key_concepts": ["equation_solving"],
+    "complexity": "basic",
+    "key_entities": ["n", "+"],
+    "related_concepts": ["arithmetic"]
+}
+
+VALIDATION_RESPONSE = {
+    "is_correct": True,
+    "explanation": "The answer matches the expected result.",
+    "normalized_answer": "n = 5",
+    "understanding_level": "full",
+    "is_final_answer": True
+}
+
+PROBLEM_OCR_RESPONSE = {
+    "problem_text": "Twice a number plus 5 is 15. What is the number?",
+    "problem_type": "word_problem",
+    "additional_context": ""
+}
+
+DIAGNOSTICS_RESPONSE = {
+    "questions": [{
+        "text": "What is the first step to solve 2x + 5 = 15?",
+        "options": ["Subtract 5 from both sides", "Divide by 2", "Add 5 to both sides", "Multiply by 2"],
+        "correct_index": 0,
+        "explanation": "Undo the addition before the multiplication.",
+        "concept_tested": "inverse operations"
+    }],
+    "recommended_topics": ["inverse operations"],
+    "prerequisites": ["integer arithmetic"]
+}
+
+RESPONSE_ANALYSIS_RESPONSE = {
+    "knowledge_gaps": ["order of inverse operations"],
+    "misconceptions": ["dividing before subtracting"],
+    "strengths": ["arithmetic"],
+    "next_steps": ["practice two-step equations"]
+}
+
+REINFORCEMENT_RESPONSE = {
+    "schedule": {"next_review": "2024-01-08", "interval_days": 7},
+    "practice_set": [
+        {"type": "recall", "problem": "Solve 3x + 2 = 11", "scaffolding_level": "medium"},
+        {"type": "application", "problem": "A number times 4 minus 3 is 9. Find it.", "scaffolding_level": "high"},
+        {"type": "analysis", "problem": "Why subtract before dividing in 5x + 1 = 16?", "scaffolding_level": "low"}
+    ],
+    "connections": {"prerequisites": ["inverse operations"], "real_world": ["splitting a bill"]}
+}
+
+FEEDBACK_RESPONSE = {
+    "error_analysis": {
+        "error_type": "procedural",
+        "specific_misconception": "Divided by 2 before subtracting 5"
+    },
+    "feedback_steps": [
+        {"type": "hint", "content": "Undo the +5 first.", "priority": "critical"}
+    ],
+    "practice_recommendations": {
+        "immediate_practice": ["two_step_equations"],
+        "foundational_review": ["inverse_operations"]
+    }
+}
+
+ANSWER_OCR_RESPONSE = {
+    "answer_text": "n = 5",
+    "explanation": "Divided both sides by 2",
+    "confidence": 0.95
+}
+
+
+class LatencyDistribution:
+    """Response delay in seconds, parsed from a spec string.
+
+    ``const:0.3``, ``uniform:0.1:0.6`` or ``lognormal:<median>:<sigma>``.
+    """
+
+    def __init__(self, kind: str, params: List[float]):
+        if kind not in ("const", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        expected = {"const": 1, "uniform": 2, "lognormal": 2}[kind]
+        if len(params) != expected:
+            raise ValueError(f"{kind} latency takes {expected} parameter(s), got {len(params)}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, *params = spec.split(":")
+        return cls(kind, [float(p) for p in params])
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.params)
+        median, sigma = self.params
+        return random.lognormvariate(0, sigma) * median
+
+    def __repr__(self) -> str:
+        return ":".join([self.kind, *(str(p) for p in self.params)])
+
+
+def _prompt_text(messages: List[Dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _has_image(messages: List[Dict]) -> bool:
+    return any(
+        isinstance(message.get("content"), list)
+        and any(part.get("type") == "image_url" for part in message["content"])
+        for message in messages
+    )
+
+
+def canned_response(messages: List[Dict]) -> str:
+    """Pick the canned completion matching the prompt of a request."""
+    prompt = _prompt_text(messages)
+    if _has_image(messages):
+        return json.dumps(ANSWER_OCR_RESPONSE if "answer from this image" in prompt else PROBLEM_OCR_RESPONSE)
+    if "math problem analyzer" in prompt:
+        return json.dumps(ANALYSIS_RESPONSE)
+    if "validating student answers" in prompt:
+        return json.dumps(VALIDATION_RESPONSE)
+    if "Analyze the student's responses" in prompt:
+        return json.dumps(RESPONSE_ANALYSIS_RESPONSE)
+    if "diagnostic questions" in prompt:
+        return json.dumps(DIAGNOSTICS_RESPONSE)
+    if "reinforcement materials" in prompt:
+        return json.dumps(REINFORCEMENT_RESPONSE)
+    if "Analyze the student's solution" in prompt:
+        return json.dumps(FEEDBACK_RESPONSE)
+    if '"steps"' in prompt:
+        return json.dumps(SCAFFOLDING_RESPONSE)
+    return json.dumps({"result": "ok"})
+
+
+def create_app(latency: Optional[LatencyDistribution] = None,
+               error_rate: float = 0.0,
+               rate_limit_rate: float = 0.0,
+               retry_after: float = 0.5) -> FastAPI:
+    """Build the fake server. Error and rate-limit rates are per-request probabilities."""
+    latency = latency or LatencyDistribution("const", [0.0])
+    app = FastAPI(title="Fake Groq API")
+    app.state.requests = 0
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(latency.sample())
+
+        roll = random.random()
+        if roll < rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": str(retry_after)}
+            )
+        if roll < rate_limit_rate + error_rate:
+            return JSONResponse(
+                {"error": {"message": "Injected server error", "type": "internal_server_error"}},
+                status_code=500
+            )
+
+        messages = body.get("messages", [])
+        content = canned_response(messages)
+        model = body.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        usage = {
+            "prompt_tokens": len(_prompt_text(messages)) // 4,
+            "completion_tokens": len(content) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            return StreamingResponse(
+                _stream_chunks(completion_id, model, content, usage), media_type="text/event-stream"
+            )
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    return app
+
+
+async def _stream_chunks(completion_id: str, model: str, content: str, usage: Dict):
+    created = int(time.time())
+    step = 32
+    for start in range(0, len(content), step):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0)
+    final = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "x_groq": {"id": completion_id, "usage": usage}
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default="lognormal:0.4:0.5",
+                        help="const:<s>, uniform:<min>:<max> or lognormal:<median>:<sigma>")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    args = parser.parse_args()
+
+    app = create_app(LatencyDistribution.parse(args.latency), args.error_rate,
+                     args.rate_limit_rate, args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Offline HTTP load test for the FastAPI app.
+
+Starts the fake Groq server and ``api/main.py`` (unless ``--api-url`` points at
+a running app), then drives each endpoint at increasing concurrency and
+reports throughput, latency percentiles and error rates.
+
+    python -m benchmarks.load_test --concurrency 1,8,32,64 --requests 200 \\
+        --latency lognormal:0.4:0.5 --rate-limit-rate 0.02 --output results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from PIL import Image, ImageDraw
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("text", "image", "combined", "validate")
+
+# Word problems go past the local solver, so every request reaches the (fake) LLM
+WORD_PROBLEMS = [
+    "Twice a number plus 5 is 15. What is the number?",
+    "A number increased by 7 is 19. Find the number.",
+    "Three times a number minus 4 equals 11. What is the number?",
+    "Half of a number plus 3 is 8. What is the number?",
+]
+ANSWERS = ["n = 5", "the number is five", "5", "I think it is 6"]
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(endpoint: str, concurrency: int, latencies: List[float], errors: int, elapsed: float,
+              fallbacks: float = 0.0) -> Dict:
+    ordered = sorted(latencies)
+    total = len(latencies)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "fallbacks": fallbacks
+    }
+
+
+def make_problem_image(text: str) -> bytes:
+    """A small PNG photo stand-in with the problem written on it."""
+    image = Image.new("RGB", (640, 160), "white")
+    ImageDraw.Draw(image).text((20, 60), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LoadTest:
+    """Drives the API endpoints and collects per-request latency and errors."""
+
+    def __init__(self, api_url: str, timeout: float = 120.0):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.sessions: List[str] = []
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.api_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def _request_factory(self, endpoint: str) -> Callable:
+        if endpoint == "text":
+            return lambda: self.client.post(
+                "/process-text-problem", params={"problem": random.choice(WORD_PROBLEMS)}
+            )
+        if endpoint == "image":
+            return lambda: self.client.post(
+                "/process-image-problem",
+                files={"file": ("problem.png", make_problem_image(random.choice(WORD_PROBLEMS)), "image/png")}
+            )
+        if endpoint == "combined":
+            return lambda: self.client.post(
+                "/process-combined-problem",
+                data={"text": "Solve the problem in the picture."},
+                files={"file": ("problem.png", make_problem_image(random.choice(WORD_PROBLEMS)), "image/png")}
+            )
+        if endpoint == "validate":
+            return lambda: self.client.post(
+                "/validate-answer",
+                data={"session_id": random.choice(self.sessions), "step_index": "0",
+                      "answer": random.choice(ANSWERS)}
+            )
+        raise ValueError(f"Unknown endpoint: {endpoint}")
+
+    async def prepare_sessions(self, count: int):
+        """Create tutoring sessions for /validate-answer to answer against."""
+        for problem in (WORD_PROBLEMS * count)[:count]:
+            response = await self.client.post("/process-text-problem", params={"problem": problem})
+            response.raise_for_status()
+            self.sessions.append(response.json()["session_id"])
+
+    async def fallback_count(self) -> float:
+        """Total of tutor_fallbacks_total from /metrics (degraded 200 responses)."""
+        try:
+            response = await self.client.get("/metrics")
+        except httpx.HTTPError:
+            return 0.0
+        if response.status_code != 200:
+            return 0.0
+        return sum(
+            float(match) for match in re.findall(r"^tutor_fallbacks_total\{[^}]*\} (\S+)$", response.text, re.M)
+        )
+
+    async def run_level(self, endpoint: str, concurrency: int, requests: int) -> Dict:
+        """Send ``requests`` calls to one endpoint with ``concurrency`` workers."""
+        send = self._request_factory(endpoint)
+        remaining = iter(range(requests))
+        latencies: List[float] = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await send()
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+        fallbacks_before = await self.fallback_count()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        fallbacks = await self.fallback_count() - fallbacks_before
+        return summarize(endpoint, concurrency, latencies, errors, elapsed, fallbacks)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def start_servers(args, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    """Start the fake Groq server and the API against it; returns the API URL."""
+    fake_port, api_port = _free_port(), _free_port()
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_groq", "--port", str(fake_port),
+         "--latency", args.latency, "--error-rate", str(args.error_rate),
+         "--rate-limit-rate", str(args.rate_limit_rate), "--retry-after", str(args.retry_after)],
+        cwd=ROOT_DIR
+    )
+    processes = [fake]
+    try:
+        _wait_until_up(f"http://127.0.0.1:{fake_port}/docs", fake)
+        env = {
+            **os.environ,
+            "GROQ_BASE_URL": f"http://127.0.0.1:{fake_port}",
+            "GROQ_API_KEY": "fake-key",
+            "SESSION_DB": "",
+            "LLM_CACHE_ENABLED": "1" if args.with_cache else "0",
+            # A zero-size perceptual-hash cache evicts every entry straight away
+            **({} if args.with_cache else {"IMAGE_HASH_CACHE_SIZE": "0"}),
+            "TRACE_FILE": os.path.join(workdir, "traces.jsonl"),
+            "LOG_LEVEL": "WARNING",
+        }
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=ROOT_DIR / "api", env=env
+        )
+        processes.append(api)
+        api_url = f"http://127.0.0.1:{api_port}"
+        _wait_until_up(api_url, api)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return api_url, processes
+
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+TABLE_HEADER = (f"{'endpoint':<10} {'conc':>5} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+                f"{'p99 ms':>9} {'errors':>7} {'fallbk':>7}")
+
+
+def format_row(r: Dict) -> str:
+    return (f"{r['endpoint']:<10} {r['concurrency']:>5} {r['requests']:>6} {r['throughput_rps']:>8} "
+            f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['error_rate']:>7.2%} "
+            f"{r['fallbacks']:>7.0f}")
+
+
+async def run(args, api_url: str) -> List[Dict]:
+    results = []
+    async with LoadTest(api_url) as load_test:
+        if "validate" in args.endpoints:
+            await load_test.prepare_sessions(args.sessions)
+        print(TABLE_HEADER)
+        print("-" * len(TABLE_HEADER))
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                result = await load_test.run_level(endpoint, concurrency, args.requests)
+                print(format_row(result), flush=True)
+                results.append(result)
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline load test for the AI Math Tutor API")
+    parser.add_argument("--api-url", help="Test an already running API instead of starting one")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda value: value.split(","), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda value: [int(c) for c in value.split(",")])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions created for /validate-answer")
+    parser.add_argument("--latency", default="lognormal:0.4:0.5",
+                        help="Fake Groq latency: const:<s>, uniform:<min>:<max> or lognormal:<median>:<sigma>")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake Groq calls that fail with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of fake Groq calls that return 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--with-cache", action="store_true", help="Leave the LLM and OCR caches enabled")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        processes = []
+        api_url = args.api_url
+        if api_url is None:
+            api_url, processes = start_servers(args, workdir)
+        try:
+            results = asyncio.run(run(args, api_url))
+        finally:
+            stop_servers(processes)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results}, f,
+                      indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
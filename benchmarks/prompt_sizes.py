@@ -0,0 +1,62 @@
+"""Static prompt size per template version.
+
+Imports every module that registers prompts and prints the estimated tokens
+in each template's fixed text, which every call pays for, next to the saving
+over that prompt's current default. Live token counts and latency per
+version are in the ``tutor_prompt_*`` metrics.
+
+    python -m benchmarks.prompt_sizes
+"""
+import argparse
+import importlib
+import json
+from typing import Dict, List, Optional, Sequence
+
+from utils.prompts import prompts
+
+PROMPT_MODULES = (
+    "modules.problem_understanding.analyzer",
+    "modules.scaffolding.engine",
+    "modules.image_processing.image_processor",
+    "modules.knowledge_assessment.diagnoser",
+    "modules.knowledge_reinforcement.reinforcer",
+    "modules.feedback.feedback_engine",
+    "utils.validation",
+)
+
+
+def prompt_sizes() -> List[Dict]:
+    for module in PROMPT_MODULES:
+        importlib.import_module(module)
+    rows = []
+    for template in prompts.templates():
+        default = prompts.get(template.name)
+        rows.append({
+            "template": template.name,
+            "version": template.version,
+            "default": template is default,
+            "fields": list(template.fields),
+            "static_tokens": template.static_tokens,
+            "saving_tokens": default.static_tokens - template.static_tokens
+        })
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Report static prompt sizes")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    rows = prompt_sizes()
+    for row in rows:
+        line = f"{row['template']:<22} v{row['version']} {row['static_tokens']:>5} static tokens"
+        print(line + ("  (default)" if row["default"] else f"  (saves {row['saving_tokens']} vs default)"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ import {
   Platform,
 } from 'react-native';
 import { SafeAreaView } from 'react-native-safe-area-context';
-import { processProblem } from '../services/api';
+import { processProblemStream } from '../services/api';
 import * as ImagePicker from 'expo-image-picker';
 import { Ionicons } from '@expo/vector-icons';
 
@@ -67,17 +67,40 @@ export default function HomeScreen({ navigation }) {
     }
 
     setLoading(true);
+    // Open the tutor on the first streamed step and add the rest as they arrive;
+    // answers can be checked once the stream ends with the session id
+    const streamedSteps = [];
+    const showSteps = (params) => navigation.navigate('Tutor', params);
     try {
-      const result = await processProblem(problemText.trim(), selectedImage);
+      const result = await processProblemStream(problemText.trim(), selectedImage, (step, index, problem) => {
+        streamedSteps.push(step);
+        showSteps({
+          sessionId: null,
+          steps: [...streamedSteps],
+          problem: problem || problemText || 'Image Problem',
+          streaming: true
+        });
+      });
       console.log('Problem processing response:', result);
 
-      if (result.success && result.steps) {
+      if (result.success && result.session_id) {
         // Extract steps from the nested structure
         const steps = result.steps.steps || [];
-        navigation.navigate('Tutor', {
+        showSteps({
+          sessionId: result.session_id,
           steps: steps,
-          problem: result.problem || problemText || 'Image Problem'
+          problem: result.problem || problemText || 'Image Problem',
+          streaming: false
         });
+      } else if (streamedSteps.length > 0) {
+        // The stream broke off after some steps; without a session they cannot be checked
+        navigation.navigate('Home');
+        Alert.alert('Error', result.error || 'Failed to process problem');
+      } else if (result.retake) {
+        Alert.alert('Please retake the photo', result.error, [
+          { text: 'Cancel', style: 'cancel' },
+          { text: 'Retake', onPress: takePhoto },
+        ]);
       } else {
         Alert.alert('Error', result.error || 'Failed to process problem');
       }
@@ -17,7 +17,8 @@ import * as ImagePicker from 'expo-image-picker';
 import { Ionicons } from '@expo/vector-icons';
 
 export default function TutorScreen({ route, navigation }) {
-  const { steps = [], problem = '' } = route.params || {};
+  // While streaming, more steps are still arriving and sessionId is not known yet
+  const { sessionId = null, steps = [], problem = '', streaming = false } = route.params || {};
   const [currentStepIndex, setCurrentStepIndex] = useState(0);
   const [completedSteps, setCompletedSteps] = useState([]);
   const [userAnswer, setUserAnswer] = useState('');
@@ -103,7 +104,7 @@ export default function TutorScreen({ route, navigation }) {
 
   // Get current step safely
   const currentStep = steps[currentStepIndex] || {};
-  const isLastStep = currentStepIndex === steps.length - 1;
+  const isLastStep = !streaming && currentStepIndex === steps.length - 1;
 
   const handleAnswerSubmit = async () => {
     if (!userAnswer.trim() && !selectedImage) {
@@ -120,7 +121,7 @@ export default function TutorScreen({ route, navigation }) {
     setLoading(true);
     try {
       console.log('Validating answer for step:', currentStep);
-      const validation = await validateAnswer(currentStep, userAnswer.trim(), selectedImage);
+      const validation = await validateAnswer(sessionId, currentStepIndex, userAnswer.trim(), selectedImage);
       console.log('Validation result:', validation);
 
       if (validation.success && validation.validation.is_correct) {
@@ -255,9 +256,9 @@ export default function TutorScreen({ route, navigation }) {
           {!problemCompleted ? (
             <>
               <Text style={styles.stepCounter}>
-                Step {currentStepIndex + 1} of {steps.length}
+                {streaming ? `Step ${currentStepIndex + 1}` : `Step ${currentStepIndex + 1} of ${steps.length}`}
               </Text>
-              <Text style={styles.instruction}>{currentStep.instruction}</Text>
+              <Text style={styles.instruction}>{currentStep.instruction || 'Preparing the next step...'}</Text>
             </>
           ) : (
             <View style={styles.completionContainer}>
@@ -327,11 +328,11 @@ export default function TutorScreen({ route, navigation }) {
                 </TouchableOpacity>
 
                 <TouchableOpacity
-                  style={[styles.button, styles.submitButton, loading && styles.submitButtonDisabled]}
+                  style={[styles.button, styles.submitButton, (loading || !sessionId) && styles.submitButtonDisabled]}
                   onPress={handleAnswerSubmit}
-                  disabled={loading}
+                  disabled={loading || !sessionId}
                 >
-                  {loading ? (
+                  {loading || !sessionId ? (
                     <ActivityIndicator color="#FFFFFF" />
                   ) : (
                     <Text style={styles.submitButtonText}>Submit Answer</Text>
@@ -59,18 +59,134 @@ export const processProblem = async (text, imageUri = null) => {
     });
     return {
       success: false,
-      error: error.response?.data?.detail || 'Failed to process problem'
+      error: error.response?.data?.detail || 'Failed to process problem',
+      // Set when the photo was rejected as too dark, blurry or empty
+      retake: Boolean(error.response?.data?.retake)
     };
   }
 };
 
-export const validateAnswer = async (stepData, answer, imageUri = null) => {
-  console.log('Validating answer:', { stepData, answer, imageUri });
+export const processWorksheet = async (imageUri) => {
+  // Returns every problem found on the photo, in reading order, for the student to pick from
+  try {
+    const uriParts = imageUri.split('.');
+    const fileType = uriParts[uriParts.length - 1];
+    const formData = new FormData();
+    formData.append('file', {
+      uri: imageUri,
+      type: `image/${fileType}`,
+      name: `worksheet.${fileType}`,
+    });
+
+    const response = await axios.post(`${API_BASE_URL}/process-worksheet-image`, formData, {
+      headers: {
+        'Accept': 'application/json',
+        'Content-Type': 'multipart/form-data',
+      },
+      transformRequest: (data) => data,
+    });
+    return response.data;
+  } catch (error) {
+    console.error('API Error in processWorksheet:', error);
+    return {
+      success: false,
+      error: error.response?.data?.detail || 'Failed to process worksheet',
+      retake: Boolean(error.response?.data?.retake)
+    };
+  }
+};
+
+export const processProblemStream = (text, imageUri = null, onStep = () => {}) => {
+  console.log('Streaming problem:', { text, imageUri });
+
+  return new Promise((resolve) => {
+    const formData = new FormData();
+
+    if (text) {
+      formData.append('text', text);
+    }
+
+    if (imageUri) {
+      const uriParts = imageUri.split('.');
+      const fileType = uriParts[uriParts.length - 1];
+
+      formData.append('file', {
+        uri: imageUri,
+        type: `image/${fileType}`,
+        name: `problem.${fileType}`,
+      });
+    }
+
+    // Steps arrive as newline-delimited JSON events while the model is still generating
+    const xhr = new XMLHttpRequest();
+    const steps = [];
+    let problem = text || '';
+    let sessionId = null;
+    let error = null;
+    let consumed = 0;
+
+    const handleEvents = () => {
+      const lines = xhr.responseText.slice(consumed).split('\n');
+      // Keep the trailing partial line for the next progress event
+      const complete = lines.slice(0, -1);
+      complete.forEach((line) => {
+        consumed += line.length + 1;
+        if (!line.trim()) {
+          return;
+        }
+        const event = JSON.parse(line);
+        if (event.type === 'problem') {
+          problem = event.problem;
+        } else if (event.type === 'step') {
+          steps.push(event.step);
+          onStep(event.step, event.index, problem);
+        } else if (event.type === 'done') {
+          sessionId = event.session_id;
+        } else if (event.type === 'error') {
+          error = event.detail;
+        }
+      });
+    };
+
+    xhr.open('POST', `${API_BASE_URL}/process-combined-problem/stream`);
+    xhr.setRequestHeader('Accept', 'application/x-ndjson');
+    xhr.onprogress = handleEvents;
+    xhr.onload = () => {
+      if (xhr.status !== 200) {
+        let detail = 'Failed to process problem';
+        let retake = false;
+        try {
+          const body = JSON.parse(xhr.responseText);
+          detail = body.detail || detail;
+          retake = Boolean(body.retake);
+        } catch (e) {}
+        resolve({ success: false, error: detail, retake });
+        return;
+      }
+      handleEvents();
+      if (error && steps.length === 0) {
+        resolve({ success: false, error });
+        return;
+      }
+      resolve({ success: true, session_id: sessionId, problem, steps: { steps } });
+    };
+    xhr.onerror = () => {
+      console.error('API Error in processProblemStream');
+      resolve({ success: false, error: 'Failed to process problem' });
+    };
+    xhr.send(formData);
+  });
+};
+
+export const validateAnswer = async (sessionId, stepIndex, answer, imageUri = null) => {
+  console.log('Validating answer:', { sessionId, stepIndex, answer, imageUri });
   
   try {
     console.log('Making POST request to /validate-answer');
+    // The server holds the steps, so only the session and step index are sent
     const formData = new FormData();
-    formData.append('step_data', JSON.stringify(stepData));
+    formData.append('session_id', sessionId);
+    formData.append('step_index', String(stepIndex));
     
     // Ensure at least one of answer or image is provided
     if (!answer && !imageUri) {
@@ -129,3 +245,46 @@ export const validateAnswer = async (stepData, answer, imageUri = null) => {
     };
   }
 };
+
+export const processProblemsBatch = async (texts = [], imageUris = [], maxConcurrency = null) => {
+  console.log('Processing problem batch:', { texts, imageUris });
+
+  try {
+    const formData = new FormData();
+    texts.forEach((text) => formData.append('texts', text));
+    imageUris.forEach((imageUri, index) => {
+      const uriParts = imageUri.split('.');
+      const fileType = uriParts[uriParts.length - 1];
+      formData.append('files', {
+        uri: imageUri,
+        type: `image/${fileType}`,
+        name: `problem_${index}.${fileType}`,
+      });
+    });
+    if (maxConcurrency) {
+      formData.append('max_concurrency', String(maxConcurrency));
+    }
+
+    const response = await axios.post(
+      `${API_BASE_URL}/process-problems-batch`,
+      formData,
+      {
+        headers: {
+          'Accept': 'application/json',
+          'Content-Type': 'multipart/form-data',
+        },
+        transformRequest: (data, headers) => {
+          return data;
+        },
+      }
+    );
+    console.log('Batch processing response:', response.data);
+    return response.data;
+  } catch (error) {
+    console.error('API Error in processProblemsBatch:', error);
+    return {
+      success: false,
+      error: error.response?.data?.detail || 'Failed to process problems'
+    };
+  }
+};
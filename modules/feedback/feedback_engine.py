@@ -1,15 +1,10 @@
-import os
 import json
-from groq import Groq
-from typing import Dict, List
+from typing import Dict, List, Optional
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.prompts import prompts
+from utils.tracing import traced
 
-class FeedbackEngine:
-    """Provides real-time feedback and corrective guidance based on student responses."""
-    
-    def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        self.feedback_prompt = """Analyze the student's solution to {problem}:
+FEEDBACK_PROMPT = prompts.register("feedback", 1, """Analyze the student's solution to {problem}:
 
 Student Work:
 {solution_attempt}
@@ -40,16 +35,27 @@ Output JSON structure:
         "immediate_practice": ["problem_ids"],
         "foundational_review": ["concept_ids"]
     }}
-}}"""
+}}""")
+
+class FeedbackEngine:
+    """Provides real-time feedback and corrective guidance based on student responses."""
+    
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()
+        
+        self.feedback_prompt = prompts.get("feedback")
 
-    def analyze_errors(self, problem: str, solution_attempt: str, correct_solution: str) -> Dict:
+    @traced("feedback.analyze_errors")
+    async def analyze_errors(self, problem: str, solution_attempt: str, correct_solution: str) -> Dict:
         """Analyze student work and generate feedback."""
         try:
-            response = self.client.chat.completions.create(
+            content = await self.llm.complete(
                 model="mixtral-8x7b-32768",
+                module="feedback",
+                template=self.feedback_prompt,
                 messages=[{
                     "role": "system",
-                    "content": self.feedback_prompt.format(
+                    "content": self.feedback_prompt.render(
                         problem=problem,
                         solution_attempt=solution_attempt,
                         correct_solution=correct_solution
@@ -57,7 +63,7 @@ Output JSON structure:
                 }],
                 response_format={"type": "json_object"}
             )
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except Exception as e:
             raise Exception(f"Feedback generation failed: {str(e)}")
 
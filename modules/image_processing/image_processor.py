@@ -1,214 +1,220 @@
-import os
+import asyncio
 import base64
-from groq import Groq
-from typing import Dict, Union
-from utils.logging_utils import image_logger as logger
+import math
+import os
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.logging_utils import image_logger as logger, log_payload
+from modules.image_processing.phash_cache import PerceptualHashCache, get_ocr_cache
+from modules.image_processing.preprocess import Box, ContentPreprocessor
+from modules.image_processing.quality import ImageQualityGate
+from utils.metrics import FALLBACKS, timed
+from utils.prompts import prompts
+from utils.tracing import traced
 import re
-from PIL import Image
+from PIL import ExifTags, Image
 import io
 import json
 from io import BytesIO
 
+# Anything the pipeline can decode: a path, raw upload bytes, a file object or a PIL image
+ImageSource = Union[str, bytes, bytearray, BinaryIO, Image.Image]
+
+# Vision calls in flight at once for the problems of one worksheet photo
+WORKSHEET_MAX_CONCURRENCY = int(os.getenv("WORKSHEET_MAX_CONCURRENCY", "4"))
+# Regions beyond this many on one photo are ignored rather than each costing a call
+WORKSHEET_MAX_PROBLEMS = int(os.getenv("WORKSHEET_MAX_PROBLEMS", "20"))
+
+# How phone cameras record a rotated or mirrored shot, and what undoes it
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+# What the vision model is asked for in each extraction mode
+PROBLEM_EXTRACTION_PROMPT = prompts.register("image_problem", 1, """You are a math problem extractor. Look at this image and extract ONLY the math problem.
+                Return your response in this EXACT JSON format:
+                {{
+                    "problem_text": "write the exact math problem here",
+                    "problem_type": "linear_equation/quadratic/word_problem/etc",
+                    "additional_context": "any additional instructions or context"
+                }}""")
+
+ANSWER_EXTRACTION_PROMPT = prompts.register("image_answer", 1, """You are a math answer extractor. Look at this image and extract ONLY the mathematical answer/work shown.
+                Return your response in this EXACT JSON format:
+                {{
+                    "answer_text": "write the exact mathematical answer/expression here",
+                    "explanation": "briefly explain the work shown",
+                    "confidence": 0.95
+                }}""")
+
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self,
+                 llm: Optional[LLMGateway] = None,
+                 ocr_cache: Optional[PerceptualHashCache] = None,
+                 preprocessor: Optional[ContentPreprocessor] = None,
+                 quality_gate: Optional[ImageQualityGate] = None):
         """Initialize the image processor."""
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.llm = llm or get_llm_gateway()
+        self.ocr_cache = ocr_cache or get_ocr_cache()
+        self.preprocessor = preprocessor or ContentPreprocessor.from_env()
+        self.quality_gate = quality_gate or ImageQualityGate.from_env()
         logger.info("ImageProcessor initialized")
-        
-        self.answer_prompt = """You are a math answer extractor. Look at this image and:
-1. Find the mathematical answer or step shown
-2. Extract it exactly as written
-3. Convert any handwritten or printed text into a clear digital format
-4. If multiple steps are shown, focus on the final answer
 
-Return a JSON response in this format:
-{
-    "problem_text": "The exact mathematical answer/step from the image",
-    "answer_type": "step|final",  # Whether this is an intermediate step or final answer
-    "confidence": 0.0-1.0  # How confident you are in the extraction
-}"""
+        self.problem_prompt = prompts.get("image_problem")
+        self.answer_prompt = prompts.get("image_answer")
 
-        self.image_prompt = """You are a math problem extractor. Look at this image and:
-1. Find any mathematical equations, expressions, or word problems
-2. Extract them exactly as written
-3. Identify the type of problem (e.g., linear equation, arithmetic, etc.)
-4. Convert any handwritten or printed text into a clear digital format
+    def _open_image(self, source: ImageSource) -> Image.Image:
+        """Open an image from a path, bytes, file object or PIL image without touching disk."""
+        if isinstance(source, Image.Image):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return Image.open(BytesIO(source))
+        return Image.open(source)
 
-Return a JSON response in this format:
-{
-    "problem_text": "The exact math problem from the image",
-    "problem_type": "The type of mathematical problem",
-    "additional_context": "Any relevant context or special instructions"
-}"""
+    def _describe_source(self, source: ImageSource) -> str:
+        """Short description of an image source for logging."""
+        if isinstance(source, str):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return f"<{len(source)} bytes>"
+        if isinstance(source, Image.Image):
+            return f"<PIL image {source.size}>"
+        return f"<{type(source).__name__}>"
 
-    def _resize_image(self, image_path: str, max_size: int = 400) -> bytes:
-        """Resize image to reduce token count while maintaining readability."""
-        with Image.open(image_path) as img:
-            # Convert to grayscale for math problems
-            img = img.convert('L')
-            
-            # Calculate new dimensions
-            ratio = min(max_size / max(img.size), 1.0)
-            new_size = tuple(int(dim * ratio) for dim in img.size)
-            
-            # Resize image
-            if ratio < 1.0:
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # Convert to bytes
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=75)
-            return buffer.getvalue()
+    def _decode_size(self, max_size: int) -> int:
+        """Longest side to decode at: cropping enlarges the writing by up to max_zoom, so keep that much."""
+        if self.preprocessor.crop:
+            return max_size * self.preprocessor.max_zoom
+        return max_size
+
+    def _decode(self, source: ImageSource, max_size: int = 400) -> Image.Image:
+        """Decode an image into a new upright grayscale copy; the caller closes it.
+        
+        JPEGs are decoded straight to grayscale at the smallest 1/2, 1/4 or 1/8
+        DCT scale that still covers the decode size, so a 48 MP upload never
+        exists at full resolution.
+        """
+        owns_image = not isinstance(source, Image.Image)
+        img = self._open_image(source)
+        try:
+            logger.debug("Original image size: %s", img.size)
+            orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+            # Only images we opened are still undecoded; a caller's image is left as it is
+            if owns_image and img.format == 'JPEG':
+                ratio = min(self._decode_size(max_size) / max(img.size), 1.0)
+                img.draft('L', (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+                logger.debug("JPEG draft size: %s", img.size)
+            # Convert to grayscale first so the resize only touches one channel
+            gray = img.convert('L')
             
-    def encode_image_to_base64(self, image_path: str) -> str:
+            if orientation in EXIF_TRANSPOSE:
+                upright = gray.transpose(EXIF_TRANSPOSE[orientation])
+                gray.close()
+                gray = upright
+            return gray
+        finally:
+            if owns_image:
+                img.close()
+
+    def _fit(self, gray: Image.Image, max_size: int = 400) -> Image.Image:
+        """Crop a grayscale image to its writing and shrink it to max_size.
+        
+        Takes ownership of gray and returns the image to send, so the 400px
+        budget goes to the math rather than the desk around it.
+        """
+        if self.preprocessor.crop or self.preprocessor.deskew:
+            with timed("image_crop"):
+                cropped = self.preprocessor.crop_to_content(gray)
+            if cropped is not gray:
+                gray.close()
+                gray = cropped
+                logger.debug("Cropped image to content: %s", gray.size)
+        
+        # Calculate new dimensions
+        ratio = min(max_size / max(gray.size), 1.0)
+        
+        # Resize image, box-reducing by an integer factor before the Lanczos pass
+        if ratio < 1.0:
+            new_size = tuple(max(1, int(dim * ratio)) for dim in gray.size)
+            resized = gray.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            gray.close()
+            gray = resized
+            logger.debug("Resized image to: %s", new_size)
+        
+        if self.preprocessor.normalize_contrast:
+            stretched = self.preprocessor.stretch_contrast(gray)
+            gray.close()
+            gray = stretched
+        return gray
+
+    def _downscale(self, source: ImageSource, max_size: int = 400) -> Image.Image:
+        """Decode an image into a new grayscale copy no larger than max_size; the caller closes it."""
+        return self._fit(self._decode(source, max_size), max_size)
+
+    def _encode_jpeg(self, image: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=75)
+        return buffer.getvalue()
+
+    def _resize_image(self, source: ImageSource, max_size: int = 400) -> bytes:
+        """Decode, grayscale, resize and JPEG-encode an image in a single in-memory pass."""
+        with self._downscale(source, max_size) as gray:
+            return self._encode_jpeg(gray)
+
+    def _prepare_image(self, source: ImageSource) -> Tuple[Optional[str], Optional[int], Dict]:
+        """Return the base64 JPEG sent to the vision model, its perceptual hash and quality check.
+        
+        An image that fails the quality check is not hashed or encoded.
+        """
+        with timed("image_decode_resize"):
+            gray = self._downscale(source)
+        with gray:
+            with timed("image_quality"):
+                quality = self.quality_gate.check(gray)
+            if not quality["passed"]:
+                return None, None, quality
+            with timed("image_hash"):
+                image_hash = self.ocr_cache.hash_image(gray)
+            with timed("image_encode"):
+                return base64.b64encode(self._encode_jpeg(gray)).decode('utf-8'), image_hash, quality
+
+    def _prepare_segments(self, source: ImageSource, max_size: int = 400) -> Tuple[List[Tuple[Box, str]], Dict]:
+        """Split a worksheet photo into problems: (box, base64 JPEG) each, plus the page's quality check.
+        
+        The page is decoded once; every problem is cropped from it and fitted
+        to max_size on its own, so each vision call sees one small problem.
+        """
+        with timed("image_decode_resize"):
+            page = self._decode(source, max_size)
+        with page:
+            with timed("image_quality"), self._fit(page.copy(), max_size) as whole:
+                quality = self.quality_gate.check(whole)
+            if not quality["passed"]:
+                return [], quality
+            with timed("image_segment"):
+                boxes = self.preprocessor.segment(page)[:WORKSHEET_MAX_PROBLEMS]
+            segments = []
+            for box in boxes:
+                with self._fit(page.crop(box), max_size) as problem:
+                    segments.append((box, base64.b64encode(self._encode_jpeg(problem)).decode('utf-8')))
+            return segments, quality
+
+    def encode_image_to_base64(self, source: ImageSource) -> str:
         """Convert image to base64 string."""
         try:
             # Resize image first
-            image_data = self._resize_image(image_path)
+            image_data = self._resize_image(source)
             return base64.b64encode(image_data).decode('utf-8')
         except Exception as e:
-            logger.error(f"Error encoding image: {str(e)}")
+            logger.error("Error encoding image: %s", e)
             raise
 
-    def _extract_content(self, image_path: str, mode: str = "problem") -> Dict:
-        """Extract content from image using Groq's vision model."""
-        try:
-            # Read image as base64
-            image_base64 = self.encode_image_to_base64(image_path)
-            
-            # Create message with proper image format
-            user_message = {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": """Extract the math problem from this image and return in JSON format:
-                        {
-                            "problem_text": "exact math problem",
-                            "problem_type": "type",
-                            "additional_context": "details"
-                        }"""
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-            
-            # Make API call
-            response = self.client.chat.completions.create(
-                model="llama-3.2-90b-vision-preview",
-                messages=[user_message],
-                temperature=0.1,
-                max_tokens=200
-            )
-            
-            # Extract and parse JSON from response
-            result = response.choices[0].message.content.strip()
-            logger.debug(f"Raw vision model response: {result}")
-            
-            # Try to find JSON in the response
-            try:
-                start = result.find('{')
-                end = result.rfind('}') + 1
-                if start >= 0 and end > start:
-                    json_str = result[start:end]
-                    return json.loads(json_str)
-                else:
-                    raise ValueError("No JSON found in response")
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Could not parse JSON from response: {result}")
-                # Return default structure based on mode
-                if mode == "problem":
-                    return {
-                        "problem_text": self._extract_problem_text(result),
-                        "problem_type": "Unknown",
-                        "additional_context": "Error processing image"
-                    }
-                else:
-                    return {
-                        "answer_text": self._extract_answer_text(result),
-                        "detail_level": "Unknown",
-                        "work_shown": "Error processing image"
-                    }
-                    
-        except Exception as e:
-            logger.error(f"Error in _extract_content: {str(e)}", exc_info=True)
-            if mode == "problem":
-                return {
-                    "problem_text": "",
-                    "problem_type": "Unknown",
-                    "additional_context": f"Error: {str(e)}"
-                }
-            else:
-                return {
-                    "answer_text": "",
-                    "detail_level": "Unknown",
-                    "work_shown": f"Error: {str(e)}"
-                }
-
-    def _extract_problem_text(self, text: str) -> str:
-        """Extract problem text from non-JSON response."""
-        try:
-            # Look for common patterns
-            patterns = [
-                r"problem in the image is:\s*\n*\s*([^\n]+)",
-                r"math problem is:\s*\n*\s*([^\n]+)",
-                r"equation is:\s*\n*\s*([^\n]+)",
-                r"problem text[:\s]+([^\n]+)",
-                r"math problem[:\s]+([^\n]+)",
-                r"equation[:\s]+([^\n]+)",
-                r"problem[:\s]+([^\n]+)"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    problem = match.group(1).strip()
-                    if any(c in problem for c in '=+-*/()'):
-                        return problem
-                    
-            # If no pattern matches, try to find equation-like text
-            lines = text.split('\n')
-            for line in lines:
-                line = line.strip()
-                if any(c in line for c in '=+-*/()'):
-                    return line
-                    
-            return ""
-        except Exception as e:
-            logger.error(f"Error extracting problem text: {str(e)}")
-            return ""
-            
-    def _extract_answer_text(self, text: str) -> str:
-        """Extract answer text from non-JSON response."""
-        try:
-            # Look for common patterns
-            patterns = [
-                r"answer[:\s]+([^\n]+)",
-                r"solution[:\s]+([^\n]+)",
-                r"result[:\s]+([^\n]+)"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, text.lower())
-                if match:
-                    return match.group(1).strip()
-                    
-            # If no pattern matches, try to find equation-like text
-            lines = text.split('\n')
-            for line in lines:
-                if any(c in line for c in '=+-*/()'):
-                    return line.strip()
-                    
-            return ""
-        except Exception as e:
-            logger.error(f"Error extracting answer text: {str(e)}")
-            return ""
-
     def _clean_markdown(self, text: str) -> str:
         """Clean markdown formatting from text."""
         # Remove markdown headers
@@ -236,53 +242,93 @@ Return a JSON response in this format:
         
         return text
 
-    def process_image(self, image_path: str, mode: str = "problem") -> Dict:
-        """Process an image and extract text/math content."""
-        logger.info(f"Processing image: {image_path} in {mode} mode")
+    @traced("image_processing.process_image")
+    async def process_image(self, image: ImageSource, mode: str = "problem") -> Dict:
+        """Process an image and extract text/math content.
+        
+        Accepts a file path, raw bytes, a file object or a PIL image. The image is
+        decoded, converted and encoded once in memory, off the event loop.
+        """
+        logger.info("Processing image: %s in %s mode", self._describe_source(image), mode)
         
         try:
-            # Open and resize image
-            image = Image.open(image_path)
-            logger.info(f"Original image size: {image.size}")
-            
-            # Resize if needed
-            if image.size[0] > 400 or image.size[1] > 400:
-                ratio = min(400/image.size[0], 400/image.size[1])
-                new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-                logger.info(f"Resized image to: {new_size}")
-            
-            # Convert to grayscale
-            image = image.convert('L')
-            
-            # Save as JPEG with reduced quality
-            buffered = BytesIO()
-            image.save(buffered, format="JPEG", quality=75)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            img_str, image_hash, quality = await asyncio.to_thread(self._prepare_image, image)
+            if not quality["passed"]:
+                # Fail fast: the vision model would not read this photo either
+                logger.info("Image rejected by quality gate: %s %s", quality["issue"], quality["scores"])
+                return {"error": quality["message"], "quality": quality}
             logger.info("Image converted and encoded")
             
-            # Prepare prompt based on mode
-            if mode == "problem":
-                prompt = """You are a math problem extractor. Look at this image and extract ONLY the math problem.
-                Return your response in this EXACT JSON format:
-                {
-                    "problem_text": "write the exact math problem here",
-                    "problem_type": "linear_equation/quadratic/word_problem/etc",
-                    "additional_context": "any additional instructions or context"
-                }"""
-            else:
-                prompt = """You are a math answer extractor. Look at this image and extract ONLY the mathematical answer/work shown.
-                Return your response in this EXACT JSON format:
-                {
-                    "answer_text": "write the exact mathematical answer/expression here",
-                    "explanation": "briefly explain the work shown",
-                    "confidence": 0.95
-                }"""
+            # Answers are never served from the perceptual cache: a retake that fixes
+            # one digit is a near-duplicate photo, but must be graded on its own
+            return await self._extract(img_str, image_hash if mode == "problem" else None, mode)
                 
-            logger.info(f"Using prompt: {prompt}")
-            
-            # Call Groq API
-            response = self.client.chat.completions.create(
+        except Exception as e:
+            logger.error("Image processing error: %s", e)
+            FALLBACKS.inc(module="image_extraction", reason="error")
+            return {"error": str(e)}
+
+    @traced("image_processing.process_worksheet")
+    async def process_worksheet(self, image: ImageSource, max_concurrency: Optional[int] = None) -> Dict:
+        """Split a photo of several problems into one crop per problem and extract them concurrently.
+        
+        Returns ``{"problems": [...]}`` in reading order (columns left to right,
+        top to bottom within a column). Each problem carries its ``index`` and
+        pixel ``box`` on the upright page; crops the model could not read are
+        left out. A page that fails the quality gate returns ``error`` and
+        ``quality`` like process_image.
+        """
+        logger.info("Processing worksheet: %s", self._describe_source(image))
+        
+        try:
+            segments, quality = await asyncio.to_thread(self._prepare_segments, image)
+        except Exception as e:
+            logger.error("Worksheet processing error: %s", e)
+            FALLBACKS.inc(module="image_extraction", reason="error")
+            return {"error": str(e)}
+        if not quality["passed"]:
+            logger.info("Worksheet rejected by quality gate: %s %s", quality["issue"], quality["scores"])
+            return {"error": quality["message"], "quality": quality}
+        logger.info("Worksheet split into %d problems", len(segments))
+        
+        semaphore = asyncio.Semaphore(max_concurrency or WORKSHEET_MAX_CONCURRENCY)
+        
+        async def extract(box: Box, img_str: str) -> Dict:
+            async with semaphore:
+                try:
+                    # One-line crops of a worksheet look alike to a perceptual hash, so skip that cache
+                    return {"box": list(box), **await self._extract(img_str, None, "problem")}
+                except Exception as e:
+                    logger.error("Worksheet problem extraction error: %s", e)
+                    FALLBACKS.inc(module="image_extraction", reason="error")
+                    return {"box": list(box), "error": str(e)}
+        
+        results = await asyncio.gather(*(extract(*segment) for segment in segments))
+        problems = [result for result in results if result.get("problem_text")]
+        for index, problem in enumerate(problems):
+            problem["index"] = index
+        return {"problems": problems, "segments": len(segments)}
+
+    async def _extract(self, img_str: str, image_hash: Optional[int], mode: str) -> Dict:
+        """Read the problem or answer in an encoded image with the vision model.
+        
+        With an image_hash, near-identical photos (e.g. the same worksheet)
+        reuse an earlier extraction from the perceptual hash cache.
+        """
+        if image_hash is not None:
+            cached = self.ocr_cache.get(mode, image_hash)
+            if cached is not None:
+                logger.info("Perceptual hash cache hit for %s image", mode)
+                return cached
+
+        # Prepare prompt based on mode
+        template = self.problem_prompt if mode == "problem" else self.answer_prompt
+        prompt = template.render()
+        log_payload(logger, "Using prompt", prompt)
+
+        # Call Groq API
+        with timed("vision_call"):
+            result = await self.llm.complete(
                 model="llama-3.2-90b-vision-preview",
                 messages=[
                     {
@@ -299,23 +345,25 @@ Return a JSON response in this format:
                     }
                 ],
                 temperature=0.1,
-                max_tokens=200
+                max_tokens=200,
+                cache_namespace="image_extraction",
+                template=template
             )
-            
-            result = response.choices[0].message.content
-            logger.info(f"Raw API response: {result}")
-            
+
+        log_payload(logger, "Raw API response", result)
+
+        with timed("vision_json_extract"):
             # Extract JSON from response
             try:
                 # Try to find JSON in the response
                 start = result.find('{')
                 end = result.rfind('}') + 1
-                
+
                 if start >= 0 and end > start:
                     json_str = result[start:end]
-                    logger.info(f"Extracted JSON string: {json_str}")
+                    log_payload(logger, "Extracted JSON string", json_str)
                     data = json.loads(json_str)
-                    
+
                     if mode == "problem":
                         problem_text = self._clean_markdown(data.get("problem_text", ""))
                         extracted = {
@@ -330,7 +378,10 @@ Return a JSON response in this format:
                             "explanation": data.get("explanation", ""),
                             "confidence": data.get("confidence", 0.0)
                         }
-                    logger.info(f"Extracted content: {extracted}")
+                    logger.info("Extracted content: %s", extracted)
+                    text_key = "problem_text" if mode == "problem" else "answer_text"
+                    if extracted[text_key] and image_hash is not None:
+                        self.ocr_cache.put(mode, image_hash, extracted)
                     return extracted
                 else:
                     # If no JSON found, try to extract problem directly
@@ -347,32 +398,11 @@ Return a JSON response in this format:
                             "explanation": "",
                             "confidence": 0.5
                         }
-                    logger.info(f"Extracted content (no JSON): {extracted}")
+                    logger.info("Extracted content (no JSON): %s", extracted)
                     return extracted
-                    
+
             except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON: {e}")
-                logger.error(f"Invalid JSON string: {json_str}")
+                logger.error("Failed to parse JSON: %s", e)
+                log_payload(logger, "Invalid JSON string", json_str, error=True)
+                FALLBACKS.inc(module="image_extraction", reason="unparseable")
                 return {"error": "Failed to parse response"}
-                
-        except Exception as e:
-            logger.error(f"Image processing error: {str(e)}")
-            return {"error": str(e)}
-            
-    def _get_problem_prompt(self) -> str:
-        """Get prompt for problem extraction."""
-        return """Extract the math problem from this image. Respond in JSON format:
-        {
-            "problem_text": "The complete math problem as written",
-            "problem_type": "The type of math problem (e.g. linear_equation, quadratic, word_problem, etc)",
-            "additional_context": "Any additional context or instructions shown"
-        }"""
-        
-    def _get_answer_prompt(self) -> str:
-        """Get prompt for answer extraction."""
-        return """Extract the mathematical answer from this image. Respond in JSON format:
-        {
-            "answer_text": "The complete mathematical answer/expression",
-            "explanation": "Brief explanation of the work shown",
-            "confidence": 0.95
-        }"""
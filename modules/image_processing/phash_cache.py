@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+# Grey levels a pixel must exceed its neighbour by to set a hash bit. Blank
+# paper is nearly flat, and without a margin JPEG noise flips its bits at random.
+DHASH_MARGIN = 4
+
+
+def dhash(image: "Image.Image", hash_size: int = 16, margin: int = DHASH_MARGIN) -> int:
+    """Difference hash of a grayscale image.
+
+    The image is shrunk to (hash_size + 1) x hash_size and each bit records
+    whether a pixel is brighter than its right-hand neighbour by more than
+    ``margin``, so small changes in exposure, compression or framing flip
+    only a few bits.
+    """
+    from PIL import Image
+
+    with image.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR) as small:
+        pixels = small.tobytes()
+    bits = 0
+    row_width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * row_width
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1] + margin)
+    return bits
+
+
+class PerceptualHashCache:
+    """LRU index of vision extraction results keyed by perceptual image hash.
+
+    A lookup matches any stored image of the same mode whose hash lies within
+    ``max_distance`` bits (Hamming distance), so photos of the same worksheet
+    that differ only in bytes reuse one vision call. Keep the distance small:
+    two different problems written in the same layout differ by only a few
+    cells of the hash grid (a changed digit is typically 4-12 bits), while a
+    recompressed copy of the same photo is usually within 1-3.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_distance: int = 2, hash_size: int = 16):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._entries: Dict[str, "OrderedDict[int, Dict]"] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PerceptualHashCache":
+        return cls(
+            max_entries=int(os.getenv("IMAGE_HASH_CACHE_SIZE", "2048")),
+            max_distance=int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "2"))
+        )
+
+    def hash_image(self, image: "Image.Image") -> int:
+        return dhash(image, self.hash_size)
+
+    def _count(self, mode: str, counter: str):
+        counters = self._stats.setdefault(mode, {"hits": 0, "misses": 0, "evictions": 0})
+        counters[counter] += 1
+
+    def get(self, mode: str, image_hash: int) -> Optional[Dict]:
+        """Return a copy of the closest cached result within max_distance, if any."""
+        with self._lock:
+            entries = self._entries.get(mode)
+            best_hash, best_distance = None, self.max_distance + 1
+            if entries:
+                for stored_hash in entries:
+                    distance = bin(stored_hash ^ image_hash).count("1")
+                    if distance < best_distance:
+                        best_hash, best_distance = stored_hash, distance
+                        if distance == 0:
+                            break
+            if best_hash is None:
+                self._count(mode, "misses")
+                return None
+            entries.move_to_end(best_hash)
+            self._count(mode, "hits")
+            return dict(entries[best_hash])
+
+    def put(self, mode: str, image_hash: int, result: Dict):
+        """Store an extraction result, evicting the least recently used entry when full."""
+        with self._lock:
+            entries = self._entries.setdefault(mode, OrderedDict())
+            entries[image_hash] = dict(result)
+            entries.move_to_end(image_hash)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self._count(mode, "evictions")
+
+    def stats(self) -> Dict:
+        """Hit, miss and eviction counters plus hit rate per mode."""
+        with self._lock:
+            stats = {}
+            for mode, counters in self._stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                stats[mode] = {
+                    **counters,
+                    "entries": len(self._entries.get(mode, ())),
+                    "hit_rate": counters["hits"] / lookups if lookups else 0.0
+                }
+            return stats
+
+
+_ocr_cache: Optional[PerceptualHashCache] = None
+
+
+def get_ocr_cache() -> PerceptualHashCache:
+    """Return the process-wide perceptual hash cache, creating it if needed."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = PerceptualHashCache.from_env()
+    return _ocr_cache
@@ -0,0 +1,254 @@
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# (left, top, right, bottom) in pixels, right/bottom exclusive, as used by Image.crop
+Box = Tuple[int, int, int, int]
+
+
+def otsu_threshold(pixels: np.ndarray) -> Tuple[int, float]:
+    """Otsu's threshold for a uint8 array and the gap between the two class means."""
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight_low = np.cumsum(hist)
+    weight_high = weight_low[-1] - weight_low
+    mass_low = np.cumsum(hist * levels)
+    mean_low = mass_low / np.maximum(weight_low, 1)
+    mean_high = (mass_low[-1] - mass_low) / np.maximum(weight_high, 1)
+    between = weight_low * weight_high * (mean_high - mean_low) ** 2
+    threshold = int(np.argmax(between))
+    return threshold, float(mean_high[threshold] - mean_low[threshold])
+
+
+def _runs(active: np.ndarray, max_gap: int) -> List[Tuple[int, int]]:
+    """Half-open [start, end) runs of True, merging runs separated by at most max_gap."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    runs: List[Tuple[int, int]] = []
+    for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+        if runs and start - runs[-1][1] <= max_gap:
+            runs[-1] = (runs[-1][0], end)
+        else:
+            runs.append((start, end))
+    return runs
+
+
+class ContentPreprocessor:
+    """Crops phone photos to the handwriting before they are downscaled.
+
+    Ink is separated from paper with an Otsu threshold, then row and column
+    projections of the ink mask give one bounding box per band of writing.
+    Ruled lines and paper texture fall on the light side of a second split
+    inside the dark pixels, and specks carry too little ink to form a band.
+    The photo is cropped to the union of the bands plus a margin, so the
+    equation, not the desk around it, fills the pixels sent to the vision
+    model. Deskew and contrast stretching are optional extras.
+    All analysis runs with NumPy on a copy no larger than ``analysis_size``.
+    """
+
+    def __init__(self,
+                 crop: bool = True,
+                 deskew: bool = False,
+                 normalize_contrast: bool = False,
+                 analysis_size: int = 800,
+                 min_contrast: float = 40.0,
+                 max_line_fill: float = 0.6,
+                 min_band_ink: float = 0.02,
+                 margin: float = 0.04,
+                 max_skew_degrees: float = 8.0,
+                 max_zoom: int = 4,
+                 problem_gap: float = 1.5,
+                 column_gap: float = 0.08):
+        self.crop = crop
+        self.deskew = deskew
+        self.normalize_contrast = normalize_contrast
+        self.analysis_size = analysis_size
+        # Below this gap between ink and paper means the photo is blank or too flat to segment
+        self.min_contrast = min_contrast
+        # Rows or columns inked across more than this fraction are borders or shadows
+        self.max_line_fill = max_line_fill
+        # Bands holding less than this share of the ink are specks and smudges
+        self.min_band_ink = min_band_ink
+        self.margin = margin
+        self.max_skew_degrees = max_skew_degrees
+        # Writing filling less than 1/max_zoom of the frame gains nothing more from cropping,
+        # so the decoder only needs to keep max_zoom times the output resolution
+        self.max_zoom = max_zoom
+        # Worksheet segmentation: a vertical gap taller than problem_gap lines starts a new
+        # problem, and a blank strip wider than column_gap of the page starts a new column
+        self.problem_gap = problem_gap
+        self.column_gap = column_gap
+
+    @classmethod
+    def from_env(cls) -> "ContentPreprocessor":
+        return cls(
+            crop=os.getenv("IMAGE_ROI_CROP", "1") != "0",
+            deskew=os.getenv("IMAGE_DESKEW", "0") == "1",
+            normalize_contrast=os.getenv("IMAGE_NORMALIZE_CONTRAST", "0") == "1"
+        )
+
+    def _analysis_pixels(self, gray: Image.Image) -> Tuple[np.ndarray, float]:
+        """Pixels of a reduced copy for analysis and the factor mapping them back to full size."""
+        factor = max(1, math.ceil(max(gray.size) / self.analysis_size))
+        if factor == 1:
+            return np.asarray(gray), 1.0
+        with gray.reduce(factor) as small:
+            return np.asarray(small), gray.width / small.width
+
+    def ink_mask(self, pixels: np.ndarray) -> Optional[np.ndarray]:
+        """Boolean mask of ink pixels, or None if the image has no clear ink/paper split."""
+        threshold, contrast = otsu_threshold(pixels)
+        if contrast < self.min_contrast:
+            return None
+        dark = pixels <= threshold
+        # Ink is the minority; light writing on a dark board is inverted
+        if np.count_nonzero(dark) > dark.size // 2:
+            pixels = 255 - pixels
+            dark = pixels <= 255 - threshold - 1
+        # Ruled lines and paper texture are only a little darker than the paper, so a
+        # second split inside the dark class keeps the stroke cores and drops them
+        core_threshold, _ = otsu_threshold(pixels[dark])
+        ink = pixels <= core_threshold
+        # Drop borders and shadows that run across the whole frame
+        ink &= (ink.mean(axis=1) <= self.max_line_fill)[:, None]
+        ink &= (ink.mean(axis=0) <= self.max_line_fill)[None, :]
+        return ink
+
+    def content_boxes(self, ink: np.ndarray) -> List[Box]:
+        """Bounding box of each horizontal band of writing in an ink mask."""
+        total = np.count_nonzero(ink)
+        if not total:
+            return []
+        height, width = ink.shape
+        rows = ink.sum(axis=1)
+        boxes = []
+        for top, bottom in _runs(rows > 0, max_gap=max(1, height // 100)):
+            if rows[top:bottom].sum() < self.min_band_ink * total:
+                continue
+            cols = ink[top:bottom].sum(axis=0)
+            col_runs = [
+                (left, right) for left, right in _runs(cols > 0, max_gap=max(2, width // 20))
+                if cols[left:right].sum() >= self.min_band_ink * total
+            ]
+            if col_runs:
+                boxes.append((col_runs[0][0], top, col_runs[-1][1], bottom))
+        return boxes
+
+    def problem_boxes(self, ink: np.ndarray) -> List[Box]:
+        """Bounding box of each separate problem in an ink mask, in reading order.
+
+        The page is split into columns at vertical strips of whitespace, then
+        each column's bands of writing are grouped into problems wherever the
+        gap between two bands is taller than ``problem_gap`` lines of text.
+        """
+        total = np.count_nonzero(ink)
+        if not total:
+            return []
+        width = ink.shape[1]
+        cols = ink.sum(axis=0)
+        columns = [
+            (left, right) for left, right in _runs(cols > 0, max_gap=max(2, int(width * self.column_gap)))
+            if cols[left:right].sum() >= self.min_band_ink * total
+        ]
+        boxes = []
+        for column_left, column_right in columns:
+            bands = self.content_boxes(ink[:, column_left:column_right])
+            if not bands:
+                continue
+            line_height = float(np.median([bottom - top for _, top, _, bottom in bands]))
+            groups = [[bands[0]]]
+            for band in bands[1:]:
+                if band[1] - groups[-1][-1][3] > self.problem_gap * line_height:
+                    groups.append([band])
+                else:
+                    groups[-1].append(band)
+            for group in groups:
+                boxes.append((
+                    column_left + min(b[0] for b in group), group[0][1],
+                    column_left + max(b[2] for b in group), group[-1][3]
+                ))
+        return boxes
+
+    def _scale_box(self, box: Box, pad: float, scale: float, size: Tuple[int, int]) -> Box:
+        """Map a box from analysis pixels to the full image, padded and clipped to it."""
+        left, top, right, bottom = box
+        return (
+            max(0, int((left - pad) * scale)),
+            max(0, int((top - pad) * scale)),
+            min(size[0], math.ceil((right + pad) * scale)),
+            min(size[1], math.ceil((bottom + pad) * scale))
+        )
+
+    def find_content_box(self, gray: Image.Image) -> Optional[Box]:
+        """Full-resolution box around all writing in a grayscale image, margin included."""
+        pixels, scale = self._analysis_pixels(gray)
+        ink = self.ink_mask(pixels)
+        boxes = self.content_boxes(ink) if ink is not None else []
+        if not boxes:
+            return None
+        left, top = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        right, bottom = max(b[2] for b in boxes), max(b[3] for b in boxes)
+        pad = self.margin * max(right - left, bottom - top)
+        return self._scale_box((left, top, right, bottom), pad, scale, gray.size)
+
+    def segment(self, gray: Image.Image) -> List[Box]:
+        """Full-resolution boxes of the separate problems on a page, in reading order."""
+        pixels, scale = self._analysis_pixels(gray)
+        ink = self.ink_mask(pixels)
+        boxes = self.problem_boxes(ink) if ink is not None else []
+        # A margin of a fraction of the shortest box, so padded neighbours do not overlap much
+        pad = self.margin * 4 * min((bottom - top for _, top, _, bottom in boxes), default=0)
+        return [self._scale_box(box, pad, scale, gray.size) for box in boxes]
+
+    def estimate_skew(self, gray: Image.Image, steps: int = 33, max_points: int = 20000) -> float:
+        """Angle in degrees that straightens the text lines, 0.0 if there is no clear answer.
+
+        Every candidate angle shears the ink coordinates at once and the one
+        whose row histogram is sharpest (text lines collapse into few rows) wins.
+        """
+        pixels, _ = self._analysis_pixels(gray)
+        ink = self.ink_mask(pixels)
+        if ink is None:
+            return 0.0
+        ys, xs = np.nonzero(ink)
+        if len(ys) < 50:
+            return 0.0
+        if len(ys) > max_points:
+            pick = np.linspace(0, len(ys) - 1, max_points).astype(np.intp)
+            ys, xs = ys[pick], xs[pick]
+        angles = np.radians(np.linspace(-self.max_skew_degrees, self.max_skew_degrees, steps))
+        sheared = np.rint(ys[None, :] - xs[None, :] * np.tan(angles)[:, None]).astype(np.int64)
+        sheared -= sheared.min()
+        bins = int(sheared.max()) + 1
+        flat = sheared + np.arange(steps)[:, None] * bins
+        hist = np.bincount(flat.ravel(), minlength=steps * bins).reshape(steps, bins)
+        sharpness = (hist.astype(np.float64) ** 2).sum(axis=1)
+        return float(np.degrees(angles[int(np.argmax(sharpness))]))
+
+    def stretch_contrast(self, gray: Image.Image, low: float = 1.0, high: float = 99.0) -> Image.Image:
+        """Map the low..high percentile range onto 0..255; returns a new image."""
+        lo, hi = np.percentile(np.asarray(gray), (low, high))
+        if hi - lo < 8:
+            return gray.copy()
+        lut = np.clip((np.arange(256) - lo) * 255.0 / (hi - lo), 0, 255).astype(np.uint8)
+        return gray.point(lut.tolist())
+
+    def crop_to_content(self, gray: Image.Image) -> Image.Image:
+        """Deskew and crop a grayscale image into a new image, or return it as is if neither applies."""
+        image = gray
+        if self.deskew:
+            angle = self.estimate_skew(image)
+            if abs(angle) >= 0.5:
+                fill = int(np.median(np.asarray(image)))
+                image = image.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=fill)
+        if self.crop:
+            box = self.find_content_box(image)
+            # Not worth a copy when the writing already fills the frame
+            if box is not None and (box[2] - box[0]) * (box[3] - box[1]) < 0.9 * image.width * image.height:
+                cropped = image.crop(box)
+                if image is not gray:
+                    image.close()
+                image = cropped
+        return image
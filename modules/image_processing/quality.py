@@ -0,0 +1,96 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from modules.image_processing.preprocess import otsu_threshold
+
+# What the student is told for each failed check, phrased so the app can prompt a retake
+QUALITY_MESSAGES = {
+    "too_dark": "The photo is too dark to read. Add more light or turn on the flash and retake it.",
+    "low_contrast": "The writing is too faint to read, or missing. Use darker ink or better light and retake the photo.",
+    "no_writing": "No writing was found in the photo. Make sure the problem is in the frame and retake it.",
+    "not_writing": "This doesn't look like handwriting or print. Photograph just the problem and retake it.",
+    "blurry": "The photo is blurry. Hold the phone steady, tap the problem to focus and retake it."
+}
+
+
+class ImageQualityGate:
+    """Rejects photos the vision model could not read, before paying for the call.
+
+    Runs on the downscaled grayscale image that would be sent, so it costs
+    about a millisecond. Scores:
+
+    - ``brightness``: mean pixel value.
+    - ``contrast``: gap between the ink and paper means of an Otsu split.
+    - ``ink_coverage``: share of pixels on the ink side of that split.
+    - ``blur_score``: variance of the 4-neighbour Laplacian divided by the
+      pixel variance, so faint pencil and dark ink score alike. Sharp
+      writing scores above 1, a shake or focus miss well below 0.5.
+    """
+
+    def __init__(self,
+                 enabled: bool = True,
+                 min_brightness: float = 50.0,
+                 min_contrast: float = 25.0,
+                 min_ink: float = 0.002,
+                 max_ink: float = 0.35,
+                 min_blur_score: float = 0.5):
+        self.enabled = enabled
+        self.min_brightness = min_brightness
+        self.min_contrast = min_contrast
+        self.min_ink = min_ink
+        self.max_ink = max_ink
+        self.min_blur_score = min_blur_score
+
+    @classmethod
+    def from_env(cls) -> "ImageQualityGate":
+        return cls(
+            enabled=os.getenv("IMAGE_QUALITY_GATE", "1") != "0",
+            min_brightness=float(os.getenv("IMAGE_MIN_BRIGHTNESS", "50")),
+            min_contrast=float(os.getenv("IMAGE_MIN_CONTRAST", "25")),
+            min_ink=float(os.getenv("IMAGE_MIN_INK", "0.002")),
+            max_ink=float(os.getenv("IMAGE_MAX_INK", "0.35")),
+            min_blur_score=float(os.getenv("IMAGE_MIN_BLUR_SCORE", "0.5"))
+        )
+
+    def scores(self, gray: Image.Image) -> Dict[str, float]:
+        pixels = np.asarray(gray)
+        values = pixels.astype(np.float32)
+        threshold, contrast = otsu_threshold(pixels)
+        ink = np.count_nonzero(pixels <= threshold) / pixels.size
+        # Ink is the minority class, whichever side of the split it is on
+        ink = min(ink, 1.0 - ink)
+        laplacian = (4 * values[1:-1, 1:-1] - values[:-2, 1:-1] - values[2:, 1:-1]
+                     - values[1:-1, :-2] - values[1:-1, 2:])
+        variance = float(values.var())
+        return {
+            "brightness": round(float(values.mean()), 1),
+            "contrast": round(contrast, 1),
+            "ink_coverage": round(float(ink), 4),
+            "blur_score": round(float(laplacian.var()) / variance, 3) if variance else 0.0
+        }
+
+    def _issue(self, scores: Dict[str, float]) -> Optional[str]:
+        if scores["brightness"] < self.min_brightness:
+            return "too_dark"
+        if scores["contrast"] < self.min_contrast:
+            return "low_contrast"
+        if scores["ink_coverage"] < self.min_ink:
+            return "no_writing"
+        if scores["ink_coverage"] > self.max_ink:
+            return "not_writing"
+        if scores["blur_score"] < self.min_blur_score:
+            return "blurry"
+        return None
+
+    def check(self, gray: Image.Image) -> Dict:
+        """Score an image; ``passed`` is False with an ``issue`` code and ``message`` if it is unreadable."""
+        if not self.enabled:
+            return {"passed": True, "scores": {}}
+        scores = self.scores(gray)
+        issue = self._issue(scores)
+        if issue is None:
+            return {"passed": True, "scores": scores}
+        return {"passed": False, "issue": issue, "message": QUALITY_MESSAGES[issue], "scores": scores}
@@ -1,17 +1,11 @@
-from groq import Groq
-import os
 import json
-from typing import Dict, List
-from dotenv import load_dotenv
+from typing import Dict, List, Optional
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.prompts import prompts
+from utils.tracing import traced
 
-class KnowledgeAssessor:
-    def __init__(self):
-        """Initialize the Knowledge Assessor with Groq client and system prompts."""
-        load_dotenv()
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        # System prompt for generating diagnostic questions
-        self.diagnostic_prompt = """Generate diagnostic questions to assess the student's understanding of {concept}.
+# System prompt for generating diagnostic questions
+DIAGNOSTIC_PROMPT = prompts.register("diagnostic_questions", 1, """Generate diagnostic questions to assess the student's understanding of {concept}.
 Focus on fundamental concepts and common misconceptions.
 
 Output a JSON with this structure:
@@ -27,10 +21,10 @@ Output a JSON with this structure:
     ],
     "recommended_topics": ["list of topics to review based on concept"],
     "prerequisites": ["list of prerequisite concepts"]
-}}"""
-        
-        # System prompt for analyzing student responses
-        self.analysis_prompt = """
+}}""")
+
+# System prompt for analyzing student responses
+RESPONSE_ANALYSIS_PROMPT = prompts.register("response_analysis", 1, """
         Analyze the student's responses to diagnostic questions and identify:
         1. Knowledge gaps
         2. Misconceptions
@@ -38,26 +32,37 @@ Output a JSON with this structure:
         4. Recommended next steps
         
         Output a JSON with your analysis.
-        """
+        """)
+
+class KnowledgeAssessor:
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        """Initialize the Knowledge Assessor with the shared LLM gateway and system prompts."""
+        self.llm = llm or get_llm_gateway()
+        self.diagnostic_prompt = prompts.get("diagnostic_questions")
+        self.analysis_prompt = prompts.get("response_analysis")
 
-    def generate_diagnostics(self, concept: str) -> Dict:
+    @traced("knowledge_assessment.generate_diagnostics")
+    async def generate_diagnostics(self, concept: str) -> Dict:
         """Generate diagnostic questions for a given concept."""
         try:
-            response = self.client.chat.completions.create(
+            content = await self.llm.complete(
                 model="mixtral-8x7b-32768",
+                module="knowledge_assessment",
+                template=self.diagnostic_prompt,
                 messages=[
                     {
                         "role": "system",
-                        "content": self.diagnostic_prompt.format(concept=concept)
+                        "content": self.diagnostic_prompt.render(concept=concept)
                     }
                 ],
                 response_format={"type": "json_object"}
             )
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except Exception as e:
             raise Exception(f"Failed to generate diagnostics: {str(e)}")
 
-    def analyze_responses(self, 
+    @traced("knowledge_assessment.analyze_responses")
+    async def analyze_responses(self, 
                         concept: str,
                         questions: List[Dict],
                         user_responses: List[int]) -> Dict:
@@ -87,12 +92,14 @@ Output a JSON with this structure:
         }
         
         try:
-            response = self.client.chat.completions.create(
+            content = await self.llm.complete(
                 model="mixtral-8x7b-32768",
+                module="knowledge_assessment",
+                template=self.analysis_prompt,
                 messages=[
                     {
                         "role": "system",
-                        "content": self.analysis_prompt
+                        "content": self.analysis_prompt.render()
                     },
                     {
                         "role": "user",
@@ -101,6 +108,6 @@ Output a JSON with this structure:
                 ],
                 response_format={"type": "json_object"}
             )
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except Exception as e:
             raise Exception(f"Failed to analyze responses: {str(e)}")
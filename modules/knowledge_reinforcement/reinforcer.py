@@ -1,16 +1,11 @@
-import os
 import json
 from datetime import datetime, timedelta
-from groq import Groq
-from typing import Dict, List
+from typing import Dict, List, Optional
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.prompts import prompts
+from utils.tracing import traced
 
-class KnowledgeReinforcer:
-    """Manages spaced repetition and adaptive practice for long-term retention."""
-    
-    def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        self.reinforcement_prompt = """Create reinforcement materials for {concept} considering:
+REINFORCEMENT_PROMPT = prompts.register("reinforcement", 1, """Create reinforcement materials for {concept} considering:
 - Previous mistakes: {mistakes}
 - Retention score: {retention_score}/100
 - Days since last practice: {days_since_last}
@@ -37,9 +32,18 @@ Output JSON structure:
         "prerequisites": ["list"],
         "real_world": ["examples"]
     }}
-}}"""
+}}""")
+
+class KnowledgeReinforcer:
+    """Manages spaced repetition and adaptive practice for long-term retention."""
+    
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()
+        
+        self.reinforcement_prompt = prompts.get("reinforcement")
 
-    def generate_reinforcement(self,
+    @traced("knowledge_reinforcement.generate")
+    async def generate_reinforcement(self,
                              concept: str,
                              mistakes: List[str],
                              retention_score: float) -> Dict:
@@ -47,11 +51,13 @@ Output JSON structure:
         try:
             days_since_last = self._calculate_days_since_last_review(concept)
             
-            response = self.client.chat.completions.create(
+            content = await self.llm.complete(
                 model="mixtral-8x7b-32768",
+                module="knowledge_reinforcement",
+                template=self.reinforcement_prompt,
                 messages=[{
                     "role": "system",
-                    "content": self.reinforcement_prompt.format(
+                    "content": self.reinforcement_prompt.render(
                         concept=concept,
                         mistakes=", ".join(mistakes),
                         retention_score=retention_score,
@@ -60,7 +66,7 @@ Output JSON structure:
                 }],
                 response_format={"type": "json_object"}
             )
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
         except Exception as e:
             raise Exception(f"Reinforcement generation failed: {str(e)}")
 
@@ -1,51 +1,74 @@
-from groq import Groq
-import os
-from dotenv import load_dotenv
 import json
-from typing import Dict
+from typing import Dict, Optional
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.logging_utils import log_payload, validation_logger as logger
+from utils.single_flight import SingleFlight, normalize_problem_text
+from utils.metrics import FALLBACKS
+from utils.model_router import estimate_difficulty
+from utils.prompts import prompts
+from utils.tracing import traced
 
-class ProblemAnalyzer:
-    def __init__(self):
-        load_dotenv()
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.system_prompt = """You are a math problem analyzer. Return a valid JSON object analyzing this problem:
+ANALYSIS_PROMPT = prompts.register("problem_analysis", 1, """You are a math problem analyzer. Return a valid JSON object analyzing this problem:
 
 PROBLEM: {problem}
 
 Return ONLY a JSON object in this exact format:
-{
+{{
     "problem_type": "linear_equation",
     "key_concepts": ["equation_solving"],
     "complexity": "basic",
     "key_entities": ["x", "+"],
     "related_concepts": ["arithmetic"]
-}
+}}
 
 Rules:
 1. problem_type must be one of: linear_equation, quadratic_equation, system_of_equations
 2. complexity must be one of: basic, intermediate, advanced
 3. All arrays must have at least one item
-4. Return ONLY the JSON object, no other text"""
+4. Return ONLY the JSON object, no other text""")
+
+REQUIRED_KEYS = ('problem_type', 'key_concepts', 'complexity', 'key_entities', 'related_concepts')
+
+class ProblemAnalyzer:
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()
+        self._single_flight = SingleFlight()
+        self.system_prompt = prompts.get("problem_analysis")
 
-    def analyze_problem(self, problem_text: str) -> Dict:
-        """Analyze math problems with strict JSON validation."""
+    @traced("problem_analysis.analyze")
+    async def analyze_problem(self, problem_text: str) -> Dict:
+        """Analyze math problems with strict JSON validation.
+        
+        Concurrent requests for the same normalized problem share one LLM call.
+        """
+        return await self._single_flight.run(
+            normalize_problem_text(problem_text),
+            lambda: self._analyze_problem(problem_text)
+        )
+
+    async def _analyze_problem(self, problem_text: str) -> Dict:
         try:
-            response = self.client.chat.completions.create(
+            raw_content = await self.llm.complete(
                 model="mixtral-8x7b-32768",
                 messages=[{
                     "role": "system",
-                    "content": self.system_prompt.format(problem=problem_text)
+                    "content": self.system_prompt.render(problem=problem_text)
                 }],
                 response_format={"type": "json_object"},
-                temperature=0
+                temperature=0,
+                cache_namespace="problem_analysis",
+                template=self.system_prompt,
+                difficulty=estimate_difficulty(problem_text),
+                accept=self._is_complete
             )
-            
-            raw_content = response.choices[0].message.content.strip()
+            raw_content = raw_content.strip()
+            log_payload(logger, "Raw problem analysis response", raw_content)
             
             try:
                 analysis = json.loads(raw_content)
             except json.JSONDecodeError:
-                print(f"Debug - Invalid JSON: {raw_content}")
+                log_payload(logger, "Invalid JSON in problem analysis response", raw_content, error=True)
+                FALLBACKS.inc(module="problem_analysis", reason="unparseable")
                 return {
                     "problem_type": "linear_equation",
                     "key_concepts": ["equation_solving"],
@@ -55,9 +78,11 @@ Rules:
                 }
             
             # Validate structure
-            required_keys = ['problem_type', 'key_concepts', 'complexity', 'key_entities', 'related_concepts']
-            if not all(key in analysis for key in required_keys):
-                print(f"Debug - Missing keys in: {analysis}")
+            if not all(key in analysis for key in REQUIRED_KEYS):
+                logger.debug("Problem analysis is missing keys: %s",
+                             [key for key in REQUIRED_KEYS if key not in analysis])
+                log_payload(logger, "Incomplete problem analysis response", raw_content)
+                FALLBACKS.inc(module="problem_analysis", reason="unparseable")
                 return {
                     "problem_type": "linear_equation",
                     "key_concepts": ["equation_solving"],
@@ -78,7 +103,8 @@ Rules:
             return analysis
             
         except Exception as e:
-            print(f"Debug - Unexpected error: {str(e)}")
+            logger.error("Error analyzing problem: %s", e, exc_info=True)
+            FALLBACKS.inc(module="problem_analysis", reason="error")
             return {
                 "problem_type": "linear_equation",
                 "key_concepts": ["equation_solving"],
@@ -86,3 +112,12 @@ Rules:
                 "key_entities": ["x"],
                 "related_concepts": ["arithmetic"]
             }
+
+    @staticmethod
+    def _is_complete(raw_content: str) -> bool:
+        """Whether a response is a JSON analysis with every required key."""
+        try:
+            analysis = json.loads(raw_content)
+        except json.JSONDecodeError:
+            return False
+        return isinstance(analysis, dict) and all(key in analysis for key in REQUIRED_KEYS)
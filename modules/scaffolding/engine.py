@@ -1,17 +1,18 @@
-import os
 import json
-from groq import Groq
-from typing import Dict, List
-from utils.logging_utils import validation_logger as logger
+from typing import AsyncIterator, Dict, List, Optional
+from modules.scaffolding.local_solver import LocalSolver
+from modules.scaffolding.models import REQUIRED_STEP_FIELDS, Scaffolding, Step
+from modules.scaffolding.stream_parser import StepStreamParser
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from utils.llm_scheduler import RateLimitExceeded
+from utils.single_flight import SingleFlight, normalize_problem_text
+from utils.logging_utils import log_payload, validation_logger as logger
+from utils.metrics import FALLBACKS
+from utils.model_router import DIFFICULTY_LEVELS, estimate_difficulty
+from utils.prompts import prompts
+from utils.tracing import span, traced
 
-class ScaffoldingEngine:
-    """Generates adaptive learning paths based on problem understanding and knowledge assessment."""
-    
-    def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        logger.info("ScaffoldingEngine initialized")
-        
-        self.scaffolding_prompt = """Create a step-by-step solution guide for this math problem.
+SCAFFOLDING_PROMPT = prompts.register("scaffolding", 1, """Create a step-by-step solution guide for this math problem.
 
 PROBLEM:
 {problem_text}
@@ -42,20 +43,54 @@ IMPORTANT:
 5. Return ONLY the JSON object without any markdown formatting or explanatory text
 
 Example format (but create steps for the GIVEN problem):
-{
+{{
     "steps": [
-        {
+        {{
             "instruction": "Move all x terms to the left side by subtracting 4x from both sides. You should get: -2x + 6 = -2",
             "expected_answer": "-2x + 6 = -2|-2x+6=-2|6-2x=-2",
             "hint": "When moving terms, remember to change their signs",
             "explanation": "Grouping like terms (terms with x) on one side makes it easier to solve for x"
-        }
+        }}
     ]
-}"""
+}}
+
+Respond with ONLY a valid JSON object containing the steps. Do not include any markdown formatting or explanatory text.""")
+
+# Compacted: the fixed instructions come first and the problem last, so every call
+# shares the longest possible prefix; about half the static tokens of v1
+prompts.register("scaffolding", 2, """Write a step-by-step solution guide for the math problem below.
+
+Each step has:
+- instruction: what to do and what the result should look like
+- expected_answer: the result of the step, alternate forms separated by |
+- hint: guides without giving the answer away
+- explanation: why the step helps solve the problem
+
+Mind the signs (+ and -) when moving terms, double-check the arithmetic, make each step follow from the previous one and check the final answer by substituting it back.
 
-    def generate_solution_steps(self, problem: str) -> List[Dict]:
+Respond with ONLY a JSON object, no markdown or other text, like:
+{{"steps": [{{"instruction": "Subtract 4x from both sides. You should get: -2x + 6 = -2", "expected_answer": "-2x + 6 = -2|-2x+6=-2|6-2x=-2", "hint": "Moving a term changes its sign", "explanation": "Grouping the x terms makes x easier to isolate"}}]}}
+
+Type: {concept}
+Analysis: {problem_analysis}
+Student level: {knowledge_assessment}
+Problem: {problem_text}""")
+
+class ScaffoldingEngine:
+    """Generates adaptive learning paths based on problem understanding and knowledge assessment."""
+    
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        self.llm = llm or get_llm_gateway()
+        self._single_flight = SingleFlight()
+        self.local_solver = LocalSolver()
+        logger.info("ScaffoldingEngine initialized")
+
+        self.scaffolding_prompt = prompts.get("scaffolding")
+
+    @traced("scaffolding.solution_steps")
+    async def generate_solution_steps(self, problem: str) -> List[Step]:
         """Generate solution steps for a problem."""
-        logger.info(f"Generating solution steps for: {problem}")
+        logger.info("Generating solution steps for: %s", problem)
         
         try:
             # Create a basic analysis for the problem
@@ -66,175 +101,258 @@ Example format (but create steps for the GIVEN problem):
             }
             
             # Generate scaffolding
-            scaffolding = self.generate_scaffolding(
+            scaffolding = await self.generate_scaffolding(
                 concept=analysis["problem_type"],
                 problem_analysis=json.dumps(analysis),
                 knowledge_assessment=json.dumps({"knowledge_gaps": []}),
                 problem_text=problem
             )
             
-            if isinstance(scaffolding, dict) and "steps" in scaffolding:
-                logger.info(f"Generated {len(scaffolding['steps'])} solution steps")
-                return scaffolding["steps"]
+            if len(scaffolding):
+                logger.info("Generated %s solution steps", len(scaffolding))
+                return list(scaffolding)
             else:
-                logger.error(f"Invalid scaffolding format: {scaffolding}")
+                logger.error("Invalid scaffolding format: %s", scaffolding)
                 # Return default steps if something goes wrong
                 return [
-                    {
-                        "instruction": "First, let's understand what we're solving for.",
-                        "expected_answer": problem,
-                        "hint": "Read the problem carefully and identify the variable.",
-                        "explanation": "Understanding the problem is the first step to solving it."
-                    }
+                    Step(
+                        instruction="First, let's understand what we're solving for.",
+                        expected_answer=problem,
+                        hint="Read the problem carefully and identify the variable.",
+                        explanation="Understanding the problem is the first step to solving it."
+                    )
                 ]
                 
         except Exception as e:
-            logger.error(f"Error generating solution steps: {str(e)}", exc_info=True)
+            logger.error("Error generating solution steps: %s", e, exc_info=True)
             # Return a simple error step
             return [
-                {
-                    "instruction": "There was an error generating steps. Let's try a simpler approach.",
-                    "expected_answer": problem,
-                    "hint": "Start by writing out what you know.",
-                    "explanation": "Sometimes breaking down a problem helps us solve it."
-                }
+                Step(
+                    instruction="There was an error generating steps. Let's try a simpler approach.",
+                    expected_answer=problem,
+                    hint="Start by writing out what you know.",
+                    explanation="Sometimes breaking down a problem helps us solve it."
+                )
             ]
 
-    def generate_scaffolding(self, 
+    @traced("scaffolding.generate")
+    async def generate_scaffolding(self, 
                            concept: str,
                            problem_analysis: str,
                            knowledge_assessment: str,
-                           problem_text: str) -> Dict:
-        """Generate scaffolding steps for the given problem."""
-        logger.debug(f"Generating scaffolding for concept: {concept}")
-        try:
-            prompt = f"""Create a step-by-step solution guide for this math problem.
-
-PROBLEM:
-{problem_text}
-
-CONTEXT:
-Type: {concept}
-Analysis: {problem_analysis}
-Student Level: {knowledge_assessment}
-
-Create steps that:
-1. Are clear and specific about what needs to be done
-2. Include the expected result of each step
-3. Provide helpful hints for common mistakes
-4. Give clear explanations of the mathematical concepts
-5. Pay careful attention to signs (+ and -) in equations
-
-For each step, provide:
-- instruction: Clear, specific instruction about what to do AND what the result should look like
-- expected_answer: The answer for this specific step (include alternate forms if applicable)
-- hint: A helpful hint that guides without giving away the answer
-- explanation: Why this step is important and how it helps solve the problem
-
-IMPORTANT:
-1. Pay careful attention to signs (+ and -) when moving terms
-2. Double-check all arithmetic
-3. Make sure each step follows logically from the previous one
-4. Verify that the final answer is correct by substituting it back into the original equation
-5. Return ONLY the JSON object without any markdown formatting or explanatory text
-
-Example format (but create steps for the GIVEN problem):
-{{
-    "steps": [
-        {{
-            "instruction": "Move all x terms to the left side by subtracting 4x from both sides. You should get: -2x + 6 = -2",
-            "expected_answer": "-2x + 6 = -2|-2x+6=-2|6-2x=-2",
-            "hint": "When moving terms, remember to change their signs",
-            "explanation": "Grouping like terms (terms with x) on one side makes it easier to solve for x"
-        }}
-    ]
-}}
+                           problem_text: str) -> Scaffolding:
+        """Generate scaffolding steps for the given problem.
+        
+        Linear, quadratic and 2x2 system problems are solved locally; the LLM
+        is only used for word problems and anything the solver cannot parse.
+        Concurrent requests for the same normalized problem and context share
+        a single in-flight LLM call.
+        """
+        local = self._solve_locally(problem_text)
+        if local is not None:
+            return local
+        key = (concept, problem_analysis, knowledge_assessment, normalize_problem_text(problem_text))
+        return await self._single_flight.run(
+            key,
+            lambda: self._generate_scaffolding(concept, problem_analysis, knowledge_assessment, problem_text)
+        )
 
-Respond with ONLY a valid JSON object containing the steps. Do not include any markdown formatting or explanatory text."""
+    async def _generate_scaffolding(self,
+                                    concept: str,
+                                    problem_analysis: str,
+                                    knowledge_assessment: str,
+                                    problem_text: str) -> Scaffolding:
+        logger.debug("Generating scaffolding for concept: %s", concept)
+        try:
+            prompt = self.scaffolding_prompt.render(
+                concept=concept,
+                problem_analysis=problem_analysis,
+                knowledge_assessment=knowledge_assessment,
+                problem_text=problem_text
+            )
             
-            response = self.client.chat.completions.create(
+            result = await self.llm.complete(
                 model="llama3-70b-8192",
                 messages=[{
                     "role": "system",
                     "content": prompt
                 }],
                 temperature=0.1,
-                max_tokens=1000
+                max_tokens=1000,
+                cache_namespace="scaffolding",
+                template=self.scaffolding_prompt,
+                difficulty=self._difficulty(problem_analysis, problem_text),
+                accept=self._is_cacheable
             )
             
-            result = response.choices[0].message.content.strip()
-            logger.debug(f"Raw scaffolding response: {result}")
-            
-            # Remove any markdown code blocks and find JSON
-            result = result.replace('```json', '').replace('```', '').strip()
+            log_payload(logger, "Raw scaffolding response", result)
             
             try:
-                # First try direct JSON parsing
-                try:
-                    data = json.loads(result)
-                except json.JSONDecodeError:
-                    # If that fails, try to extract JSON from the response
-                    start = result.find('{')
-                    end = result.rfind('}') + 1
-                    if start >= 0 and end > start:
-                        json_str = result[start:end]
-                        data = json.loads(json_str)
-                    else:
-                        raise ValueError("No JSON found in response")
-                
-                # Validate steps
-                if "steps" in data:
-                    for step in data["steps"]:
-                        # Ensure all required fields are present
-                        required_fields = ["instruction", "expected_answer", "hint", "explanation"]
-                        if not all(field in step for field in required_fields):
-                            raise ValueError("Missing required fields in step")
-                            
-                        # Validate that the step makes mathematical sense
-                        if "=" in step["expected_answer"]:
-                            parts = step["expected_answer"].split("=")
-                            if len(parts) < 2:  
-                                raise ValueError("Invalid equation format")
-                                
-                    logger.info(f"Generated valid scaffolding with {len(data['steps'])} steps")
-                    return data
-                    
-                else:
-                    raise ValueError("No steps found in response")
-                    
+                data = self._parse_scaffolding(result)
+                logger.info("Generated valid scaffolding with %s steps", len(data))
+                return data
             except Exception as e:
-                logger.error(f"Invalid JSON in scaffolding response: {result}")
+                log_payload(logger, "Invalid JSON in scaffolding response", result, error=True)
                 
             # If we get here, return default steps
-            return {
-                "steps": [
-                    {
-                        "instruction": "Let's solve this step by step.",
-                        "expected_answer": problem_text,
-                        "hint": "Start by identifying what we're solving for.",
-                        "explanation": "Breaking down the problem helps us solve it."
-                    },
-                    {
-                        "instruction": "Now, let's solve the equation.",
-                        "expected_answer": problem_text,
-                        "hint": "Follow the order of operations (PEMDAS).",
-                        "explanation": "Solving equations requires following mathematical rules."
-                    }
-                ]
-            }
+            FALLBACKS.inc(module="scaffolding", reason="unparseable")
+            return self._fallback_scaffolding(problem_text)
                 
         except Exception as e:
-            logger.error(f"Error in generate_scaffolding: {str(e)}", exc_info=True)
-            return {
-                "steps": [
-                    {
-                        "instruction": "Let's solve this step by step.",
-                        "expected_answer": problem_text,
-                        "hint": "Start by identifying what we're solving for.",
-                        "explanation": "Breaking down the problem helps us solve it."
-                    }
-                ]
-            }
+            logger.error("Error in generate_scaffolding: %s", e, exc_info=True)
+            FALLBACKS.inc(module="scaffolding", reason="rate_limited" if isinstance(e, RateLimitExceeded) else "error")
+            return Scaffolding([
+                Step(
+                    instruction="Let's solve this step by step.",
+                    expected_answer=problem_text,
+                    hint="Start by identifying what we're solving for.",
+                    explanation="Breaking down the problem helps us solve it."
+                )
+            ])
+
+    def _solve_locally(self, problem_text: str) -> Optional[Scaffolding]:
+        """Scaffolding from the exact local solver, or None if it cannot handle the problem."""
+        with span("scaffolding.local_solve") as solve_span:
+            try:
+                data = self.local_solver.solve(problem_text)
+            except Exception as e:
+                logger.error("Local solver failed: %s", e, exc_info=True)
+                return None
+            if solve_span is not None:
+                solve_span.set_attribute("solved", data is not None)
+        if data is not None:
+            logger.info("Solved locally with %s steps", len(data['steps']))
+            return Scaffolding.from_dict(data)
+        return None
+
+    def _parse_scaffolding(self, result: str) -> Scaffolding:
+        """Parse and validate a raw scaffolding response, raising ValueError if unusable."""
+        # Remove any markdown code blocks and find JSON
+        result = result.strip().replace('```json', '').replace('```', '').strip()
+        
+        # First try direct JSON parsing
+        try:
+            data = json.loads(result)
+        except json.JSONDecodeError:
+            # If that fails, try to extract JSON from the response
+            start = result.find('{')
+            end = result.rfind('}') + 1
+            if start >= 0 and end > start:
+                json_str = result[start:end]
+                data = json.loads(json_str)
+            else:
+                raise ValueError("No JSON found in response")
+        
+        # Validate steps
+        if "steps" not in data:
+            raise ValueError("No steps found in response")
+        for step in data["steps"]:
+            self._validate_step(step)
+        return Scaffolding.from_dict(data)
+
+    @staticmethod
+    def _difficulty(problem_analysis: str, problem_text: str) -> str:
+        """The analyzer's complexity rating if the analysis has one, else a guess from the problem text."""
+        try:
+            complexity = json.loads(problem_analysis).get("complexity")
+        except (ValueError, AttributeError):
+            complexity = None
+        return complexity if complexity in DIFFICULTY_LEVELS else estimate_difficulty(problem_text)
+
+    def _is_cacheable(self, result: str) -> bool:
+        """Only cache responses that parse into valid scaffolding."""
+        try:
+            self._parse_scaffolding(result)
+            return True
+        except Exception:
+            return False
+
+    def _validate_step(self, step: Dict):
+        """Raise ValueError if a generated step is incomplete or malformed."""
+        # Ensure all required fields are present
+        if not all(field in step for field in REQUIRED_STEP_FIELDS):
+            raise ValueError("Missing required fields in step")
+            
+        # Validate that the step makes mathematical sense
+        if "=" in step["expected_answer"]:
+            parts = step["expected_answer"].split("=")
+            if len(parts) < 2:  
+                raise ValueError("Invalid equation format")
+
+    def _fallback_scaffolding(self, problem_text: str) -> Scaffolding:
+        """Default steps used when the model output cannot be parsed."""
+        return Scaffolding([
+            Step(
+                instruction="Let's solve this step by step.",
+                expected_answer=problem_text,
+                hint="Start by identifying what we're solving for.",
+                explanation="Breaking down the problem helps us solve it."
+            ),
+            Step(
+                instruction="Now, let's solve the equation.",
+                expected_answer=problem_text,
+                hint="Follow the order of operations (PEMDAS).",
+                explanation="Solving equations requires following mathematical rules."
+            )
+        ])
+
+    async def stream_scaffolding(self,
+                                 concept: str,
+                                 problem_analysis: str,
+                                 knowledge_assessment: str,
+                                 problem_text: str) -> AsyncIterator[Step]:
+        """Stream scaffolding steps, yielding each one as soon as the model completes it."""
+        logger.debug("Streaming scaffolding for concept: %s", concept)
+        local = self._solve_locally(problem_text)
+        if local is not None:
+            for step in local:
+                yield step
+            return
+
+        prompt = self.scaffolding_prompt.render(
+            concept=concept,
+            problem_analysis=problem_analysis,
+            knowledge_assessment=knowledge_assessment,
+            problem_text=problem_text
+        )
+        parser = StepStreamParser()
+        emitted = 0
+        reason = "unparseable"
+        
+        try:
+            async for chunk in self.llm.stream(
+                model="llama3-70b-8192",
+                messages=[{
+                    "role": "system",
+                    "content": prompt
+                }],
+                temperature=0.1,
+                max_tokens=1000,
+                cache_namespace="scaffolding",
+                cache_check=self._is_cacheable,
+                template=self.scaffolding_prompt,
+                difficulty=self._difficulty(problem_analysis, problem_text)
+            ):
+                for step in parser.feed(chunk):
+                    try:
+                        self._validate_step(step)
+                    except ValueError as e:
+                        logger.error("Skipping invalid streamed step: %s", e)
+                        continue
+                    emitted += 1
+                    yield Step.from_dict(step)
+        except Exception as e:
+            logger.error("Error in stream_scaffolding: %s", e, exc_info=True)
+            if isinstance(e, RateLimitExceeded):
+                reason = "rate_limited"
+            
+        if emitted == 0:
+            log_payload(logger, "No valid steps in streamed scaffolding response", parser.buffer, error=True)
+            FALLBACKS.inc(module="scaffolding", reason=reason)
+            for step in self._fallback_scaffolding(problem_text):
+                yield step
+        else:
+            logger.info("Streamed %s scaffolding steps", emitted)
 
     def adapt_path(self, progress_data: Dict) -> Dict:
         """Adjust learning path based on student progress."""
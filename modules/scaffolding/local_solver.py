@@ -0,0 +1,524 @@
+import math
+import re
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+from utils.math_equivalence import Node, ParseError, parse
+
+# A polynomial maps monomials, e.g. (('x', 2),) for x^2 or () for the constant, to exact coefficients
+Monomial = Tuple[Tuple[str, int], ...]
+Polynomial = Dict[Monomial, Fraction]
+
+MAX_EXPONENT = 4
+# The only prose a locally solved problem may have ("Solve the system of equations:").
+# Anything else ("If ..., find 4x + 1", "Verify that ...") asks for more than the
+# solution, so it is left to the LLM.
+INSTRUCTION_WORDS = frozenset({
+    "solve", "find", "the", "following", "equation", "equations", "system", "of",
+    "simultaneous", "linear", "quadratic", "value", "values"
+})
+
+SEGMENT_SEPARATORS = re.compile(r"\n|;|,|\band\b", re.IGNORECASE)
+MATH_WORD = re.compile(r"[0-9a-zA-Z+\-*/^().=²³√−×÷·]+")
+LETTER_RUN = re.compile(r"[a-zA-Z]{2,}")
+# "for x", "find x", "value of x", but not "find x + 1"
+SOLVE_FOR_VARIABLE = re.compile(r"\b(?:for|find|of)\s+[a-zA-Z]\b(?!\s*[-+*/^(=\w])", re.IGNORECASE)
+
+
+class NotPolynomial(ValueError):
+    pass
+
+
+def _poly_add(a: Polynomial, b: Polynomial, sign: int = 1) -> Polynomial:
+    result = dict(a)
+    for monomial, coeff in b.items():
+        result[monomial] = result.get(monomial, Fraction(0)) + sign * coeff
+    return {m: c for m, c in result.items() if c != 0}
+
+
+def _poly_mul(a: Polynomial, b: Polynomial) -> Polynomial:
+    result: Polynomial = {}
+    for ma, ca in a.items():
+        for mb, cb in b.items():
+            powers = dict(ma)
+            for var, power in mb:
+                powers[var] = powers.get(var, 0) + power
+            monomial = tuple(sorted(powers.items()))
+            result[monomial] = result.get(monomial, Fraction(0)) + ca * cb
+    return {m: c for m, c in result.items() if c != 0}
+
+
+def _constant(poly: Polynomial) -> Optional[Fraction]:
+    if not poly:
+        return Fraction(0)
+    if list(poly) == [()]:
+        return poly[()]
+    return None
+
+
+def _split_sqrt(value: Fraction) -> Tuple[Fraction, int]:
+    """Write sqrt(value) as coefficient * sqrt(radicand) with a square-free integer radicand."""
+    # sqrt(p/q) = sqrt(p*q)/q
+    remaining = value.numerator * value.denominator
+    coefficient, factor = 1, 2
+    while factor * factor <= remaining:
+        while remaining % (factor * factor) == 0:
+            coefficient *= factor
+            remaining //= factor * factor
+        factor += 1
+    return Fraction(coefficient, value.denominator), remaining
+
+
+def _exact_sqrt(value: Fraction) -> Optional[Fraction]:
+    if value < 0:
+        return None
+    num, den = math.isqrt(value.numerator), math.isqrt(value.denominator)
+    if num * num == value.numerator and den * den == value.denominator:
+        return Fraction(num, den)
+    return None
+
+
+def to_polynomial(node: Node) -> Polynomial:
+    """Expand a parsed expression into a polynomial with exact coefficients."""
+    kind = node[0]
+    if kind == "num":
+        value = Fraction(repr(node[1]))
+        return {(): value} if value else {}
+    if kind == "var":
+        return {((node[1], 1),): Fraction(1)}
+    if kind == "neg":
+        return {m: -c for m, c in to_polynomial(node[1]).items()}
+    if kind in ("add", "sub"):
+        return _poly_add(to_polynomial(node[1]), to_polynomial(node[2]), 1 if kind == "add" else -1)
+    if kind == "mul":
+        return _poly_mul(to_polynomial(node[1]), to_polynomial(node[2]))
+    if kind == "div":
+        divisor = _constant(to_polynomial(node[2]))
+        if not divisor:
+            raise NotPolynomial("Division by a variable or by zero")
+        return {m: c / divisor for m, c in to_polynomial(node[1]).items()}
+    if kind == "pow":
+        exponent = _constant(to_polynomial(node[2]))
+        if exponent is None or exponent.denominator != 1 or not 0 <= exponent <= MAX_EXPONENT:
+            raise NotPolynomial("Unsupported exponent")
+        base = to_polynomial(node[1])
+        result: Polynomial = {(): Fraction(1)}
+        for _ in range(int(exponent)):
+            result = _poly_mul(result, base)
+        return result
+    if kind == "func":
+        root = _exact_sqrt(_constant(to_polynomial(node[2])) or Fraction(-1))
+        if root is None:
+            raise NotPolynomial("Irrational or symbolic square root")
+        return {(): root} if root else {}
+    raise NotPolynomial(f"Unsupported node {kind}")
+
+
+def _degree(poly: Polynomial) -> int:
+    return max((sum(p for _, p in monomial) for monomial in poly), default=0)
+
+
+def _needs_simplifying(node: Node) -> bool:
+    """True when a side has brackets, fractions or like terms a student must combine first."""
+    terms = []
+
+    def collect(n: Node):
+        if n[0] in ("add", "sub"):
+            collect(n[1])
+            collect(n[2])
+        else:
+            terms.append(n[1] if n[0] == "neg" else n)
+
+    collect(node)
+    seen = set()
+    for term in terms:
+        try:
+            monomials = tuple(to_polynomial(term))
+        except NotPolynomial:
+            return True
+        if len(monomials) > 1 or (monomials and monomials[0] in seen):
+            return True
+        seen.update(monomials)
+        if term[0] in ("div", "func") or (term[0] == "pow" and term[1][0] != "var"):
+            return True
+    return False
+
+
+def format_number(value: Fraction) -> str:
+    return str(value.numerator) if value.denominator == 1 else f"{value.numerator}/{value.denominator}"
+
+
+def format_polynomial(poly: Polynomial, order: List[str]) -> str:
+    """Format a polynomial in descending degree, e.g. 'x^2 - 5x + 6'."""
+    if not poly:
+        return "0"
+
+    def sort_key(monomial: Monomial):
+        powers = dict(monomial)
+        return (-sum(powers.values()), [-powers.get(var, 0) for var in order])
+
+    parts = []
+    for monomial in sorted(poly, key=sort_key):
+        coeff = poly[monomial]
+        sign = "-" if coeff < 0 else "+"
+        magnitude = abs(coeff)
+        variables = "".join(var if power == 1 else f"{var}^{power}" for var, power in monomial)
+        if not variables:
+            body = format_number(magnitude)
+        elif magnitude == 1:
+            body = variables
+        elif magnitude.denominator == 1:
+            body = f"{magnitude.numerator}{variables}"
+        else:
+            body = f"({format_number(magnitude)}){variables}"
+        parts.append((sign, body))
+
+    first_sign, first_body = parts[0]
+    text = ("-" if first_sign == "-" else "") + first_body
+    for sign, body in parts[1:]:
+        text += f" {sign} {body}"
+    return text
+
+
+def format_surd(rational: Fraction, coefficient: Fraction, radicand: int) -> str:
+    """Format rational + coefficient * sqrt(radicand), e.g. '-1 + sqrt(2)' or '3sqrt(5)/2'."""
+    magnitude = abs(coefficient)
+    surd = f"{'' if magnitude.numerator == 1 else magnitude.numerator}sqrt({radicand})"
+    if magnitude.denominator != 1:
+        surd += f"/{magnitude.denominator}"
+    if rational == 0:
+        return surd if coefficient > 0 else f"-{surd}"
+    return f"{format_number(rational)} {'+' if coefficient > 0 else '-'} {surd}"
+
+
+def _factor(var: str, root: Fraction, power: int) -> str:
+    base = var if root == 0 else f"({format_polynomial({((var, 1),): Fraction(1), (): -root}, [var])})"
+    return base if power == 1 else f"{base}^{power}"
+
+
+def _equation(left: Polynomial, right: Polynomial, order: List[str]) -> str:
+    return f"{format_polynomial(left, order)} = {format_polynomial(right, order)}"
+
+
+def _alternates(*forms: str) -> str:
+    """Join answer forms with '|' for the validator, adding space-free variants."""
+    seen = []
+    for form in forms:
+        for variant in (form, form.replace(" ", "")):
+            if variant not in seen:
+                seen.append(variant)
+    return "|".join(seen)
+
+
+def _step(instruction: str, expected_answer: str, hint: str, explanation: str) -> Dict:
+    return {
+        "instruction": instruction,
+        "expected_answer": expected_answer,
+        "hint": hint,
+        "explanation": explanation
+    }
+
+
+def extract_equations(problem_text: str) -> Optional[List[Tuple[Node, str]]]:
+    """Pull the equations out of a short problem statement; None for word problems."""
+    if "?" in problem_text:
+        return None
+    text = SOLVE_FOR_VARIABLE.sub(" ", problem_text)
+    equations = []
+    for segment in SEGMENT_SEPARATORS.split(text):
+        words = segment.replace(":", " ").split()
+        # Keep the longest run of words that look like maths
+        best: List[str] = []
+        run: List[str] = []
+        for word in words + [""]:
+            if word and MATH_WORD.fullmatch(word) and not LETTER_RUN.search(word.replace("sqrt", "")):
+                run.append(word)
+                continue
+            if len(run) > len(best):
+                best = run
+            run = []
+            if word and word.strip(".").lower() not in INSTRUCTION_WORDS:
+                return None
+        candidate = " ".join(best).rstrip(".")
+        if not candidate:
+            continue
+        if "=" not in candidate:
+            # An expression to evaluate rather than an equation to solve
+            return None
+        try:
+            equations.append((parse(candidate), candidate))
+        except ParseError:
+            return None
+    if not equations:
+        return None
+    return equations
+
+
+class LocalSolver:
+    """Exact solver for linear, quadratic and 2x2 linear system problems.
+
+    Produces scaffolding steps in the same shape the LLM returns, with every
+    expected answer computed in exact rational arithmetic. ``solve`` returns
+    None for anything it cannot handle so the caller can fall back to the LLM.
+    """
+
+    def solve(self, problem_text: str) -> Optional[Dict]:
+        equations = extract_equations(problem_text)
+        if equations is None:
+            return None
+        try:
+            sides = [(to_polynomial(node[1]), to_polynomial(node[2]), node) for node, _ in equations
+                     if node[0] == "eq"]
+        except NotPolynomial:
+            return None
+        if len(sides) != len(equations):
+            return None
+
+        names = set()
+        for left, right, _ in sides:
+            for monomial in list(left) + list(right):
+                names.update(var for var, _ in monomial)
+        order = sorted(names)
+
+        if len(sides) == 1 and len(order) == 1:
+            left, right, node = sides[0]
+            degree = _degree(_poly_add(left, right, -1))
+            if degree == 1:
+                steps = self._linear_steps(left, right, node, order[0])
+                return {"steps": steps} if steps else None
+            if degree == 2:
+                return {"steps": self._quadratic_steps(left, right, node, order[0])}
+        elif len(sides) == 2 and len(order) == 2:
+            if all(_degree(left) <= 1 and _degree(right) <= 1 for left, right, _ in sides):
+                return self._system_steps(sides, order)
+        return None
+
+    def _simplify_step(self, left: Polynomial, right: Polynomial, order: List[str]) -> Dict:
+        equation = _equation(left, right, order)
+        return _step(
+            f"Simplify both sides by expanding brackets and combining like terms. You should get: {equation}",
+            _alternates(equation),
+            "Multiply out any brackets first, then add together terms with the same variable",
+            "A simplified equation makes it clear which terms need to be moved"
+        )
+
+    def _linear_steps(self, left: Polynomial, right: Polynomial, node: Node, var: str) -> List[Dict]:
+        steps = []
+        x = ((var, 1),)
+        if _needs_simplifying(node[1]) or _needs_simplifying(node[2]):
+            steps.append(self._simplify_step(left, right, [var]))
+
+        a, b = left.get(x, Fraction(0)), left.get((), Fraction(0))
+        c, d = right.get(x, Fraction(0)), right.get((), Fraction(0))
+        # Collect the variable on the side where its coefficient stays positive,
+        # so "5 = x + 2" is solved as x + 2 = 5 rather than -x + 5 = 2
+        swapped = c > max(a, 0)
+        if swapped:
+            a, b, c, d = c, d, a, b
+        side = "right" if swapped else "left"
+
+        def written(var_side: Polynomial, other: Polynomial) -> str:
+            return _equation(other, var_side, [var]) if swapped else _equation(var_side, other, [var])
+
+        if c != 0:
+            if a - c == 0:
+                # Identities and contradictions have no single solution to scaffold
+                return []
+            moved_left = {m: v for m, v in {x: a - c, (): b}.items() if v}
+            equation = written(moved_left, {(): d} if d else {})
+            moved = format_polynomial({x: abs(c)}, [var])
+            steps.append(_step(
+                f"Move the {var} terms to the {side} side by {'subtracting' if c > 0 else 'adding'} {moved} "
+                f"{'from' if c > 0 else 'to'} both sides. You should get: {equation}",
+                _alternates(equation),
+                "Whatever you do to one side of the equation, do to the other side",
+                f"Collecting the {var} terms on one side leaves a single {var} term to isolate"
+            ))
+            a = a - c
+
+        if b != 0:
+            d = d - b
+            # A lone variable is the solution, which is always stated as "x = ..."
+            constant = {(): d} if d else {}
+            equation = _equation({x: a}, constant, [var]) if a == 1 else written({x: a}, constant)
+            steps.append(_step(
+                f"{'Subtract' if b > 0 else 'Add'} {format_number(abs(b))} {'from' if b > 0 else 'to'} "
+                f"both sides. You should get: {equation}",
+                _alternates(equation),
+                "Use the inverse operation to move the constant to the other side, and watch the sign",
+                f"Moving the constant away from the {var} term is the next step to isolating {var}"
+            ))
+
+        solution = d / a
+        answer = f"{var} = {format_number(solution)}"
+        if a != 1:
+            steps.append(_step(
+                f"Divide both sides by {format_number(a)} to find {var}.",
+                _alternates(answer),
+                f"Divide the number on the right by the coefficient of {var}",
+                f"Dividing by the coefficient leaves {var} on its own, which gives the solution"
+            ))
+        elif not steps:
+            steps.append(_step(
+                f"Read off the value of {var}.",
+                _alternates(answer),
+                f"{var} is already on its own",
+                "The equation already states the solution"
+            ))
+        return steps
+
+    def _quadratic_steps(self, left: Polynomial, right: Polynomial, node: Node, var: str) -> List[Dict]:
+        steps = []
+        standard = _poly_add(left, right, -1)
+        a = standard.get(((var, 2),), Fraction(0))
+        if a < 0:
+            standard = {m: -c for m, c in standard.items()}
+            a = -a
+        b = standard.get(((var, 1),), Fraction(0))
+        c = standard.get((), Fraction(0))
+
+        equation = _equation(standard, {}, [var])
+        if right or _needs_simplifying(node[1]) or _needs_simplifying(node[2]):
+            steps.append(_step(
+                f"Rewrite the equation in standard form a{var}^2 + b{var} + c = 0. You should get: {equation}",
+                _alternates(equation),
+                "Move every term to the left side so the right side is 0",
+                "The standard form lets us read off the coefficients a, b and c"
+            ))
+
+        coefficients = f"a = {format_number(a)}, b = {format_number(b)}, c = {format_number(c)}"
+        steps.append(_step(
+            "Identify the coefficients a, b and c.",
+            _alternates(coefficients),
+            f"a multiplies {var}^2, b multiplies {var} and c is the constant term; keep their signs",
+            "These coefficients are what we substitute into the discriminant and the quadratic formula"
+        ))
+
+        discriminant = b * b - 4 * a * c
+        steps.append(_step(
+            "Calculate the discriminant b^2 - 4ac.",
+            _alternates(format_number(discriminant)),
+            "Square b first, then subtract 4 times a times c",
+            "The sign of the discriminant tells us how many real solutions there are"
+        ))
+
+        if discriminant < 0:
+            steps.append(_step(
+                "Decide how many real solutions the equation has.",
+                "no real solutions|no real solution|none",
+                "Think about the square root of a negative number",
+                "A negative discriminant means the parabola never crosses the axis"
+            ))
+            return steps
+
+        root = _exact_sqrt(discriminant)
+        if root is None:
+            coefficient, radicand = _split_sqrt(discriminant)
+            rational, coefficient = -b / (2 * a), coefficient / (2 * a)
+            first = f"{var} = {format_surd(rational, coefficient, radicand)}"
+            second = f"{var} = {format_surd(rational, -coefficient, radicand)}"
+            steps.append(_step(
+                f"Use the quadratic formula {var} = (-b ± sqrt(b^2 - 4ac))/(2a) to find both solutions.",
+                _alternates(f"{first}, {second}"),
+                "Substitute a, b and the discriminant; one solution uses +, the other uses -",
+                "The discriminant is not a perfect square, so the solutions are irrational"
+            ))
+            return steps
+
+        roots = sorted({(-b + root) / (2 * a), (-b - root) / (2 * a)})
+        # A bare x factor goes first, as in x(x + 2); a double root is squared
+        factors = "".join(
+            _factor(var, r, 3 - len(roots)) for r in sorted(roots, key=lambda r: (r != 0, r))
+        )
+        factored = f"{format_number(a) if a != 1 else ''}{factors} = 0"
+        steps.append(_step(
+            f"Factor the quadratic. You should get: {factored}",
+            _alternates(factored),
+            "Look for two numbers that multiply to give a·c and add to give b",
+            "Writing the quadratic as a product lets us use the zero product property"
+        ))
+        answer = ", ".join(f"{var} = {format_number(r)}" for r in roots)
+        steps.append(_step(
+            f"Set each factor equal to zero and solve for {var}.",
+            _alternates(answer),
+            "If a product is zero, at least one of its factors must be zero",
+            "Each factor gives one solution of the equation"
+        ))
+        return steps
+
+    def _system_steps(self, sides: List[Tuple[Polynomial, Polynomial, Node]], order: List[str]) -> Optional[Dict]:
+        rows = []
+        for left, right, _ in sides:
+            standard = _poly_add(left, right, -1)
+            rows.append([standard.get(((var, 1),), Fraction(0)) for var in order] + [-standard.get((), Fraction(0))])
+
+        # Imported here so single-equation problems (and worker start-up) never pay for numpy
+        import numpy as np
+
+        matrix = np.array([[float(v) for v in row[:2]] for row in rows])
+        constants = np.array([float(row[2]) for row in rows])
+        if abs(np.linalg.det(matrix)) < 1e-12:
+            return None
+        approximate = np.linalg.solve(matrix, constants)
+        denominator_bound = abs(rows[0][0] * rows[1][1] - rows[0][1] * rows[1][0]).denominator * 10 ** 6
+        solution = [Fraction(float(v)).limit_denominator(denominator_bound) for v in approximate]
+        # Only trust the floating point result once it checks out exactly
+        if any(row[0] * solution[0] + row[1] * solution[1] != row[2] for row in rows):
+            return None
+
+        p, q = order
+        steps = []
+        standard_forms = [
+            _equation({m: v for m, v in {((p, 1),): row[0], ((q, 1),): row[1]}.items() if v},
+                      {(): row[2]} if row[2] else {}, order)
+            for row in rows
+        ]
+        if any(left.get((), 0) or any(m != () for m in right) or _needs_simplifying(node[1])
+               for left, right, node in sides):
+            steps.append(_step(
+                f"Write both equations in the form a{p} + b{q} = c. You should get: "
+                f"{standard_forms[0]} and {standard_forms[1]}",
+                _alternates(f"{standard_forms[0]}, {standard_forms[1]}"),
+                "Keep the variable terms on the left and the constants on the right",
+                "Lining up the variables makes it easy to eliminate one of them"
+            ))
+
+        (a1, b1, c1), (a2, b2, c2) = rows
+        if a1 and a2:
+            m1, m2 = a2, a1
+            if a1.denominator == a2.denominator == 1:
+                lcm = abs(a1.numerator * a2.numerator) // math.gcd(a1.numerator, a2.numerator)
+                m1, m2 = Fraction(lcm) / a1, Fraction(lcm) / a2
+            coeff, const = m1 * b1 - m2 * b2, m1 * c1 - m2 * c2
+            eliminated = _equation({((q, 1),): coeff}, {(): const} if const else {}, order)
+            scaled = [f"the {name} equation by {format_number(m)}"
+                      for name, m in (("first", m1), ("second", m2)) if m != 1]
+            instruction = f"Subtract the second equation from the first to eliminate {p}."
+            if scaled:
+                instruction = f"Multiply {' and '.join(scaled)}, then subtract the second from the first to eliminate {p}."
+            steps.append(_step(
+                f"{instruction} You should get: {eliminated}",
+                _alternates(eliminated),
+                f"Make the {p} coefficients equal first so they cancel when you subtract",
+                f"Eliminating {p} leaves a single equation in {q}"
+            ))
+        steps.append(_step(
+            f"Solve for {q}.",
+            _alternates(f"{q} = {format_number(solution[1])}"),
+            f"Divide by the coefficient of {q}",
+            f"With only {q} left, it can be solved like a linear equation"
+        ))
+        steps.append(_step(
+            f"Substitute {q} = {format_number(solution[1])} into "
+            f"{standard_forms[0] if a1 else standard_forms[1]} and solve for {p}.",
+            _alternates(f"{p} = {format_number(solution[0])}"),
+            f"Replace {q} with its value, then isolate {p}",
+            f"Using the known value of {q} turns the equation into one with a single unknown"
+        ))
+        answer = f"{p} = {format_number(solution[0])}, {q} = {format_number(solution[1])}"
+        steps.append(_step(
+            "Write the solution of the system.",
+            _alternates(answer),
+            "Check both values in the original equations",
+            "The solution must satisfy both equations at the same time"
+        ))
+        return {"steps": steps}
@@ -0,0 +1,116 @@
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+from utils.math_equivalence import STEP_ARROWS, ParsedAnswer, compare_answers, parse_alternates, parse_answer
+
+REQUIRED_STEP_FIELDS = ["instruction", "expected_answer", "hint", "explanation"]
+
+
+def normalize_form(answer: str) -> str:
+    """Lowercase, drop whitespace and keep only the final form of step-by-step work.
+
+    Only arrows ("2x=10->x=5") chain work; a bare ">" is an inequality.
+    """
+    normalized = "".join(str(answer).lower().split())
+    return STEP_ARROWS.split(normalized)[-1]
+
+
+class Step:
+    """One scaffolding step with its expected answer pre-compiled for matching.
+
+    The alternate forms of ``expected_answer`` are normalized into a frozenset
+    once, so exact matches are a set lookup, and are parsed lazily the first
+    time a student answer needs the equivalence check.
+    """
+
+    __slots__ = ("instruction", "expected_answer", "hint", "explanation",
+                 "answer_forms", "_parsed_forms", "extra")
+
+    def __init__(self, instruction: str, expected_answer: str, hint: str, explanation: str,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.instruction = instruction
+        self.expected_answer = str(expected_answer)
+        self.hint = hint
+        self.explanation = explanation
+        self.answer_forms: FrozenSet[str] = frozenset(
+            normalize_form(form) for form in self.expected_answer.split("|")
+        )
+        self._parsed_forms: Optional[Tuple[Optional[ParsedAnswer], ...]] = None
+        # Any other fields the model returned, kept so serialization round-trips
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Step":
+        """Build a step from its JSON form, raising ValueError if a field is missing."""
+        missing = [field for field in REQUIRED_STEP_FIELDS if field not in data]
+        if missing:
+            raise ValueError(f"Missing required fields in step: {', '.join(missing)}")
+        extra = {key: value for key, value in data.items() if key not in REQUIRED_STEP_FIELDS}
+        return cls(data["instruction"], data["expected_answer"], data["hint"], data["explanation"], extra)
+
+    def to_dict(self) -> Dict:
+        data = {
+            "instruction": self.instruction,
+            "expected_answer": self.expected_answer,
+            "hint": self.hint,
+            "explanation": self.explanation
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def parsed_forms(self) -> Tuple[Optional[ParsedAnswer], ...]:
+        if self._parsed_forms is None:
+            self._parsed_forms = parse_alternates(self.expected_answer)
+        return self._parsed_forms
+
+    def matches_exactly(self, answer: str) -> bool:
+        return normalize_form(answer) in self.answer_forms
+
+    def check_answer(self, answer: str) -> Optional[bool]:
+        """True/False when the answer can be judged locally, None when it needs the LLM."""
+        if self.matches_exactly(answer):
+            return True
+        return compare_answers(self.parsed_forms, parse_answer(answer))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Step):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"Step(instruction={self.instruction!r}, expected_answer={self.expected_answer!r})"
+
+
+class Scaffolding:
+    """An ordered, immutable sequence of steps for one problem."""
+
+    __slots__ = ("steps",)
+
+    def __init__(self, steps: Iterable[Step]):
+        self.steps: Tuple[Step, ...] = tuple(steps)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Scaffolding":
+        if "steps" not in data:
+            raise ValueError("No steps found in response")
+        return cls(Step.from_dict(step) for step in data["steps"])
+
+    def to_dict(self) -> Dict:
+        return {"steps": [step.to_dict() for step in self.steps]}
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __iter__(self) -> Iterator[Step]:
+        return iter(self.steps)
+
+    def __getitem__(self, index: int) -> Step:
+        return self.steps[index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Scaffolding):
+            return NotImplemented
+        return self.steps == other.steps
+
+    def __repr__(self) -> str:
+        return f"Scaffolding({len(self.steps)} steps)"
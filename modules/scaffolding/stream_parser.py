@@ -0,0 +1,68 @@
+import json
+import re
+from typing import Dict, List
+
+STEPS_ARRAY_PATTERN = re.compile(r'"steps"\s*:\s*\[')
+
+
+class StepStreamParser:
+    """Incrementally parses a streamed scaffolding response.
+
+    Text is fed in arbitrary chunks as the model produces it. Every time an
+    element of the top-level ``steps`` array is closed, it is decoded and
+    returned, so callers can forward it before the rest of the JSON arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._in_steps = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        self._object_start = -1
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Add a chunk of model output and return any steps completed by it."""
+        self.buffer += chunk
+        if self.done:
+            return []
+
+        if not self._in_steps:
+            match = STEPS_ARRAY_PATTERN.search(self.buffer)
+            if not match:
+                return []
+            self._in_steps = True
+            self._pos = match.end()
+
+        steps = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == '\\':
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif c == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        steps.append(json.loads(buffer[self._object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+            elif c == ']' and self._depth == 0:
+                self.done = True
+                self._pos = i + 1
+                return steps
+        self._pos = len(buffer)
+        return steps
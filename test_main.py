@@ -1,38 +1,41 @@
 import os
 import json
+import asyncio
 from datetime import datetime
-from modules.problem_understanding.analyzer import ProblemAnalyzer
-from modules.knowledge_assessment.diagnoser import KnowledgeAssessor
-from modules.scaffolding.engine import ScaffoldingEngine
-from modules.feedback.feedback_engine import FeedbackEngine
-from modules.knowledge_reinforcement.reinforcer import KnowledgeReinforcer
-from modules.image_processing.image_processor import ImageProcessor
-from utils.validation import AnswerValidator
+from typing import Dict, List, Optional, Union
+from modules.scaffolding.models import Scaffolding, Step
+from utils.registry import get_registry
+from utils.session_store import SessionStore, TutoringSession
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds a stage boundary waits on a background prefetch before falling back
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "5"))
+
+# Offered when practice material could not be generated in time
+FALLBACK_PRACTICE = {
+    "linear_equation": "2(x + 3) = 8",
+    "quadratic_equation": "x^2 - 5x + 6 = 0",
+    "system_of_equations": "x + y = 5, x - y = 1"
+}
+
 class AITutor:
     def __init__(self):
-        self.analyzer = ProblemAnalyzer()
-        self.knowledge_assessor = KnowledgeAssessor()
-        self.scaffolding_engine = ScaffoldingEngine()
-        self.feedback_engine = FeedbackEngine()
-        self.validator = AnswerValidator()
-        self.image_processor = ImageProcessor()
-        self.reinforcer = KnowledgeReinforcer()
-        self.current_step = 0
-        self.total_steps = 0
-        self.solution_steps = []
+        # Modules are built on first use and share one LLM gateway
+        self.components = get_registry()
+        # Step state lives in per-learner sessions rather than on the tutor
+        self.sessions = SessionStore()
         self.max_attempts = 3
+        self.prefetch_wait = PREFETCH_WAIT_SECONDS
 
-    def process_user_input(self, user_input: str) -> str:
+    async def process_user_input(self, user_input: str) -> str:
         """Process user input which can be text or image."""
         try:
             # Check if input is an image path
             if os.path.exists(user_input):
                 print("\nProcessing image input...")
-                result = self.image_processor.process_image(user_input, mode="problem")
+                result = await self.components.image_processor.process_image(user_input, mode="problem")
                 
                 if result and result.get("problem_text"):
                     problem = result["problem_text"]
@@ -42,6 +45,10 @@ class AITutor:
                     if result.get("additional_context"):
                         print(f"Additional context: {result['additional_context']}")
                     return problem
+                elif result and result.get("quality"):
+                    # Rejected before the vision call; the message says how to retake it
+                    print(result["error"])
+                    return ""
                 else:
                     print("Could not extract a valid problem from the image.")
                     return ""
@@ -54,7 +61,7 @@ class AITutor:
             print(f"\nI had trouble processing that input. Please try again.")
             return ""
 
-    def start_tutoring_session(self):
+    async def start_tutoring_session(self):
         print(f"\n{'='*50}")
         print(f"Welcome to AI Math Tutor!")
         print(f"{'='*50}")
@@ -64,22 +71,25 @@ class AITutor:
         while True:
             print("\nWhat math problem would you like help with?")
             print("(You can type a problem or provide an image path/URL)")
-            user_input = input("> ").strip()
+            user_input = await self._ask()
             
             if user_input.lower() in ['exit', 'quit']:
                 print("\nThank you for learning with AI Math Tutor! Goodbye!")
                 break
                 
-            problem = self.process_user_input(user_input)
+            problem = await self.process_user_input(user_input)
             if not problem:
                 continue
             
-            self.guide_problem_solution(problem)
+            await self.guide_problem_solution(problem)
     
-    def guide_problem_solution(self, problem: str):
+    async def guide_problem_solution(self, problem: str):
+        # Scaffolding doesn't need the analysis, so it runs while the problem is analyzed
+        steps_task = asyncio.create_task(self.components.scaffolding_engine.generate_solution_steps(problem))
+        prefetch: Dict[str, asyncio.Task] = {}
         try:
             # Step 1: Analyze the problem
-            analysis = self.analyzer.analyze_problem(problem)
+            analysis = await self.components.problem_analyzer.analyze_problem(problem)
             
             # Handle different problem types
             problem_type = analysis.get('problem_type', 'linear_equation').lower()
@@ -90,51 +100,50 @@ class AITutor:
             else:
                 problem_type = 'linear_equation'
             
+            # Practice and diagnostics are ready by the time the student finishes the steps
+            concept = (analysis.get('key_concepts') or [problem_type])[0]
+            prefetch = self._prefetch(concept)
+            
             print(f"\nI see! This is a {problem_type} problem.")
             print("Let's solve it together step by step.")
             print("I'll guide you through each step, and you'll provide the answers.\n")
             
             # Step 2: Get solution steps
-            self.solution_steps = self.scaffolding_engine.generate_solution_steps(problem)
-            if not self.solution_steps:
+            solution_steps = await steps_task
+            if not solution_steps:
                 print("I apologize, but I'm having trouble generating steps for this problem.")
                 print("Let's try another problem!")
                 return
                 
-            self.total_steps = len(self.solution_steps)
-            if self.total_steps == 0:
-                print("I apologize, but I couldn't generate steps for this problem.")
-                print("Let's try another problem!")
-                return
+            session = self.sessions.create(problem, Scaffolding(solution_steps))
+            missed_steps = []
             
             # Step 3: Guide through each step
-            for i, step in enumerate(self.solution_steps, 1):
-                print(f"Step {i} of {self.total_steps}:")
-                print(step["instruction"])
+            for i, step in enumerate(session.scaffolding, 1):
+                print(f"Step {i} of {session.total_steps}:")
+                print(step.instruction)
                 print("\nWhat's your answer? (Type 'hint' for help, 'explain' for detailed explanation, or 'quit' to stop)")
                 
                 attempts = 0
-                max_attempts = 3
+                max_attempts = self.max_attempts
                 while attempts < max_attempts:
-                    answer = input("> ").strip().lower()
+                    answer = (await self._ask()).lower()
                     
                     if answer in ['quit', 'exit']:
                         return
                     elif answer == 'hint':
-                        print(f"\n💡 Hint: {step['hint']}")
+                        print(f"\n💡 Hint: {step.hint}")
                         print("\nWhat's your answer?")
                         continue
                     elif answer == 'explain':
-                        print(f"\n📝 Explanation: {step['explanation']}")
+                        print(f"\n📝 Explanation: {step.explanation}")
                         print("\nWhat's your answer?")
                         continue
                         
                     # Validate the answer
-                    validation = self.validator.validate_answer(
-                        step_instruction=step["instruction"],
-                        expected_answer=step["expected_answer"],
-                        user_answer=answer
-                    )
+                    validation = await self.components.answer_validator.validate_step(step, answer)
+                    session.record_attempt(i - 1, validation["is_correct"], max_attempts)
+                    self.sessions.save(session)
                     
                     if validation["is_correct"]:
                         print("\n✅ Correct! Great job!")
@@ -143,7 +152,7 @@ class AITutor:
                         else:
                             print("Excellent work showing your steps! This is a great way to solve problems.")
                         print(f"({validation['explanation']})")
-                        print(f"\nExplanation: {step['explanation']}")
+                        print(f"\nExplanation: {step.explanation}")
                         break
                     else:
                         attempts += 1
@@ -151,83 +160,138 @@ class AITutor:
                             print(f"\n❌ That's not quite right. You have {max_attempts - attempts} more attempts.")
                             print(f"Hint: {validation['explanation']}")
                             print("Would you like another hint? (yes/no)")
-                            if input("> ").strip().lower() == 'yes':
-                                print(f"\n💡 Hint: {step['hint']}")
+                            if (await self._ask()).lower() == 'yes':
+                                print(f"\n💡 Hint: {step.hint}")
                             print("\nWhat's your answer? (Type 'hint' for help, 'explain' for detailed explanation, or 'quit' to stop)")
                         else:
-                            print(f"\n❌ The correct answer was: {step['expected_answer']}")
-                            print(f"Explanation: {step['explanation']}")
-                            if i < len(self.solution_steps):
+                            missed_steps.append(step)
+                            print(f"\n❌ The correct answer was: {step.expected_answer}")
+                            print(f"Explanation: {step.explanation}")
+                            if i < session.total_steps:
                                 print("\nLet's continue with the next step.")
                 
             print("\n🎉 Congratulations! You've successfully solved the problem!")
             
-            # Step 4: Offer practice
-            print("\nWould you like to try a similar problem for practice? (yes/no)")
-            practice_response = input("> ").strip().lower()
-            if practice_response == 'yes':
-                practice_problem = {
-                    "problem": "2(x + 3) = 8",
-                    "type": problem_type
-                }
-                print("\nHere's a similar problem to try:")
-                print(practice_problem["problem"])
+            # Step 4: Check the concept if a step got away from the student
+            if missed_steps:
+                await self.check_understanding(await self._prefetched(prefetch["diagnostics"]))
+            
+            # Step 5: Offer practice
+            await self.suggest_practice(await self._prefetched(prefetch["reinforcement"]), problem_type)
                 
         except Exception as e:
             logger.error(f"Error in guide_problem_solution: {str(e)}", exc_info=True)
             print("\nI apologize, but I'm having trouble with this problem.")
             print("Let's try another one!")
+        finally:
+            self._discard([steps_task, *prefetch.values()])
+
+    async def _ask(self) -> str:
+        """Read the student's reply in a worker thread so prefetches keep running meanwhile."""
+        return (await asyncio.to_thread(input, "> ")).strip()
 
-    def check_answer(self, user_answer: str, expected_answer: str) -> bool:
+    def _prefetch(self, concept: str) -> Dict[str, asyncio.Task]:
+        """Start generating practice material and diagnostics in the background."""
+        return {
+            "reinforcement": asyncio.create_task(self.components.reinforcer.generate_reinforcement(
+                concept=concept,
+                mistakes=[],
+                retention_score=75.0
+            )),
+            "diagnostics": asyncio.create_task(self.components.knowledge_assessor.generate_diagnostics(concept))
+        }
+
+    async def _prefetched(self, task: asyncio.Task) -> Optional[Dict]:
+        """Return a prefetched result, or None if it failed or is not ready within prefetch_wait."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.prefetch_wait)
+        except Exception as e:
+            logger.warning(f"Prefetch unavailable: {e!r}")
+            return None
+
+    @staticmethod
+    def _discard(tasks: List[asyncio.Task]):
+        """Cancel background tasks that are still running and swallow errors from finished ones."""
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+    def check_answer(self, user_answer: str, expected_answer: Union[str, Step]) -> bool:
         """Compare user's answer with expected answer."""
-        # Remove spaces and convert to lowercase for comparison
-        user_answer = user_answer.replace(' ', '').lower()
-        expected_answer = str(expected_answer).replace(' ', '').lower()
-        
-        # Handle multiple correct forms of the same answer
-        if '|' in expected_answer:
-            return user_answer in [ans.strip() for ans in expected_answer.split('|')]
-        
-        return user_answer == expected_answer
+        if not isinstance(expected_answer, Step):
+            expected_answer = Step(instruction="", expected_answer=expected_answer, hint="", explanation="")
+        # Alternate forms are pre-normalized, so this is a set lookup
+        return expected_answer.matches_exactly(user_answer)
     
-    def show_hint(self, step: dict):
+    def show_hint(self, step: Step):
         """Show a hint for the current step."""
-        print("\n💡 Hint:", step.get('hint', 'Think about what we learned in the previous steps.'))
+        print("\n💡 Hint:", step.hint or 'Think about what we learned in the previous steps.')
     
-    def explain_step_in_detail(self, step: dict):
+    def explain_step_in_detail(self, step: Step):
         """Provide detailed explanation of the current step."""
+        details = step.extra or {}
         print("\n📚 Detailed Explanation:")
-        print(step.get('detailed_explanation', step.get('explanation', step['instruction'])))
+        print(details.get('detailed_explanation', step.explanation or step.instruction))
         print("\nKey Concepts for this step:")
-        for concept in step.get('key_concepts', []):
+        for concept in details.get('key_concepts', []):
             print(f"- {concept}")
     
-    def provide_additional_help(self, step: dict):
+    def provide_additional_help(self, step: Step):
         """Provide additional help when student is stuck."""
+        details = step.extra or {}
         print("\n1. Let's break down the problem into smaller parts:")
-        for i, part in enumerate(step.get('breakdown', ['No detailed breakdown available']), 1):
+        for i, part in enumerate(details.get('breakdown', ['No detailed breakdown available']), 1):
             print(f"   {i}. {part}")
         
         print("\n2. Common mistakes to avoid:")
-        for mistake in step.get('common_mistakes', ['No common mistakes listed']):
+        for mistake in details.get('common_mistakes', ['No common mistakes listed']):
             print(f"   • {mistake}")
         
         print("\n3. Tips:")
-        for tip in step.get('tips', ['Take your time', 'Write down each step', 'Check your work']):
+        for tip in details.get('tips', ['Take your time', 'Write down each step', 'Check your work']):
             print(f"   • {tip}")
     
-    def suggest_practice(self):
-        reinforcement = self.reinforcer.generate_reinforcement(
-            concept=self.solution_steps[0].get('concept', 'unknown'),
-            mistakes=[],
-            retention_score=75.0
-        )
+    async def check_understanding(self, diagnostics: Optional[Dict]):
+        """Ask one diagnostic question about the concept behind the problem."""
+        questions = (diagnostics or {}).get('questions') or []
+        if not questions:
+            return
+        question = questions[0]
+        options = question.get('options', [])
+        print("\nLet's check the idea behind the step you missed:")
+        print(question.get('text', ''))
+        for i, option in enumerate(options, 1):
+            print(f"   {i}. {option}")
+        answer = await self._ask()
+        correct_index = question.get('correct_index', 0)
+        if answer.isdigit() and int(answer) - 1 == correct_index:
+            print("\n✅ Correct!")
+        elif 0 <= correct_index < len(options):
+            print(f"\nThe answer is: {options[correct_index]}")
+        if question.get('explanation'):
+            print(question['explanation'])
+    
+    async def suggest_practice(self, reinforcement: Optional[Dict], problem_type: str = 'linear_equation'):
+        practice_set = (reinforcement or {}).get('practice_set') or []
+        if practice_set:
+            practice = practice_set[0]
+            practice_problem = practice.get('problem', '') if isinstance(practice, dict) else str(practice)
+        else:
+            practice_problem = FALLBACK_PRACTICE.get(problem_type, FALLBACK_PRACTICE['linear_equation'])
         
         print("\nWould you like to try a similar problem for practice? (yes/no)")
-        if input("> ").strip().lower() == 'yes':
+        if (await self._ask()).lower() == 'yes':
             print("\nHere's a similar problem to try:")
-            print(reinforcement['practice_set'][0])
+            print(practice_problem)
 
-if __name__ == '__main__':
+async def main():
     tutor = AITutor()
-    tutor.start_tutoring_session()
+    try:
+        await tutor.start_tutoring_session()
+    finally:
+        await tutor.components.aclose()
+
+if __name__ == '__main__':
+    asyncio.run(main())
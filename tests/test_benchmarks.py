@@ -0,0 +1,61 @@
+import unittest
+import json
+import httpx
+from groq import AsyncGroq
+from benchmarks.fake_groq import LatencyDistribution, create_app
+from benchmarks.load_test import percentile, summarize
+from utils.llm_gateway import LLMGateway
+
+def gateway_for(app) -> LLMGateway:
+    """A gateway whose Groq client talks to the fake server in-process."""
+    gateway = LLMGateway(api_key="fake-key", cache=None)
+    gateway._client = AsyncGroq(
+        api_key="fake-key",
+        base_url="http://fake-groq",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+        max_retries=0
+    )
+    return gateway
+
+class TestFakeGroq(unittest.IsolatedAsyncioTestCase):
+    async def test_canned_responses_follow_the_prompt(self):
+        """Test that the SDK gets scaffolding JSON for scaffolding prompts, also when streaming."""
+        gateway = gateway_for(create_app())
+        messages = [{"role": "system", "content": 'Create steps. Example format: {"steps": []}'}]
+
+        content = await gateway.complete(model="llama3-70b-8192", messages=messages)
+        self.assertEqual(len(json.loads(content)["steps"]), 3)
+
+        streamed = "".join([chunk async for chunk in gateway.stream(model="llama3-70b-8192", messages=messages)])
+        self.assertEqual(streamed, content)
+        await gateway.aclose()
+
+    async def test_rate_limits_are_injected(self):
+        """Test that a rate-limit rate of 1 answers every call with a 429."""
+        app = create_app(rate_limit_rate=1.0, retry_after=0.1)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake-groq") as client:
+            response = await client.post("/openai/v1/chat/completions", json={"model": "m", "messages": []})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["retry-after"], "0.1")
+
+class TestLoadTestReport(unittest.TestCase):
+    def test_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 0.05)
+        self.assertEqual(percentile(values, 99), 0.099)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summary(self):
+        result = summarize("text", 8, [0.1, 0.2, 0.3, 0.4], errors=1, elapsed=2.0)
+        self.assertEqual(result["throughput_rps"], 2.0)
+        self.assertEqual(result["error_rate"], 0.25)
+        self.assertEqual(result["p50_ms"], 200.0)
+
+    def test_latency_spec(self):
+        self.assertEqual(LatencyDistribution.parse("const:0.25").sample(), 0.25)
+        self.assertTrue(0.1 <= LatencyDistribution.parse("uniform:0.1:0.2").sample() <= 0.2)
+        with self.assertRaises(ValueError):
+            LatencyDistribution.parse("normal:1")
+
+if __name__ == '__main__':
+    unittest.main()
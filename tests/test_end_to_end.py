@@ -0,0 +1,71 @@
+import unittest
+import os
+from modules.feedback.feedback_engine import FeedbackEngine
+from modules.knowledge_assessment.diagnoser import KnowledgeAssessor
+from modules.knowledge_reinforcement.reinforcer import KnowledgeReinforcer
+from modules.problem_understanding.analyzer import ProblemAnalyzer
+from modules.scaffolding.engine import ScaffoldingEngine
+from modules.scaffolding.models import Step
+from utils.llm_cassette import Cassette
+from utils.llm_gateway import LLMGateway
+from utils.metrics import FALLBACKS
+from utils.validation import AnswerValidator
+
+# Replayed by default. To re-record after a prompt change, run against a live key:
+#   LLM_CASSETTE_MODE=record python -m pytest tests/test_end_to_end.py
+CASSETTE = os.path.join(os.path.dirname(__file__), "cassettes", "modules.json")
+WORD_PROBLEM = "Twice a number plus 5 is 15. What is the number?"
+
+class TestModulesEndToEnd(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        cassette = Cassette(CASSETTE, mode=os.getenv("LLM_CASSETTE_MODE", "replay"))
+        self.llm = LLMGateway(cache=None, cassette=cassette)
+
+    async def asyncTearDown(self):
+        await self.llm.aclose()
+
+    def fallbacks(self, module):
+        return sum(FALLBACKS.value(module=module, reason=reason) for reason in ("error", "unparseable"))
+
+    async def test_problem_analysis(self):
+        before = self.fallbacks("problem_analysis")
+        analysis = await ProblemAnalyzer(llm=self.llm).analyze_problem(WORD_PROBLEM)
+        self.assertEqual(analysis["problem_type"], "linear_equation")
+        self.assertEqual(self.fallbacks("problem_analysis"), before)
+
+    async def test_scaffolding_complete_and_stream_agree(self):
+        engine = ScaffoldingEngine(llm=self.llm)
+        before = self.fallbacks("scaffolding")
+        scaffolding = await engine.generate_scaffolding("unknown", "", "", WORD_PROBLEM)
+        streamed = [step async for step in engine.stream_scaffolding("unknown", "", "", WORD_PROBLEM)]
+
+        self.assertGreater(len(scaffolding), 1)
+        self.assertEqual(streamed, list(scaffolding))
+        self.assertTrue(scaffolding[-1].check_answer("n = 5"))
+        self.assertEqual(self.fallbacks("scaffolding"), before)
+
+    async def test_free_text_answer_validation(self):
+        step = Step(instruction="Divide both sides by 2.", expected_answer="n = 5", hint="", explanation="")
+        result = await AnswerValidator(llm=self.llm).validate_step(step, "the number is five")
+        self.assertTrue(result["is_correct"])
+
+    async def test_knowledge_assessment(self):
+        assessor = KnowledgeAssessor(llm=self.llm)
+        diagnostics = await assessor.generate_diagnostics("linear equations")
+        analysis = await assessor.analyze_responses("linear equations", diagnostics["questions"],
+                                                    [1] * len(diagnostics["questions"]))
+        self.assertTrue(diagnostics["questions"])
+        self.assertIsInstance(analysis, dict)
+
+    async def test_reinforcement(self):
+        reinforcement = await KnowledgeReinforcer(llm=self.llm).generate_reinforcement(
+            "linear equations", ["divided before subtracting"], 60
+        )
+        self.assertTrue(reinforcement["practice_set"])
+
+    async def test_feedback(self):
+        feedback = await FeedbackEngine(llm=self.llm).analyze_errors(WORD_PROBLEM, "n = 10", "n = 5")
+        self.assertIn("error_analysis", feedback)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+import unittest
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+import base64
+import json
+import os
+from io import BytesIO
+import numpy as np
+from PIL import ExifTags, Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+from modules.image_processing.image_processor import ImageProcessor
+from modules.image_processing.phash_cache import PerceptualHashCache
+from modules.image_processing.preprocess import ContentPreprocessor
+from modules.image_processing.quality import ImageQualityGate
+
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(__file__), '..', 'modules', 'image_processing', 'test_images')
+TEST_IMAGE = os.path.join(TEST_IMAGES_DIR, '1.jpeg')
+
+class TestImageProcessor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        with open(TEST_IMAGE, 'rb') as f:
+            self.image_bytes = f.read()
+        self.mock_llm = MagicMock()
+        self.mock_llm.complete = AsyncMock(return_value=json.dumps({
+            "problem_text": "2x + 5 = 15",
+            "problem_type": "linear_equation",
+            "additional_context": ""
+        }))
+        self.ocr_cache = PerceptualHashCache()
+        self.processor = ImageProcessor(llm=self.mock_llm, ocr_cache=self.ocr_cache)
+
+    def test_encode_accepts_all_sources(self):
+        """Test that bytes, file objects, paths and PIL images encode the same picture."""
+        from_bytes = self.processor.encode_image_to_base64(self.image_bytes)
+        from_file = self.processor.encode_image_to_base64(BytesIO(self.image_bytes))
+        from_path = self.processor.encode_image_to_base64(TEST_IMAGE)
+        with Image.open(BytesIO(self.image_bytes)) as img:
+            from_pil = self.processor.encode_image_to_base64(img)
+            # Caller-owned images are left open
+            img.load()
+
+        self.assertEqual(from_bytes, from_file)
+        self.assertEqual(from_bytes, from_path)
+        # A caller's image is not draft-decoded, so grayscale comes from RGB rather than luma
+        with Image.open(BytesIO(base64.b64decode(from_bytes))) as a, \
+                Image.open(BytesIO(base64.b64decode(from_pil))) as b:
+            self.assertEqual(a.size, b.size)
+            diff = np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16))
+            self.assertLess(diff.mean(), 2)
+
+    def test_encoded_image_is_small_grayscale_jpeg(self):
+        """Test that the encoded image is downscaled to grayscale JPEG."""
+        encoded = self.processor.encode_image_to_base64(self.image_bytes)
+        with Image.open(BytesIO(base64.b64decode(encoded))) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(img.mode, 'L')
+            self.assertLessEqual(max(img.size), 400)
+
+    async def test_process_image_from_bytes(self):
+        """Test that uploads are processed without writing temp files."""
+        before = set(os.listdir('.'))
+        result = await self.processor.process_image(self.image_bytes, mode="problem")
+
+        self.assertEqual(result["problem_text"], "2x + 5 = 15")
+        self.assertEqual(set(os.listdir('.')), before)
+        self.mock_llm.complete.assert_awaited_once()
+
+    async def test_near_duplicate_photo_reuses_extraction(self):
+        """Test that a recompressed copy of the same photo skips the vision call."""
+        with Image.open(BytesIO(self.image_bytes)) as img:
+            buffer = BytesIO()
+            img.save(buffer, format='JPEG', quality=40)
+        recompressed = buffer.getvalue()
+        self.assertNotEqual(recompressed, self.image_bytes)
+
+        first = await self.processor.process_image(self.image_bytes, mode="problem")
+        second = await self.processor.process_image(recompressed, mode="problem")
+
+        self.assertEqual(first, second)
+        self.mock_llm.complete.assert_awaited_once()
+        self.assertEqual(self.ocr_cache.stats()["problem"]["hits"], 1)
+
+    def test_large_jpeg_is_draft_decoded(self):
+        """Test that a large JPEG is decoded at a reduced DCT scale, straight to grayscale."""
+        with Image.open(TEST_IMAGE) as img:
+            large = img.resize((img.width * 8, img.height * 8))
+        buffer = BytesIO()
+        large.save(buffer, format='JPEG')
+        processor = ImageProcessor(llm=self.mock_llm, ocr_cache=self.ocr_cache,
+                                   preprocessor=ContentPreprocessor(crop=False))
+
+        original_open = Image.open
+        opened = []
+        def tracking_open(*args, **kwargs):
+            opened.append(original_open(*args, **kwargs))
+            return opened[-1]
+
+        with patch('modules.image_processing.image_processor.Image.open', side_effect=tracking_open):
+            with processor._downscale(buffer.getvalue()) as gray:
+                self.assertEqual(max(gray.size), 400)
+        # 9184px wide decodes at 1/8 scale, the smallest that still covers 400px
+        self.assertEqual(opened[0].mode, 'L')
+        self.assertEqual(opened[0].size, (1148, large.height // 8))
+
+    def test_exif_orientation_is_applied(self):
+        """Test that a photo stored sideways with an EXIF rotation is turned upright."""
+        with Image.open(TEST_IMAGE) as img:
+            sideways = img.transpose(Image.Transpose.ROTATE_90)
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        buffer = BytesIO()
+        sideways.save(buffer, format='JPEG', exif=exif)
+
+        with self.processor._downscale(buffer.getvalue()) as upright, self.processor._downscale(TEST_IMAGE) as expected:
+            self.assertEqual(upright.size, expected.size)
+
+    async def test_different_photo_or_mode_misses(self):
+        """Test that other images and other modes are extracted separately."""
+        with open(os.path.join(TEST_IMAGES_DIR, '2.jpeg'), 'rb') as f:
+            other_image = f.read()
+
+        await self.processor.process_image(self.image_bytes, mode="problem")
+        await self.processor.process_image(other_image, mode="problem")
+        self.mock_llm.complete.return_value = json.dumps({"answer_text": "x = 4"})
+        await self.processor.process_image(self.image_bytes, mode="answer")
+
+        self.assertEqual(self.mock_llm.complete.await_count, 3)
+        self.assertEqual(self.ocr_cache.stats()["problem"]["hit_rate"], 0.0)
+
+    async def test_same_layout_with_different_digits_misses(self):
+        """Test that problems differing in one number are not mistaken for the same photo."""
+        def render(text):
+            img = Image.new('L', (600, 200), 255)
+            ImageDraw.Draw(img).text((40, 60), text, fill=0, font=ImageFont.load_default(size=64))
+            buffer = BytesIO()
+            img.save(buffer, format='PNG')
+            return buffer.getvalue()
+
+        for first, second in (("2x + 3 = 7", "2x + 3 = 9"), ("x = 12", "x = 17")):
+            self.mock_llm.complete.return_value = json.dumps({"problem_text": first})
+            await self.processor.process_image(render(first), mode="problem")
+            self.mock_llm.complete.return_value = json.dumps({"problem_text": second})
+            result = await self.processor.process_image(render(second), mode="problem")
+            self.assertEqual(result["problem_text"], second)
+
+        self.assertEqual(self.mock_llm.complete.await_count, 4)
+        self.assertEqual(self.ocr_cache.stats()["problem"]["hits"], 0)
+
+    async def test_answers_skip_the_perceptual_cache(self):
+        """Test that a retaken answer photo is always read again, even when it looks identical."""
+        self.mock_llm.complete.return_value = json.dumps({"answer_text": "x = 4"})
+        await self.processor.process_image(self.image_bytes, mode="answer")
+        self.mock_llm.complete.return_value = json.dumps({"answer_text": "x = 5"})
+        result = await self.processor.process_image(self.image_bytes, mode="answer")
+
+        self.assertEqual(result["answer_text"], "x = 5")
+        self.assertEqual(self.mock_llm.complete.await_count, 2)
+        self.assertNotIn("answer", self.ocr_cache.stats())
+
+    def test_hash_cache_eviction(self):
+        """Test that the least recently used hash is evicted when full."""
+        cache = PerceptualHashCache(max_entries=2, max_distance=0)
+        cache.put("problem", 0b01, {"problem_text": "a"})
+        cache.put("problem", 0b10, {"problem_text": "b"})
+        cache.get("problem", 0b01)
+        cache.put("problem", 0b11, {"problem_text": "c"})
+
+        self.assertIsNone(cache.get("problem", 0b10))
+        self.assertEqual(cache.get("problem", 0b01)["problem_text"], "a")
+        self.assertEqual(cache.stats()["problem"]["evictions"], 1)
+
+def photo_of_page(writing: Image.Image, page_size=(4000, 3000), offset=(2100, 1700)) -> Image.Image:
+    """A large noisy page with the writing occupying a small part of it."""
+    rng = np.random.default_rng(0)
+    page = Image.fromarray(np.clip(rng.normal(180, 4, page_size[::-1]), 0, 255).astype(np.uint8))
+    page.paste(writing, offset)
+    return page
+
+class TestContentPreprocessor(unittest.TestCase):
+    def setUp(self):
+        with Image.open(os.path.join(TEST_IMAGES_DIR, '4.jpeg')) as img:
+            self.writing = img.convert('L')
+        self.preprocessor = ContentPreprocessor()
+
+    def test_crops_to_writing(self):
+        """Test that a small equation on a large page is found and cropped to."""
+        page = photo_of_page(self.writing)
+        left, top, right, bottom = self.preprocessor.find_content_box(page)
+
+        # The writing sits inside the pasted region, well away from its edges
+        self.assertGreaterEqual(left, 2100)
+        self.assertGreaterEqual(top, 1700)
+        self.assertLessEqual(right, 2100 + self.writing.width)
+        self.assertLessEqual(bottom, 1700 + self.writing.height)
+        self.assertGreater(right - left, self.writing.width // 2)
+
+    def test_blank_page_is_left_alone(self):
+        page = Image.new('L', (800, 600), 200)
+        self.assertIsNone(self.preprocessor.find_content_box(page))
+        self.assertIs(self.preprocessor.crop_to_content(page), page)
+
+    def test_estimates_skew(self):
+        """Test that the skew estimate undoes a rotation to within a degree."""
+        with Image.open(os.path.join(TEST_IMAGES_DIR, '6.jpeg')) as img:
+            writing = img.convert('L')
+        baseline = self.preprocessor.estimate_skew(writing)
+        for angle in (-5, 4):
+            with writing.rotate(angle, expand=True, fillcolor=180) as rotated:
+                self.assertAlmostEqual(self.preprocessor.estimate_skew(rotated), baseline - angle, delta=1.0)
+
+    def test_stretch_contrast(self):
+        flat = Image.fromarray(np.linspace(100, 160, 256 * 16).astype(np.uint8).reshape(64, 64))
+        with self.preprocessor.stretch_contrast(flat) as stretched:
+            low, high = stretched.getextrema()
+        self.assertLess(low, 10)
+        self.assertGreater(high, 245)
+
+    def test_processor_sends_cropped_writing(self):
+        """Test that the encoded image spends its pixels on the writing, not the page."""
+        page = photo_of_page(self.writing)
+        cropping = ImageProcessor(llm=MagicMock(), ocr_cache=PerceptualHashCache(), preprocessor=self.preprocessor)
+        plain = ImageProcessor(llm=MagicMock(), ocr_cache=PerceptualHashCache(),
+                               preprocessor=ContentPreprocessor(crop=False))
+
+        with Image.open(BytesIO(base64.b64decode(cropping.encode_image_to_base64(page)))) as img:
+            cropped_size = img.size
+        with Image.open(BytesIO(base64.b64decode(plain.encode_image_to_base64(page)))) as img:
+            plain_size = img.size
+
+        self.assertEqual(plain_size, (400, 300))
+        self.assertEqual(max(cropped_size), 400)
+        # The equation is wide and short, so it is no longer framed 4:3
+        self.assertGreater(cropped_size[0] / cropped_size[1], 3)
+
+class TestImageQualityGate(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        with Image.open(TEST_IMAGE) as img:
+            self.photo = img.convert('RGB')
+        self.mock_llm = MagicMock()
+        self.mock_llm.complete = AsyncMock(return_value=json.dumps({"problem_text": "2x + 5 = 15"}))
+        self.processor = ImageProcessor(llm=self.mock_llm, ocr_cache=PerceptualHashCache(),
+                                        quality_gate=ImageQualityGate())
+
+    async def assert_rejected(self, image: Image.Image, issue: str):
+        result = await self.processor.process_image(image, mode="problem")
+        self.assertEqual(result["quality"]["issue"], issue)
+        self.assertFalse(result["quality"]["passed"])
+        self.assertEqual(result["error"], result["quality"]["message"])
+        self.assertIn("blur_score", result["quality"]["scores"])
+        self.mock_llm.complete.assert_not_awaited()
+
+    async def test_readable_photos_pass(self):
+        for name in sorted(os.listdir(TEST_IMAGES_DIR)):
+            with self.subTest(image=name):
+                result = await self.processor.process_image(os.path.join(TEST_IMAGES_DIR, name), mode="problem")
+                self.assertNotIn("error", result)
+
+    async def test_blurry_photo_is_rejected(self):
+        await self.assert_rejected(self.photo.filter(ImageFilter.GaussianBlur(3)), "blurry")
+
+    async def test_dark_photo_is_rejected(self):
+        await self.assert_rejected(ImageEnhance.Brightness(self.photo).enhance(0.15), "too_dark")
+
+    async def test_blank_photo_is_rejected(self):
+        rng = np.random.default_rng(0)
+        blank = Image.fromarray(np.clip(rng.normal(180, 4, (600, 800)), 0, 255).astype(np.uint8))
+        await self.assert_rejected(blank, "low_contrast")
+
+    async def test_gate_can_be_disabled(self):
+        processor = ImageProcessor(llm=self.mock_llm, ocr_cache=PerceptualHashCache(),
+                                   quality_gate=ImageQualityGate(enabled=False))
+        result = await processor.process_image(self.photo.filter(ImageFilter.GaussianBlur(3)), mode="problem")
+        self.assertEqual(result["problem_text"], "2x + 5 = 15")
+
+# Two columns of numbered problems; the second is written over two lines
+WORKSHEET = [
+    [((80, 100), "1. 2x + 5 = 15")],
+    [((80, 400), "2. Solve for n:"), ((80, 460), "2(n + 3) = 4n - 2")],
+    [((900, 100), "3. x^2 - 5x + 6 = 0")],
+    [((900, 400), "4. 3(y - 1) = 12")]
+]
+
+def worksheet_photo() -> bytes:
+    page = Image.new('L', (1600, 1200), 235)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=40)
+    for problem in WORKSHEET:
+        for xy, text in problem:
+            draw.text(xy, text, fill=20, font=font)
+    buffer = BytesIO()
+    page.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+class TestWorksheetSegmentation(unittest.IsolatedAsyncioTestCase):
+    def test_segments_problems_in_reading_order(self):
+        """Test that each problem gets one box, columns first, multi-line problems kept whole."""
+        with Image.open(BytesIO(worksheet_photo())) as page:
+            boxes = ContentPreprocessor().segment(page.convert('L'))
+
+        self.assertEqual(len(boxes), len(WORKSHEET))
+        for (left, top, right, bottom), problem in zip(boxes, WORKSHEET):
+            for (x, y), _ in problem:
+                self.assertTrue(left <= x + 20 <= right and top <= y + 20 <= bottom)
+
+    async def test_problems_are_extracted_concurrently(self):
+        """Test that every crop gets its own vision call and unreadable crops are dropped."""
+        replies = iter([
+            {"problem_text": "2x + 5 = 15", "problem_type": "linear_equation"},
+            {"problem_text": "2(n + 3) = 4n - 2", "problem_type": "linear_equation"},
+            {"problem_text": ""},
+            {"problem_text": "3(y - 1) = 12", "problem_type": "linear_equation"}
+        ])
+        in_flight, peak = 0, 0
+
+        async def complete(**kwargs):
+            nonlocal in_flight, peak
+            reply = json.dumps(next(replies))
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return reply
+
+        mock_llm = MagicMock()
+        mock_llm.complete = complete
+        processor = ImageProcessor(llm=mock_llm, ocr_cache=PerceptualHashCache())
+        result = await processor.process_worksheet(worksheet_photo(), max_concurrency=2)
+
+        self.assertEqual(result["segments"], 4)
+        self.assertEqual([p["problem_text"] for p in result["problems"]],
+                         ["2x + 5 = 15", "2(n + 3) = 4n - 2", "3(y - 1) = 12"])
+        self.assertEqual([p["index"] for p in result["problems"]], [0, 1, 2])
+        self.assertEqual(peak, 2)
+
+if __name__ == '__main__':
+    unittest.main()
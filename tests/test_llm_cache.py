@@ -0,0 +1,154 @@
+import unittest
+import asyncio
+from unittest.mock import MagicMock, AsyncMock, patch
+import os
+import tempfile
+import time
+from utils.llm_cache import LLMCache
+from utils.llm_gateway import LLMGateway
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "cache.db")
+        self.messages = [{"role": "system", "content": "Solve 2x + 5 = 15"}]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_depends_on_model_prompt_and_params(self):
+        """Test that keys are content-addressed."""
+        key = LLMCache.make_key("llama3-70b-8192", self.messages, {"temperature": 0.1})
+        self.assertEqual(key, LLMCache.make_key("llama3-70b-8192", self.messages, {"temperature": 0.1}))
+        self.assertNotEqual(key, LLMCache.make_key("mixtral-8x7b-32768", self.messages, {"temperature": 0.1}))
+        self.assertNotEqual(key, LLMCache.make_key("llama3-70b-8192", self.messages, {"temperature": 0}))
+
+    def test_disk_tier_survives_restart(self):
+        """Test that entries are read back from SQLite by a new cache instance."""
+        cache = LLMCache(db_path=self.db_path)
+        cache.set("scaffolding", "k1", '{"steps": []}')
+        self.assertEqual(cache.get("scaffolding", "k1"), '{"steps": []}')
+        cache.close()
+
+        reopened = LLMCache(db_path=self.db_path)
+        self.assertEqual(reopened.get("scaffolding", "k1"), '{"steps": []}')
+        self.assertEqual(reopened.get("scaffolding", "k1"), '{"steps": []}')
+        counters = reopened.stats()["namespaces"]["scaffolding"]
+        self.assertEqual(counters["disk_hits"], 1)
+        self.assertEqual(counters["memory_hits"], 1)
+        reopened.close()
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are treated as misses."""
+        cache = LLMCache(db_path=self.db_path, ttls={"answer_validation": 10})
+        with patch("utils.llm_cache.time.time", return_value=1000.0):
+            cache.set("answer_validation", "k1", "value")
+        with patch("utils.llm_cache.time.time", return_value=1005.0):
+            self.assertEqual(cache.get("answer_validation", "k1"), "value")
+        with patch("utils.llm_cache.time.time", return_value=1011.0):
+            self.assertIsNone(cache.get("answer_validation", "k1"))
+        self.assertEqual(cache.stats()["disk_bytes"], 0)
+        cache.close()
+
+    def test_memory_tier_lru_eviction(self):
+        """Test that the least recently used entries are evicted past the byte limit."""
+        cache = LLMCache(memory_max_bytes=10)
+        cache.set("scaffolding", "a", "aaaa")
+        cache.set("scaffolding", "b", "bbbb")
+        cache.get("scaffolding", "a")
+        cache.set("scaffolding", "c", "cccc")
+
+        self.assertLessEqual(cache.stats()["memory_bytes"], 10)
+        self.assertEqual(cache.get("scaffolding", "a"), "aaaa")
+        self.assertIsNone(cache.get("scaffolding", "b"))
+        self.assertEqual(cache.stats()["namespaces"]["scaffolding"]["evictions"], 1)
+
+    def test_disk_tier_size_limit(self):
+        """Test that the disk tier stays under its byte limit."""
+        cache = LLMCache(db_path=self.db_path, memory_max_bytes=4, disk_max_bytes=10)
+        now = time.time()
+        for offset, key in enumerate(["a", "b", "c"]):
+            with patch("utils.llm_cache.time.time", return_value=now + offset):
+                cache.set("scaffolding", key, key * 4)
+        cache.close()
+
+        reopened = LLMCache(db_path=self.db_path)
+        self.assertLessEqual(reopened.stats()["disk_bytes"], 10)
+        self.assertIsNone(reopened.get("scaffolding", "a"))
+        self.assertEqual(reopened.get("scaffolding", "c"), "cccc")
+        reopened.close()
+
+    def test_evictions_are_counted_against_the_evicted_namespace(self):
+        """Test that a set which evicts another module's entry counts the eviction for that module."""
+        cache = LLMCache(db_path=self.db_path, memory_max_bytes=6, disk_max_bytes=6)
+        now = time.time()
+        with patch("utils.llm_cache.time.time", return_value=now):
+            cache.set("scaffolding", "a", "aaaa")
+        with patch("utils.llm_cache.time.time", return_value=now + 1):
+            cache.set("answer_validation", "b", "bbbb")
+
+        namespaces = cache.stats()["namespaces"]
+        # One eviction from each tier, both of the scaffolding entry
+        self.assertEqual(namespaces["scaffolding"]["evictions"], 2)
+        self.assertEqual(namespaces["answer_validation"]["evictions"], 0)
+        cache.close()
+
+class TestGatewayCaching(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gateway = LLMGateway(api_key="test-key", cache=LLMCache())
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = '{"is_correct": true}'
+        self.create = AsyncMock(return_value=mock_response)
+        self.gateway._client = MagicMock()
+        self.gateway._client.chat.completions.create = self.create
+
+    async def test_cached_namespace_skips_second_call(self):
+        """Test that identical cacheable prompts hit the provider once."""
+        for _ in range(3):
+            result = await self.gateway.complete(
+                model="mixtral-8x7b-32768",
+                messages=[{"role": "user", "content": "x=4 vs x = 4"}],
+                temperature=0.1,
+                cache_namespace="answer_validation"
+            )
+            self.assertEqual(result, '{"is_correct": true}')
+        self.assertEqual(self.create.await_count, 1)
+
+    async def test_personalized_prompts_are_not_cached(self):
+        """Test that calls without a namespace always reach the provider."""
+        for _ in range(2):
+            await self.gateway.complete(
+                model="mixtral-8x7b-32768",
+                messages=[{"role": "system", "content": "feedback for this student"}]
+            )
+        self.assertEqual(self.create.await_count, 2)
+
+    async def test_cache_check_rejects_bad_responses(self):
+        """Test that responses failing cache_check are not stored."""
+        for _ in range(2):
+            await self.gateway.complete(
+                model="llama3-70b-8192",
+                messages=[{"role": "system", "content": "scaffold"}],
+                cache_namespace="scaffolding",
+                cache_check=lambda content: False
+            )
+        self.assertEqual(self.create.await_count, 2)
+
+    async def test_disk_cache_is_used_off_the_event_loop(self):
+        """Test that SQLite reads and writes run in a worker thread."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.gateway.cache = LLMCache(db_path=os.path.join(tmpdir, "cache.db"))
+            with patch("utils.llm_cache.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+                for _ in range(2):
+                    await self.gateway.complete(
+                        model="mixtral-8x7b-32768",
+                        messages=[{"role": "user", "content": "x=4 vs x = 4"}],
+                        cache_namespace="answer_validation"
+                    )
+            self.assertEqual(self.create.await_count, 1)
+            self.assertEqual([c.args[0].__name__ for c in to_thread.call_args_list], ["get", "set", "get"])
+            self.gateway.cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+import os
+import tempfile
+from utils.llm_cassette import Cassette, CassetteMiss
+from utils.llm_gateway import LLMGateway
+
+MESSAGES = [{"role": "system", "content": "Analyze: 2x + 5 = 15"}]
+
+def mock_client(content):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.usage.prompt_tokens = 12
+    response.usage.completion_tokens = 4
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=response)
+    return client
+
+class TestLLMCassette(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cassette.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def test_record_then_replay(self):
+        """Test that a recorded response replays without touching the provider."""
+        recorder = LLMGateway(api_key="test-key", cassette=Cassette(self.path, mode="record"))
+        recorder._client = mock_client('{"problem_type": "linear_equation"}')
+        recorded = await recorder.complete(model="mixtral-8x7b-32768", messages=MESSAGES, temperature=0)
+
+        player = LLMGateway(api_key="test-key", cassette=Cassette(self.path))
+        player._client = mock_client("should not be used")
+        replayed = await player.complete(model="mixtral-8x7b-32768", messages=MESSAGES, temperature=0)
+        streamed = "".join([chunk async for chunk in player.stream(
+            model="mixtral-8x7b-32768", messages=MESSAGES, temperature=0
+        )])
+
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(streamed, recorded)
+        player._client.chat.completions.create.assert_not_awaited()
+
+    async def test_replay_miss_raises(self):
+        """Test that replay mode refuses requests it has no recording for."""
+        gateway = LLMGateway(api_key="test-key", cassette=Cassette(self.path))
+        gateway._client = mock_client("live")
+        with self.assertRaises(CassetteMiss):
+            await gateway.complete(model="mixtral-8x7b-32768", messages=MESSAGES, temperature=0)
+        gateway._client.chat.completions.create.assert_not_awaited()
+
+    def test_keys_match_on_model_and_prompt(self):
+        key = Cassette.key("llama3-70b-8192", MESSAGES, {"temperature": 0.1})
+        self.assertEqual(key, Cassette.key("llama3-70b-8192", MESSAGES, {"temperature": 0.1, "stream": True}))
+        self.assertNotEqual(key, Cassette.key("mixtral-8x7b-32768", MESSAGES, {"temperature": 0.1}))
+        self.assertNotEqual(key, Cassette.key("llama3-70b-8192", MESSAGES, {"temperature": 0.2}))
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Cassette(self.path, mode="rewind")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from utils.llm_gateway import LLMGateway
+
+class TestLLMGateway(unittest.IsolatedAsyncioTestCase):
+    async def test_complete_returns_content(self):
+        """Test that completions are routed through the shared client."""
+        gateway = LLMGateway(api_key="test-key")
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = '{"ok": true}'
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+        gateway._client = mock_client
+
+        result = await gateway.complete(
+            model="llama3-70b-8192",
+            messages=[{"role": "user", "content": "hi"}],
+            temperature=0.1
+        )
+
+        self.assertEqual(result, '{"ok": true}')
+        mock_client.chat.completions.create.assert_awaited_once_with(
+            model="llama3-70b-8192",
+            messages=[{"role": "user", "content": "hi"}],
+            temperature=0.1
+        )
+
+    async def test_client_is_pooled_and_shared(self):
+        """Test that the lazily built client is reused and bounded."""
+        gateway = LLMGateway(api_key="test-key", max_connections=10, max_keepalive_connections=5)
+        client = gateway.client
+        self.assertIs(client, gateway.client)
+
+        pool = client._client._transport._pool
+        self.assertEqual(pool._max_connections, 10)
+        self.assertEqual(pool._max_keepalive_connections, 5)
+
+        await gateway.aclose()
+        self.assertIsNone(gateway._client)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+import httpx
+from groq import RateLimitError
+from modules.scaffolding.engine import ScaffoldingEngine
+from utils.llm_gateway import LLMGateway
+from utils.llm_scheduler import LLMScheduler, RateLimitExceeded, TokenBucket, estimate_tokens, parse_limits
+from utils.metrics import FALLBACKS, LLM_RATE_LIMITED
+
+def rate_limit_error(retry_after: str = "0.05") -> RateLimitError:
+    request = httpx.Request("POST", "http://groq/openai/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+def completion(content: str = "ok", total_tokens: int = 50) -> MagicMock:
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.usage.prompt_tokens = total_tokens - 10
+    response.usage.completion_tokens = 10
+    response.usage.total_tokens = total_tokens
+    return response
+
+def stream_chunk(content: str, total_tokens=None) -> MagicMock:
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = content
+    chunk.x_groq = None
+    if total_tokens is not None:
+        chunk.x_groq = MagicMock()
+        chunk.x_groq.usage.prompt_tokens = total_tokens - 10
+        chunk.x_groq.usage.completion_tokens = 10
+        chunk.x_groq.usage.total_tokens = total_tokens
+    return chunk
+
+async def chunk_stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+def gateway_with(scheduler: LLMScheduler, side_effect) -> LLMGateway:
+    gateway = LLMGateway(api_key="test-key", cache=None, scheduler=scheduler)
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=side_effect)
+    gateway._client = mock_client
+    return gateway
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_for_refill_and_allows_overdraw(self):
+        bucket = TokenBucket(per_minute=60)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_time(60, now), 0.0)
+        bucket.take(90, now)
+        # 30 tokens of debt plus the 1 asked for, at one token a second
+        self.assertAlmostEqual(bucket.wait_time(1, now), 31.0)
+        self.assertAlmostEqual(bucket.wait_time(1, now + 31.0), 0.0)
+        bucket.credit(1000, now + 31.0)
+        self.assertEqual(bucket.level, 60)
+
+    def test_parse_limits_and_estimate(self):
+        self.assertEqual(parse_limits("llama3-70b-8192=30:6000, *=60:"),
+                         {"llama3-70b-8192": (30.0, 6000.0), "*": (60.0, None)})
+        messages = [{"role": "user", "content": [{"type": "text", "text": "x" * 40}, {"type": "image_url"}]}]
+        self.assertEqual(estimate_tokens(messages, {"max_tokens": 200}), 210)
+
+class TestLLMScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_waiting_calls_go_out_in_priority_order(self):
+        """Test that after a 429 hold, interactive calls are admitted before scaffolding and background work."""
+        scheduler = LLMScheduler()
+        scheduler.rate_limited("m", retry_after=0.05)
+        order = []
+
+        async def call(name: str, priority: int):
+            await scheduler.acquire("m", priority, tokens=10)
+            order.append(name)
+
+        tasks = [asyncio.create_task(call("reinforcement", 2)), asyncio.create_task(call("scaffolding", 1)),
+                 asyncio.create_task(call("validation", 0))]
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.queue_depths(), {("m", "0"): 1, ("m", "1"): 1, ("m", "2"): 1})
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["validation", "scaffolding", "reinforcement"])
+        self.assertEqual(scheduler.queue_depths(), {})
+
+    async def test_request_budget_spaces_out_calls(self):
+        scheduler = LLMScheduler(limits={"*": (1200, None)})
+        start = time.monotonic()
+        for _ in range(1202):
+            await scheduler.acquire("m", 1, tokens=0)
+        # The burst of one minute's requests is free, the next two wait 50 ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    async def test_waiting_too_long_raises(self):
+        scheduler = LLMScheduler(max_wait=0.02)
+        scheduler.rate_limited("m", retry_after=5)
+        with self.assertRaises(RateLimitExceeded):
+            await scheduler.acquire("m", 0, tokens=10)
+        self.assertEqual(scheduler.queue_depths(), {})
+
+class TestGatewayScheduling(unittest.IsolatedAsyncioTestCase):
+    async def test_429_is_retried_after_retry_after(self):
+        """Test that a 429 holds the model for its Retry-After and the call then succeeds."""
+        scheduler = LLMScheduler(limits={"m": (None, 1000)})
+        gateway = gateway_with(scheduler, [rate_limit_error("0.05"), completion(total_tokens=50)])
+        limited_before = LLM_RATE_LIMITED.value(model="m")
+
+        start = time.monotonic()
+        result = await gateway.complete(model="m", messages=[{"role": "user", "content": "x" * 400}],
+                                        module="answer_validation", max_tokens=100)
+
+        self.assertEqual(result, "ok")
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(gateway.client.chat.completions.create.await_count, 2)
+        self.assertEqual(LLM_RATE_LIMITED.value(model="m") - limited_before, 1)
+        # The rejected attempt's 200-token estimate was refunded, and the retry's settled to the 50 used
+        self.assertAlmostEqual(scheduler._queue("m").tokens.level, 950, delta=5)
+
+    async def test_exhausted_retries_refund_every_estimate(self):
+        """Test that repeated 429s do not drain the token bucket."""
+        scheduler = LLMScheduler(limits={"m": (None, 1000)}, max_retries=2)
+        gateway = gateway_with(scheduler, rate_limit_error("0.01"))
+        with self.assertRaises(RateLimitExceeded):
+            await gateway.complete(model="m", messages=[{"role": "user", "content": "x" * 400}],
+                                   module="answer_validation", max_tokens=100)
+        self.assertEqual(gateway.client.chat.completions.create.await_count, 3)
+        self.assertAlmostEqual(scheduler._queue("m").tokens.level, 1000, delta=5)
+
+    async def test_streams_are_settled_when_they_end(self):
+        """Test that a stream's estimate is corrected by its final usage, or by what was streamed if cut short."""
+        messages = [{"role": "user", "content": "x" * 400}]
+        scheduler = LLMScheduler(limits={"m": (None, 1000)})
+        gateway = gateway_with(scheduler, [chunk_stream([stream_chunk("o"), stream_chunk("k", total_tokens=50)])])
+        streamed = [delta async for delta in gateway.stream(model="m", messages=messages, max_tokens=100)]
+        self.assertEqual(streamed, ["o", "k"])
+        # 200 estimated tokens taken, settled to the 50 reported on the final chunk
+        self.assertAlmostEqual(scheduler._queue("m").tokens.level, 950, delta=5)
+
+        scheduler = LLMScheduler(limits={"m": (None, 1000)})
+        gateway = gateway_with(scheduler, [chunk_stream([stream_chunk("a" * 40), stream_chunk("b" * 40)])])
+        stream = gateway.stream(model="m", messages=messages, max_tokens=100)
+        await stream.__anext__()
+        await stream.aclose()
+        # No usage arrived: 100 prompt tokens plus 10 for the one delta streamed
+        self.assertAlmostEqual(scheduler._queue("m").tokens.level, 890, delta=5)
+
+    async def test_scaffolding_reports_rate_limited_fallbacks(self):
+        """Test that exhausted 429 retries are counted as rate-limit fallbacks, not silent errors."""
+        scheduler = LLMScheduler(max_retries=1)
+        gateway = gateway_with(scheduler, rate_limit_error("0.01"))
+        engine = ScaffoldingEngine(llm=gateway)
+        before = FALLBACKS.value(module="scaffolding", reason="rate_limited")
+
+        scaffolding = await engine.generate_scaffolding(
+            "word_problem", "", "", "Twice a number plus 5 is 15. What is the number?"
+        )
+
+        self.assertEqual(len(scaffolding), 1)
+        self.assertEqual(gateway.client.chat.completions.create.await_count, 2)
+        self.assertEqual(FALLBACKS.value(module="scaffolding", reason="rate_limited") - before, 1)
+
+if __name__ == '__main__':
+    unittest.main()
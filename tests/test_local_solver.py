@@ -0,0 +1,73 @@
+import unittest
+from modules.scaffolding.local_solver import LocalSolver
+from utils.math_equivalence import check_equivalence
+
+class TestLocalSolver(unittest.TestCase):
+    def setUp(self):
+        self.solver = LocalSolver()
+
+    def final_answer(self, problem):
+        return self.solver.solve(problem)["steps"][-1]["expected_answer"]
+
+    def test_linear_equation(self):
+        """Test that linear equations are solved exactly, step by step."""
+        steps = self.solver.solve("Solve for x: 3(x - 2) = 2x + 4")["steps"]
+        self.assertEqual([step["expected_answer"].split("|")[0] for step in steps],
+                         ["3x - 6 = 2x + 4", "x - 6 = 4", "x = 10"])
+        self.assertTrue(check_equivalence(self.final_answer("4x + 1 = 3"), "x = 1/2"))
+
+    def test_variable_only_on_the_right(self):
+        """Test that the variable is isolated on its own side instead of dividing by a negative."""
+        for problem, expected in [("3 = 3x", ["x = 1"]), ("5 = x + 2", ["x = 3"]),
+                                  ("x + 1 = 3x", ["1 = 2x", "x = 1/2"])]:
+            steps = self.solver.solve(problem)["steps"]
+            self.assertEqual([step["expected_answer"].split("|")[0] for step in steps], expected, problem)
+            self.assertFalse(any("-" in step["instruction"] for step in steps), problem)
+
+    def test_quadratic_equation(self):
+        """Test rational, irrational and complex roots."""
+        self.assertTrue(check_equivalence(self.final_answer("2x^2 + 3x = 2"), "x = 1/2, x = -2"))
+        self.assertTrue(check_equivalence(self.final_answer("x^2 + 2x - 1 = 0"),
+                                          "x = -1 + sqrt(2), x = -1 - sqrt(2)"))
+        self.assertIn("no real solutions", self.final_answer("x^2 + 1 = 0"))
+
+    def test_roots_are_simplified(self):
+        """Test that surds and factors are shown in simplest form."""
+        self.assertEqual(self.final_answer("x^2 - 8 = 0").split("|")[0], "x = 2sqrt(2), x = -2sqrt(2)")
+        self.assertEqual(self.final_answer("x^2 + x - 1 = 0").split("|")[0],
+                         "x = -1/2 + sqrt(5)/2, x = -1/2 - sqrt(5)/2")
+        factored = [step["expected_answer"].split("|")[0] for step in self.solver.solve("x^2 + 2x = 0")["steps"]]
+        self.assertIn("x(x + 2) = 0", factored)
+        factored = [step["expected_answer"].split("|")[0] for step in self.solver.solve("x^2 - 6x + 9 = 0")["steps"]]
+        self.assertIn("(x - 3)^2 = 0", factored)
+
+    def test_system_of_equations(self):
+        """Test that 2x2 systems are solved by elimination."""
+        answer = self.final_answer("Solve the system: 3x + 2y = 12 and 2x - y = 1")
+        self.assertTrue(check_equivalence(answer, "x = 2, y = 3"))
+        self.assertIsNone(self.solver.solve("2x + 3y = 6, 4x + 6y = 12"))
+
+    def test_steps_are_valid_against_their_own_answers(self):
+        """Test that every expected answer is accepted by the local validator."""
+        for problem in ["5 = 2x + 1", "x^2 - 5x + 6 = 0", "x + y = 5; x - y = 1"]:
+            for step in self.solver.solve(problem)["steps"]:
+                self.assertTrue(check_equivalence(step["expected_answer"],
+                                                  step["expected_answer"].split("|")[0]), step)
+
+    def test_word_problems_are_left_to_the_llm(self):
+        """Test that prose, identities and unsupported problems return None."""
+        self.assertIsNone(self.solver.solve("John has 5 apples and buys x more, now he has 12. How many?"))
+        self.assertIsNone(self.solver.solve("2x + 3 = 2x + 3"))
+        self.assertIsNone(self.solver.solve("y = 2x + 1"))
+        self.assertIsNone(self.solver.solve("1/x = 2"))
+
+    def test_problems_asking_for_more_than_the_solution_are_left_to_the_llm(self):
+        """Test that only instruction words are allowed around the equation."""
+        for problem in ["If 2x + 3 = 7, find 4x + 1.", "Given 2x + 3 = 7, evaluate x^2",
+                        "Verify that x = 3 satisfies 2x = 6", "2x + 3 = 7, find x + 1"]:
+            self.assertIsNone(self.solver.solve(problem), problem)
+        for problem in ["Find x: 2x + 3 = 7", "Find the value of x: 2x + 3 = 7", "Solve for x: 2x + 3 = 7"]:
+            self.assertTrue(check_equivalence(self.final_answer(problem), "x = 2"), problem)
+
+if __name__ == '__main__':
+    unittest.main()
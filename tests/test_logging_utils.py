@@ -0,0 +1,117 @@
+import unittest
+from unittest.mock import patch
+import logging
+import os
+import queue
+import tempfile
+from utils import logging_utils
+from utils.logging_utils import LazyQueueHandler, log_payload, setup_logger
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class TestLoggingUtils(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmpdir.name, "logs", "test.log")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_async_logger_writes_through_listener(self):
+        """Test that queued records reach the rotating file once flushed."""
+        with patch.object(logging_utils, "LOG_ASYNC", True), patch.object(logging_utils, "LOG_LEVEL", "DEBUG"):
+            logger = setup_logger("test_async_logger", self.log_file)
+        self.assertIsInstance(logger.handlers[0], LazyQueueHandler)
+
+        logger.debug("Solved %s in %d steps", "2x + 5 = 15", 2)
+        # Stopping the listener flushes everything still queued
+        listener = logging_utils._listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+        with open(self.log_file) as f:
+            self.assertIn("Solved 2x + 5 = 15 in 2 steps", f.read())
+
+    def test_formatting_is_deferred(self):
+        """Test that the caller's thread does not format the message."""
+        log_queue = queue.SimpleQueue()
+        logger = logging.getLogger("test_lazy_handler")
+        logger.handlers = [LazyQueueHandler(log_queue)]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+
+        logger.info("Raw response: %s", "{...}")
+        record = log_queue.get_nowait()
+        self.assertEqual(record.msg, "Raw response: %s")
+        self.assertEqual(record.getMessage(), "Raw response: {...}")
+
+    def test_mutable_arguments_are_formatted_up_front(self):
+        """Test that a payload changed after logging is written as it was when logged."""
+        log_queue = queue.SimpleQueue()
+        logger = logging.getLogger("test_lazy_handler_mutable")
+        logger.handlers = [LazyQueueHandler(log_queue)]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+
+        payload = {"steps": ["2x = 10"]}
+        logger.info("Steps: %s", payload)
+        payload["steps"].append("x = 5")
+        record = log_queue.get_nowait()
+        self.assertEqual(record.getMessage(), "Steps: {'steps': ['2x = 10']}")
+        self.assertIsNone(record.args)
+
+    def test_payloads_are_sampled(self):
+        """Test that full payloads are only logged when sampled or on error."""
+        logger = logging.getLogger("test_payload_logger")
+        recorder = Recorder()
+        logger.handlers = [recorder]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        payload = "x" * 5000
+
+        with patch.object(logging_utils, "LOG_PAYLOAD_SAMPLE_RATE", 0.0):
+            log_payload(logger, "Raw API response", payload)
+            log_payload(logger, "Invalid JSON", payload, error=True)
+        with patch.object(logging_utils, "LOG_PAYLOAD_SAMPLE_RATE", 1.0):
+            log_payload(logger, "Raw API response", payload)
+
+        messages = [record.getMessage() for record in recorder.records]
+        self.assertEqual(messages[0], "Raw API response: <5000 chars, not sampled>")
+        self.assertIn(payload, messages[1])
+        self.assertEqual(recorder.records[1].levelno, logging.ERROR)
+        self.assertIn(payload, messages[2])
+
+    def test_disabled_level_skips_payload(self):
+        """Test that nothing is built for unsampled calls when the level is disabled."""
+        logger = logging.getLogger("test_payload_disabled")
+        recorder = Recorder()
+        logger.handlers = [recorder]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+
+        with patch.object(logging_utils, "LOG_PAYLOAD_SAMPLE_RATE", 0.0):
+            log_payload(logger, "Using prompt", "prompt text")
+        self.assertEqual(recorder.records, [])
+
+    def test_samples_are_captured_at_the_default_level(self):
+        """Test that sampled payloads are logged at INFO, so LOG_LEVEL=INFO still captures them."""
+        logger = logging.getLogger("test_payload_info")
+        recorder = Recorder()
+        logger.handlers = [recorder]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+
+        with patch.object(logging_utils, "LOG_PAYLOAD_SAMPLE_RATE", 1.0):
+            log_payload(logger, "Using prompt", "prompt text")
+        self.assertEqual([record.getMessage() for record in recorder.records], ["Using prompt: prompt text"])
+        self.assertEqual(recorder.records[0].levelno, logging.INFO)
+
+if __name__ == '__main__':
+    unittest.main()
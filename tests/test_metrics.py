@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from utils.llm_gateway import LLMGateway
+from utils.metrics import Counter, Histogram, MetricsRegistry, LLM_REQUESTS, LLM_TOKENS, gauge_lines
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that observations land in inclusive, cumulative buckets."""
+        histogram = Histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+        histogram.observe(0.1, stage="ocr")
+        histogram.observe(0.5, stage="ocr")
+        histogram.observe(3.0, stage="ocr")
+
+        lines = histogram.render()
+        self.assertIn('stage_seconds_bucket{stage="ocr",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="ocr",le="1.0"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="ocr",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_count{stage="ocr"} 3', lines)
+        self.assertEqual(histogram.count(stage="ocr"), 3)
+
+    def test_registry_renders_metrics_and_collectors(self):
+        """Test the text exposition of counters and scrape-time gauges."""
+        registry = MetricsRegistry()
+        counter = registry.counter("fallbacks_total", "Fallbacks", ["module"])
+        self.assertIs(counter, registry.counter("fallbacks_total", "Fallbacks", ["module"]))
+        counter.inc(module="scaffolding")
+        counter.inc(2, module="scaffolding")
+        registry.register_collector(
+            lambda: gauge_lines("cache_hit_ratio", "Hit ratio", {("problem",): 0.5}, ["mode"])
+        )
+
+        text = registry.render()
+        self.assertIn("# TYPE fallbacks_total counter", text)
+        self.assertIn('fallbacks_total{module="scaffolding"} 3', text)
+        self.assertIn("# TYPE cache_hit_ratio gauge", text)
+        self.assertIn('cache_hit_ratio{mode="problem"} 0.5', text)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("errors_total", "Errors", ["reason"])
+        counter.inc(reason='bad "json"')
+        self.assertEqual(counter.render(), ['errors_total{reason="bad \\"json\\""} 1'])
+
+class TestGatewayMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_tokens_and_outcomes_are_recorded(self):
+        """Test that provider usage and call outcomes are counted per module and model."""
+        gateway = LLMGateway(api_key="test-key", cache=None)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "ok"
+        response.usage.prompt_tokens = 120
+        response.usage.completion_tokens = 30
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=[response, RuntimeError("down")])
+        gateway._client = mock_client
+
+        labels = {"module": "metrics_test", "model": "test-model"}
+        prompt_before = LLM_TOKENS.value(kind="prompt", **labels)
+        completion_before = LLM_TOKENS.value(kind="completion", **labels)
+        ok_before = LLM_REQUESTS.value(outcome="ok", **labels)
+        error_before = LLM_REQUESTS.value(outcome="error", **labels)
+
+        messages = [{"role": "user", "content": "hi"}]
+        await gateway.complete(model="test-model", messages=messages, module="metrics_test")
+        with self.assertRaises(RuntimeError):
+            await gateway.complete(model="test-model", messages=messages, module="metrics_test")
+
+        self.assertEqual(LLM_TOKENS.value(kind="prompt", **labels) - prompt_before, 120)
+        self.assertEqual(LLM_TOKENS.value(kind="completion", **labels) - completion_before, 30)
+        self.assertEqual(LLM_REQUESTS.value(outcome="ok", **labels) - ok_before, 1)
+        self.assertEqual(LLM_REQUESTS.value(outcome="error", **labels) - error_before, 1)
+
+if __name__ == '__main__':
+    unittest.main()
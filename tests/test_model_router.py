@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from utils.llm_gateway import LLMGateway
+from utils.metrics import LLM_ESCALATIONS
+from utils.model_router import ModelRouter, estimate_difficulty, parse_tiers
+from utils.validation import AnswerValidator
+
+TIERS = {"answer_validation": ["small", "medium", "large"]}
+
+def completion(content: str) -> MagicMock:
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    return response
+
+class TestModelRouter(unittest.TestCase):
+    def test_difficulty_picks_the_starting_tier(self):
+        router = ModelRouter(tiers=TIERS)
+        self.assertEqual(router.route("answer_validation", "basic"), ["small", "medium", "large"])
+        self.assertEqual(router.route("answer_validation", "intermediate"), ["medium", "large"])
+        self.assertEqual(router.route("answer_validation", "advanced"), ["large"])
+        self.assertEqual(router.route("answer_validation"), ["small", "medium", "large"])
+        self.assertEqual(router.route("feedback", "basic", default="mixtral-8x7b-32768"), ["mixtral-8x7b-32768"])
+
+    def test_failing_and_slow_models_are_passed_over(self):
+        """Test that a cheaper model is skipped while it errors or answers slower than the next tier."""
+        router = ModelRouter(tiers=TIERS, min_samples=3)
+        for _ in range(3):
+            router.observe_outcome("small", ok=False)
+        self.assertEqual(router.route("answer_validation", "basic"), ["medium", "large"])
+
+        for _ in range(3):
+            router.observe_latency("medium", 4.0)
+            router.observe_latency("large", 1.0)
+        self.assertEqual(router.route("answer_validation", "basic"), ["large"])
+
+        # Once the recovery window has passed without calls, both models get traffic again
+        router.recovery_seconds = 0.0
+        self.assertEqual(router.route("answer_validation", "basic"), ["small", "medium", "large"])
+
+    def test_estimate_difficulty_and_parse_tiers(self):
+        self.assertEqual(estimate_difficulty("x = 4"), "basic")
+        self.assertEqual(estimate_difficulty("Twice a number plus 5 is 15. What is the number?"), "intermediate")
+        self.assertEqual(estimate_difficulty("A train leaves the station " * 12), "advanced")
+        self.assertEqual(parse_tiers("scaffolding=llama3-8b-8192, llama3-70b-8192;feedback="),
+                         {"scaffolding": ["llama3-8b-8192", "llama3-70b-8192"], "feedback": []})
+
+class TestGatewayRouting(unittest.IsolatedAsyncioTestCase):
+    def gateway(self, *contents: str) -> LLMGateway:
+        gateway = LLMGateway(api_key="test-key", cache=None, router=ModelRouter(tiers=TIERS))
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=[completion(c) for c in contents])
+        gateway._client = mock_client
+        return gateway
+
+    def models_called(self, gateway: LLMGateway):
+        return [call.kwargs["model"] for call in gateway.client.chat.completions.create.await_args_list]
+
+    async def test_trivial_validation_stays_on_the_cheapest_model(self):
+        gateway = self.gateway(json.dumps({"is_correct": True, "explanation": "ok"}))
+        result = await AnswerValidator(llm=gateway)._validate_with_llm("Solve for x", "x = 4", "four")
+        self.assertTrue(result["is_correct"])
+        self.assertEqual(self.models_called(gateway), ["small"])
+
+    async def test_rejected_output_escalates_to_the_next_tier(self):
+        """Test that only an output the caller rejects moves the call up a tier."""
+        gateway = self.gateway("I think it is right", json.dumps({"is_correct": False, "explanation": "no"}))
+        before = LLM_ESCALATIONS.value(module="answer_validation", model="small")
+
+        result = await AnswerValidator(llm=gateway)._validate_with_llm("Solve for x", "x = 4", "x = 5")
+
+        self.assertFalse(result["is_correct"])
+        self.assertEqual(self.models_called(gateway), ["small", "medium"])
+        self.assertEqual(LLM_ESCALATIONS.value(module="answer_validation", model="small") - before, 1)
+
+    async def test_provider_errors_do_not_escalate(self):
+        gateway = self.gateway()
+        gateway.client.chat.completions.create.side_effect = RuntimeError("down")
+        with self.assertRaises(RuntimeError):
+            await gateway.complete(model="large", messages=[{"role": "user", "content": "hi"}],
+                                   module="answer_validation", accept=lambda content: True)
+        self.assertEqual(self.models_called(gateway), ["small"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from benchmarks.prompt_sizes import prompt_sizes
+from utils.llm_gateway import LLMGateway
+from utils.metrics import PROMPT_REQUEST_SECONDS, PROMPT_REQUESTS, PROMPT_TOKENS
+from utils.prompts import PromptRegistry, PromptTemplate, parse_versions, prompts
+
+class TestPromptTemplate(unittest.TestCase):
+    def test_render_matches_str_format(self):
+        """Test that precompiled rendering gives exactly what str.format did."""
+        text = 'Solve {problem} for {variable}.\nReturn {{"answer": "..."}} for {problem}'
+        template = PromptTemplate("solve", 1, text)
+        values = {"problem": "2x + 5 = 15", "variable": "x"}
+
+        self.assertEqual(template.render(**values), text.format(**values))
+        self.assertEqual(template.fields, ("problem", "variable"))
+        self.assertEqual(template.label, "solve@v1")
+        self.assertEqual(template.static_text, 'Solve  for .\nReturn {"answer": "..."} for ')
+
+    def test_missing_and_unsupported_fields_are_rejected(self):
+        with self.assertRaises(KeyError):
+            PromptTemplate("solve", 1, "Solve {problem}").render()
+        with self.assertRaises(ValueError):
+            PromptTemplate("solve", 1, "Score {score:.2f}")
+        with self.assertRaises(ValueError):
+            PromptTemplate("solve", 1, "Solve {0}")
+
+class TestPromptRegistry(unittest.TestCase):
+    def test_default_pinned_and_explicit_versions(self):
+        """Test that the first version is the default until a pin or a later default overrides it."""
+        registry = PromptRegistry(pins={})
+        v1 = registry.register("hint", 1, "Give a hint for {problem}")
+        v2 = registry.register("hint", 2, "Hint: {problem}")
+        self.assertIs(registry.get("hint"), v1)
+        self.assertIs(registry.get("hint", version=2), v2)
+
+        pinned = PromptRegistry(pins={"hint": 2})
+        pinned.register("hint", 1, "Give a hint for {problem}")
+        pinned.register("hint", 2, "Hint: {problem}")
+        self.assertEqual(pinned.get("hint").version, 2)
+
+        registry.register("hint", 3, "{problem}?", default=True)
+        self.assertEqual(registry.get("hint").version, 3)
+        with self.assertRaises(KeyError):
+            registry.get("hint", version=9)
+        with self.assertRaises(KeyError):
+            registry.get("unknown")
+
+    def test_reregistering_a_version_needs_the_same_text(self):
+        registry = PromptRegistry(pins={})
+        first = registry.register("hint", 1, "Hint: {problem}")
+        self.assertEqual(registry.register("hint", 1, "Hint: {problem}").text, first.text)
+        with self.assertRaises(ValueError):
+            registry.register("hint", 1, "Different: {problem}")
+
+    def test_parse_versions(self):
+        self.assertEqual(parse_versions("scaffolding=2, answer_validation=1,"),
+                         {"scaffolding": 2, "answer_validation": 1})
+        self.assertEqual(parse_versions(""), {})
+
+    def test_module_prompts_are_interchangeable_across_versions(self):
+        """Test that every version of a module prompt takes the same fields, so a pin cannot break a caller."""
+        rows = prompt_sizes()
+        self.assertIn("scaffolding", {row["template"] for row in rows})
+        for name in {row["template"] for row in rows}:
+            fields = {tuple(sorted(row["fields"])) for row in rows if row["template"] == name}
+            self.assertEqual(len(fields), 1, name)
+        compacted = [row for row in rows if not row["default"]]
+        self.assertTrue(compacted)
+        self.assertTrue(all(row["saving_tokens"] > 0 for row in compacted))
+
+class TestTemplateMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_tokens_and_latency_are_recorded_per_template(self):
+        """Test that a call naming its template is counted under that template's version."""
+        gateway = LLMGateway(api_key="test-key", cache=None)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "ok"
+        response.usage.prompt_tokens = 90
+        response.usage.completion_tokens = 12
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(return_value=response)
+        gateway._client = mock_client
+
+        template = PromptTemplate("metrics_test", 2, "Hint: {problem}")
+        labels = {"template": "metrics_test", "version": 2, "model": "test-model"}
+        prompt_before = PROMPT_TOKENS.value(kind="prompt", **labels)
+        completion_before = PROMPT_TOKENS.value(kind="completion", **labels)
+        ok_before = PROMPT_REQUESTS.value(outcome="ok", **labels)
+        timed_before = PROMPT_REQUEST_SECONDS.count(**labels)
+
+        await gateway.complete(
+            model="test-model",
+            messages=[{"role": "user", "content": template.render(problem="x + 1 = 2")}],
+            template=template
+        )
+
+        self.assertEqual(PROMPT_TOKENS.value(kind="prompt", **labels) - prompt_before, 90)
+        self.assertEqual(PROMPT_TOKENS.value(kind="completion", **labels) - completion_before, 12)
+        self.assertEqual(PROMPT_REQUESTS.value(outcome="ok", **labels) - ok_before, 1)
+        self.assertEqual(PROMPT_REQUEST_SECONDS.count(**labels) - timed_before, 1)
+        # The template only labels metrics; it is not sent to the provider
+        self.assertNotIn("template", mock_client.chat.completions.create.await_args.kwargs)
+
+    def test_modules_use_the_registered_prompts(self):
+        from modules.scaffolding.engine import ScaffoldingEngine
+        engine = ScaffoldingEngine(llm=MagicMock())
+        self.assertIs(engine.scaffolding_prompt, prompts.get("scaffolding"))
+
+if __name__ == '__main__':
+    unittest.main()
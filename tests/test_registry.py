@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import MagicMock
+from utils.llm_gateway import LLMGateway
+from utils.registry import ComponentRegistry
+from utils.validation import AnswerValidator
+
+class TestComponentRegistry(unittest.TestCase):
+    def setUp(self):
+        self.llm = LLMGateway(api_key="test-key")
+        self.components = ComponentRegistry(llm=self.llm)
+
+    def test_components_are_built_on_first_use(self):
+        self.assertFalse(self.components.built("scaffolding_engine"))
+        engine = self.components.scaffolding_engine
+        self.assertTrue(self.components.built("scaffolding_engine"))
+        self.assertIn("scaffolding_engine", self.components.build_seconds)
+        self.assertIs(self.components.scaffolding_engine, engine)
+        self.assertFalse(self.components.built("image_processor"))
+
+    def test_components_share_one_gateway(self):
+        self.assertIs(self.components.problem_analyzer.llm, self.llm)
+        self.assertIs(self.components.scaffolding_engine.llm, self.llm)
+        self.assertIs(self.components.answer_validator.llm, self.llm)
+
+    def test_validator_builds_image_processor_once(self):
+        validator = AnswerValidator(llm=self.llm)
+        self.assertIsNone(validator._image_processor)
+        processor = validator.image_processor
+        self.assertIs(validator.image_processor, processor)
+        self.assertIs(processor.llm, self.llm)
+
+        injected = MagicMock()
+        self.assertIs(AnswerValidator(llm=self.llm, image_processor=injected).image_processor, injected)
+
+if __name__ == '__main__':
+    unittest.main()
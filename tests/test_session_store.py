@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+from modules.scaffolding.models import Scaffolding
+from utils.session_store import SessionStore
+
+def make_scaffolding():
+    return Scaffolding.from_dict({"steps": [
+        {"instruction": "Subtract 5", "expected_answer": "2x = 10",
+         "hint": "Undo the +5", "explanation": "Isolate x"},
+        {"instruction": "Divide by 2", "expected_answer": "x = 5",
+         "hint": "Undo the multiplication", "explanation": "Solve for x"}
+    ]})
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "sessions.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sessions_are_independent(self):
+        """Test that each learner gets their own step state."""
+        store = SessionStore()
+        first = store.create("2x + 5 = 15", make_scaffolding())
+        second = store.create("2x + 5 = 15", make_scaffolding())
+
+        first.record_attempt(0, True, max_attempts=3)
+        store.save(first)
+
+        self.assertEqual(store.get(first.session_id).current_step, 1)
+        self.assertEqual(store.get(second.session_id).current_step, 0)
+        self.assertIsNone(store.get("unknown"))
+
+    def test_step_advances_after_max_attempts(self):
+        """Test that wrong answers count per step and eventually move on."""
+        session = SessionStore().create("2x + 5 = 15", make_scaffolding())
+        self.assertFalse(session.record_attempt(0, False, max_attempts=2))
+        self.assertTrue(session.record_attempt(0, False, max_attempts=2))
+        self.assertTrue(session.record_attempt(1, True, max_attempts=2))
+
+        self.assertEqual(session.attempts, [2, 0])
+        self.assertTrue(session.completed)
+        with self.assertRaises(IndexError):
+            session.step(5)
+
+    def test_idle_sessions_are_evicted(self):
+        """Test that sessions idle past the TTL are dropped from memory."""
+        store = SessionStore(idle_ttl=60)
+        with patch("utils.session_store.time.time", return_value=1000.0):
+            session = store.create("2x + 5 = 15", make_scaffolding())
+        with patch("utils.session_store.time.time", return_value=1050.0):
+            self.assertIsNotNone(store.get(session.session_id))
+        with patch("utils.session_store.time.time", return_value=1111.0):
+            self.assertIsNone(store.get(session.session_id))
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_lru_bound(self):
+        """Test that the least recently used session is evicted when full."""
+        store = SessionStore(max_sessions=2)
+        a = store.create("a", make_scaffolding())
+        b = store.create("b", make_scaffolding())
+        store.get(a.session_id)
+        store.create("c", make_scaffolding())
+
+        self.assertIsNotNone(store.get(a.session_id))
+        self.assertIsNone(store.get(b.session_id))
+
+    def test_resume_from_disk(self):
+        """Test that persisted sessions resume with their progress after a restart."""
+        store = SessionStore(db_path=self.db_path)
+        session = store.create("2x + 5 = 15", make_scaffolding())
+        session.record_attempt(0, False, max_attempts=3)
+        session.record_attempt(0, True, max_attempts=3)
+        store.save(session)
+        store.close()
+
+        reopened = SessionStore(db_path=self.db_path)
+        resumed = reopened.get(session.session_id)
+        self.assertEqual(resumed.current_step, 1)
+        self.assertEqual(resumed.attempts, [1, 0])
+        self.assertEqual(resumed.step().expected_answer, "x = 5")
+        self.assertEqual(reopened.stats()["resumed"], 1)
+        reopened.close()
+
+    def test_resume_ttl_expiry(self):
+        """Test that sessions older than the resume TTL are not resumed."""
+        store = SessionStore(db_path=self.db_path, idle_ttl=10, resume_ttl=100)
+        with patch("utils.session_store.time.time", return_value=1000.0):
+            session = store.create("2x + 5 = 15", make_scaffolding())
+        with patch("utils.session_store.time.time", return_value=1050.0):
+            self.assertIsNotNone(store.get(session.session_id))
+        with patch("utils.session_store.time.time", return_value=1200.0):
+            self.assertIsNone(store.get(session.session_id))
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
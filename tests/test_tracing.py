@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from utils import tracing
+from utils.tracing import JsonlExporter, span, trace, traced
+
+class TestTracing(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.tmpdir.name, "traces.jsonl")
+        self.exporter = JsonlExporter(self.trace_file)
+        tracing.set_exporter(self.exporter)
+
+    def tearDown(self):
+        tracing.set_exporter(None)
+        self.tmpdir.cleanup()
+
+    def read_traces(self):
+        self.exporter.shutdown()
+        with open(self.trace_file) as f:
+            return [json.loads(line) for line in f]
+
+    async def test_spans_nest_across_concurrent_tasks(self):
+        """Test that spans opened in gathered tasks attach to their own parent."""
+        @traced("module.call")
+        async def call(name):
+            with span("llm.complete", model=name):
+                await asyncio.sleep(0)
+
+        with trace("POST /process-text-problem") as root:
+            await asyncio.gather(call("a"), call("b"))
+
+        [exported] = self.read_traces()
+        self.assertEqual(exported["trace_id"], root.trace_id)
+        spans = {s["span_id"]: s for s in exported["spans"]}
+        module_spans = [s for s in spans.values() if s["name"] == "module.call"]
+        self.assertEqual(len(module_spans), 2)
+        for module_span in module_spans:
+            self.assertEqual(module_span["parent_span_id"], root.span_id)
+        for llm_span in (s for s in spans.values() if s["name"] == "llm.complete"):
+            self.assertEqual(spans[llm_span["parent_span_id"]]["name"], "module.call")
+            self.assertEqual(llm_span["trace_id"], root.trace_id)
+
+    async def test_errors_are_recorded(self):
+        """Test that a failing span and its trace are marked as errors."""
+        with self.assertRaises(ValueError):
+            with trace("validate"):
+                with span("validation.validate_step"):
+                    raise ValueError("bad answer")
+
+        [exported] = self.read_traces()
+        self.assertEqual(exported["status"], "error")
+        self.assertEqual(exported["spans"][1]["error"], "ValueError: bad answer")
+
+    async def test_only_hex_client_trace_ids_are_kept(self):
+        """Test that a client trace id is reused only when it is short hex."""
+        client_id = "4BF92F3577B34DA6A3CE929D0E0E4736"
+        for supplied, kept in ((client_id, True), ('x"}\n{"forged": 1', False), ("a" * 200, False)):
+            root, token = tracing.start_trace("GET /", trace_id=supplied)
+            tracing.end_trace(root, token)
+            self.assertEqual(root.trace_id == supplied.lower(), kept, supplied)
+            self.assertRegex(root.trace_id, r"^[0-9a-f]{16,32}$")
+
+    def test_trace_file_is_rotated(self):
+        """Test that the trace file rolls over at max_bytes and keeps backup_count old files."""
+        exporter = JsonlExporter(self.trace_file, max_bytes=2000, backup_count=2)
+        tracing.set_exporter(exporter)
+        for _ in range(60):
+            with trace("POST /validate-answer") as root:
+                root.set_attribute("padding", "x" * 100)
+        exporter.shutdown()
+
+        files = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(files, ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"])
+        for name in files:
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmpdir.name, name)), 2000)
+
+    async def test_spans_outside_a_trace_are_noops(self):
+        with span("scaffolding.local_solve") as inactive:
+            self.assertIsNone(inactive)
+        self.assertIsNone(tracing.current_trace_id())
+        self.exporter.shutdown()
+        self.assertFalse(os.path.exists(self.trace_file))
+
+if __name__ == '__main__':
+    unittest.main()
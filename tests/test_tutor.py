@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import io
+from contextlib import redirect_stdout
+from modules.scaffolding.models import Step
+from test_main import AITutor, FALLBACK_PRACTICE
+
+ANALYSIS = {"problem_type": "linear_equation", "key_concepts": ["equation_solving"]}
+STEPS = [Step(instruction="Solve for x", expected_answer="x = 5", hint="Undo the +5", explanation="Isolate x")]
+
+def make_tutor():
+    tutor = AITutor()
+    tutor.components = MagicMock()
+    tutor.components.problem_analyzer.analyze_problem = AsyncMock(return_value=ANALYSIS)
+    tutor.components.scaffolding_engine.generate_solution_steps = AsyncMock(return_value=STEPS)
+    tutor.components.answer_validator.validate_step = AsyncMock(
+        return_value={"is_correct": True, "explanation": "Correct", "understanding_level": "full"}
+    )
+    tutor.components.reinforcer.generate_reinforcement = AsyncMock(
+        return_value={"practice_set": [{"type": "application", "problem": "3x - 5 = 10"}]}
+    )
+    tutor.components.knowledge_assessor.generate_diagnostics = AsyncMock(return_value={"questions": []})
+    return tutor
+
+class TestAITutor(unittest.IsolatedAsyncioTestCase):
+    async def run_session(self, tutor, answers):
+        output = io.StringIO()
+        with patch('builtins.input', side_effect=answers), redirect_stdout(output):
+            await tutor.guide_problem_solution("2x + 5 = 15")
+        return output.getvalue()
+
+    async def test_analysis_and_scaffolding_overlap(self):
+        """Test that scaffolding starts without waiting for the analysis."""
+        tutor = make_tutor()
+        scaffolding_started = asyncio.Event()
+
+        async def analyze(problem):
+            await asyncio.wait_for(scaffolding_started.wait(), timeout=1)
+            return ANALYSIS
+
+        async def scaffold(problem):
+            scaffolding_started.set()
+            return STEPS
+
+        tutor.components.problem_analyzer.analyze_problem = analyze
+        tutor.components.scaffolding_engine.generate_solution_steps = scaffold
+        output = await self.run_session(tutor, ["x = 5", "no"])
+        self.assertIn("Congratulations", output)
+
+    async def test_practice_is_prefetched_during_steps(self):
+        """Test that practice material is requested before the student answers and then offered."""
+        tutor = make_tutor()
+        requested_before_answer = []
+
+        def answer(prompt):
+            requested_before_answer.append(tutor.components.reinforcer.generate_reinforcement.await_count)
+            return "x = 5" if len(requested_before_answer) == 1 else "yes"
+
+        output = io.StringIO()
+        with patch('builtins.input', side_effect=answer), redirect_stdout(output):
+            await tutor.guide_problem_solution("2x + 5 = 15")
+
+        self.assertEqual(requested_before_answer[0], 1)
+        tutor.components.reinforcer.generate_reinforcement.assert_awaited_once_with(
+            concept="equation_solving", mistakes=[], retention_score=75.0
+        )
+        self.assertIn("3x - 5 = 10", output.getvalue())
+
+    async def test_failed_prefetch_falls_back(self):
+        """Test that a failed prefetch falls back to a built-in practice problem."""
+        tutor = make_tutor()
+        tutor.components.reinforcer.generate_reinforcement = AsyncMock(side_effect=Exception("API Error"))
+        output = await self.run_session(tutor, ["x = 5", "yes"])
+        self.assertIn(FALLBACK_PRACTICE["linear_equation"], output)
+
+    async def test_missed_step_asks_diagnostic_question(self):
+        tutor = make_tutor()
+        tutor.max_attempts = 1
+        tutor.components.answer_validator.validate_step = AsyncMock(
+            return_value={"is_correct": False, "explanation": "Check the sign"}
+        )
+        tutor.components.knowledge_assessor.generate_diagnostics = AsyncMock(return_value={"questions": [{
+            "text": "What undoes adding 5?", "options": ["Subtract 5", "Add 5"],
+            "correct_index": 0, "explanation": "Inverse operations"
+        }]})
+        output = await self.run_session(tutor, ["x = 4", "1", "no"])
+        self.assertIn("What undoes adding 5?", output)
+        self.assertIn("✅ Correct!", output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+import json
+from utils.validation import AnswerValidator
+from utils.math_equivalence import check_equivalence, is_final_answer
+
+class TestMathEquivalence(unittest.TestCase):
+    def test_equivalent_expressions(self):
+        """Test that algebraically equal expressions match."""
+        self.assertTrue(check_equivalence("2x + 6", "2(x + 3)"))
+        self.assertTrue(check_equivalence("x^2 - 9", "(x-3)(x+3)"))
+        self.assertTrue(check_equivalence("0.5", "1/2"))
+        self.assertTrue(check_equivalence("4", "√16"))
+        self.assertFalse(check_equivalence("2x + 6", "2x + 3"))
+
+    def test_equations_up_to_rearrangement_and_scaling(self):
+        """Test that rearranged equations match, and scaled ones only for a solved form."""
+        self.assertTrue(check_equivalence("x = 4", "x=4"))
+        self.assertTrue(check_equivalence("2x + 5 = 15", "2x = 10 ->  15 = 5 + 2x"))
+        self.assertTrue(check_equivalence("2x + 5 = 15", "-2x - 5 = -15"))
+        self.assertFalse(check_equivalence("2x + 5 = 15", "4x + 10 = 30"))
+        self.assertTrue(check_equivalence("y = 2x + 1", "2x - y + 1 = 0"))
+        self.assertFalse(check_equivalence("x = 4", "x = 5"))
+
+    def test_intermediate_steps_cannot_be_skipped(self):
+        """Test that a later, equivalent equation does not pass for an intermediate step."""
+        for later in ["x = 4", "-2x = -8", "x - 3 = 1"]:
+            self.assertFalse(check_equivalence("-2x + 6 = -2", later), later)
+        self.assertTrue(check_equivalence("-2x + 6 = -2", "6 - 2x = -2"))
+        self.assertTrue(check_equivalence("2x = 10", "x + x = 10"))
+        self.assertFalse(check_equivalence("2x = 10", "x = 5"))
+
+    def test_alternate_forms_and_multiple_answers(self):
+        """Test '|' alternate forms and order-insensitive answer lists."""
+        self.assertTrue(check_equivalence("x = 3 | 3", "3"))
+        self.assertTrue(check_equivalence("x = 2, x = -2", "x = -2 and x = 2"))
+        self.assertFalse(check_equivalence("x = 2, x = -2", "x = 2"))
+
+    def test_unparseable_answers_are_inconclusive(self):
+        """Test that free text is left to the LLM."""
+        self.assertIsNone(check_equivalence("x = 5", "I think it is five"))
+        self.assertIsNone(check_equivalence("x = 5", "y = 5"))
+
+    def test_deeply_nested_answers_are_inconclusive(self):
+        """Test that answers too deep or long for the parser are left to the LLM instead of raising."""
+        for answer in ["(" * 3000 + "1" + ")" * 3000, "-" * 5000 + "1", "(" * 200 + "x" + ")" * 200 + " = 4"]:
+            self.assertIsNone(check_equivalence("x = 4", answer))
+        self.assertTrue(check_equivalence("x = 4", "(" * 20 + "x" + ")" * 20 + " = 4"))
+        self.assertFalse(is_final_answer("-" * 5000 + "1"))
+
+    def test_final_answer_detection(self):
+        """Test that only 'variable = constant' counts as a final answer."""
+        self.assertTrue(is_final_answer("x = 5"))
+        self.assertTrue(is_final_answer("2x = 10 -> x = 5"))
+        self.assertFalse(is_final_answer("2x = 10"))
+
+class TestAnswerValidator(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_llm = MagicMock()
+        self.mock_llm.complete = AsyncMock(return_value=json.dumps({
+            "is_correct": True,
+            "explanation": "Correct",
+            "normalized_answer": "x = 5",
+            "understanding_level": "full",
+            "is_final_answer": True
+        }))
+        self.validator = AnswerValidator(llm=self.mock_llm)
+
+    async def test_parseable_answer_skips_llm(self):
+        """Test that parseable answers are validated without an LLM call."""
+        result = await self.validator.validate_answer("Solve for x", "x = 5", "x=5.0")
+        self.assertTrue(result["is_correct"])
+        self.assertTrue(result["is_final_answer"])
+
+        result = await self.validator.validate_answer("Subtract 5", "2x = 10", "2x = 20")
+        self.assertFalse(result["is_correct"])
+        self.mock_llm.complete.assert_not_awaited()
+
+    async def test_deeply_nested_answer_uses_llm(self):
+        """Test that a pathological answer falls back to the LLM rather than failing the request."""
+        result = await self.validator.validate_answer("Solve for x", "x = 4", "(" * 3000 + "1" + ")" * 3000)
+        self.assertIn("is_correct", result)
+        self.mock_llm.complete.assert_awaited_once()
+
+    async def test_free_text_answer_uses_llm(self):
+        """Test that answers the parser cannot read fall back to the LLM."""
+        result = await self.validator.validate_answer("Solve for x", "x = 5", "x is five")
+        self.assertTrue(result["is_correct"])
+        self.mock_llm.complete.assert_awaited_once()
+
+if __name__ == '__main__':
+    unittest.main()
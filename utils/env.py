@@ -0,0 +1,8 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def load_env() -> bool:
+    """Load variables from .env into the environment, once per process."""
+    from dotenv import load_dotenv
+    return load_dotenv()
@@ -0,0 +1,217 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Time-to-live in seconds per cache namespace (one namespace per calling module)
+DEFAULT_TTLS = {
+    "scaffolding": 7 * 24 * 3600,
+    "problem_analysis": 7 * 24 * 3600,
+    "image_extraction": 24 * 3600,
+    "answer_validation": 24 * 3600,
+}
+
+
+class LLMCache:
+    """Content-addressed cache for deterministic LLM completions.
+
+    Entries are keyed by a hash of the model, the full prompt messages and the
+    sampling parameters. Lookups go through a size-bounded in-memory LRU tier
+    first and fall back to an optional SQLite (WAL) tier that survives restarts.
+    Async callers should use ``aget``/``aset``, which keep SQLite off the event loop.
+    """
+
+    def __init__(self,
+                 db_path: Optional[str] = None,
+                 memory_max_bytes: int = 64 * 1024 * 1024,
+                 disk_max_bytes: int = 512 * 1024 * 1024,
+                 ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = 24 * 3600):
+        self.db_path = db_path
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], params: Dict) -> str:
+        """Hash the model, prompt and sampling parameters into a cache key."""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _count(self, namespace: str, counter: str):
+        counters = self._stats.setdefault(
+            namespace, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        )
+        counters[counter] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Return the cached completion for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._count(namespace, "memory_hits")
+                    return value
+                self._drop_memory(key)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        self._db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._store_memory(namespace, key, value, expires_at)
+                        self._count(namespace, "disk_hits")
+                        return value
+                    self._drop_disk(key)
+
+            self._count(namespace, "misses")
+            return None
+
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None):
+        """Store a completion in both tiers."""
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl_for(namespace))
+        with self._lock:
+            self._count(namespace, "sets")
+            self._store_memory(namespace, key, value, expires_at)
+            if self._db is not None:
+                self._store_disk(namespace, key, value, expires_at, now)
+
+    async def aget(self, namespace: str, key: str) -> Optional[str]:
+        """``get`` for coroutines; a disk-backed cache is read in a worker thread."""
+        if self._db is None:
+            return self.get(namespace, key)
+        return await asyncio.to_thread(self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: str, ttl: Optional[float] = None):
+        """``set`` for coroutines; a disk-backed cache is written in a worker thread."""
+        if self._db is None:
+            self.set(namespace, key, value, ttl)
+        else:
+            await asyncio.to_thread(self.set, namespace, key, value, ttl)
+
+    def _store_memory(self, namespace: str, key: str, value: str, expires_at: float):
+        size = len(value.encode("utf-8"))
+        if size > self.memory_max_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (value, expires_at, namespace)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            oldest = next(iter(self._memory))
+            # Evictions are counted against the namespace that lost the entry
+            self._count(self._memory[oldest][2], "evictions")
+            self._drop_memory(oldest)
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0].encode("utf-8"))
+
+    def _store_disk(self, namespace: str, key: str, value: str, expires_at: float, now: float):
+        size = len(value.encode("utf-8"))
+        if size > self.disk_max_bytes:
+            return
+        self._drop_disk(key)
+        self._db.execute(
+            "INSERT INTO llm_cache (key, namespace, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, value, size, expires_at, now)
+        )
+        self._disk_bytes += size
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict_disk(now)
+
+    def _drop_disk(self, key: str):
+        row = self._db.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _evict_disk(self, now: float):
+        """Drop expired entries, then least recently used ones until under the byte limit."""
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        rows = self._db.execute("SELECT key, namespace, size FROM llm_cache ORDER BY accessed_at").fetchall()
+        for key, namespace, size in rows:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._disk_bytes -= size
+            self._count(namespace, "evictions")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters per namespace plus current tier sizes."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "namespaces": {name: dict(counters) for name, counters in self._stats.items()}
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def cache_from_env() -> Optional[LLMCache]:
+    """Build the shared cache from LLM_CACHE_* environment variables."""
+    if os.getenv("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+    return LLMCache(
+        db_path=os.getenv("LLM_CACHE_DB", "cache/llm_cache.db") or None,
+        memory_max_bytes=int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024))),
+        disk_max_bytes=int(os.getenv("LLM_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+    )
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("replay", "record")
+
+
+class CassetteMiss(LookupError):
+    """A replay-only cassette has no recording for a request."""
+
+
+class Cassette:
+    """Recorded LLM request/response pairs for offline, deterministic runs.
+
+    Interactions are keyed by model plus a hash of the prompt messages and
+    sampling parameters. In ``replay`` mode an unrecorded request raises
+    CassetteMiss; in ``record`` mode it goes to the provider and the response
+    is added to the file. Only the hash is stored, not the prompt, so
+    cassettes stay small even for image requests.
+    """
+
+    def __init__(self, path: str, mode: str = "replay"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode} (expected one of {', '.join(CASSETTE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self._interactions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self._interactions = json.load(f).get("interactions", {})
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @staticmethod
+    def prompt_hash(messages: List[Dict], params: Dict) -> str:
+        """Hash the prompt and the sampling parameters that shape the response."""
+        params = {name: value for name, value in params.items() if name != "stream"}
+        payload = json.dumps(
+            {"messages": messages, "params": params},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @classmethod
+    def key(cls, model: str, messages: List[Dict], params: Dict) -> str:
+        return f"{model}:{cls.prompt_hash(messages, params)}"
+
+    def lookup(self, model: str, messages: List[Dict], params: Dict) -> Optional[SimpleNamespace]:
+        """Return the recorded ``content`` and ``usage`` for a request.
+
+        Returns None when recording and the request is new; raises CassetteMiss
+        when replaying.
+        """
+        key = self.key(model, messages, params)
+        interaction = self._interactions.get(key)
+        if interaction is not None:
+            usage = interaction.get("usage")
+            return SimpleNamespace(
+                content=interaction["content"],
+                usage=SimpleNamespace(**usage) if usage else None
+            )
+        if not self.recording:
+            raise CassetteMiss(
+                f"No recording for {key} in {self.path}; re-record with LLM_CASSETTE_MODE=record"
+            )
+        return None
+
+    def record(self, model: str, messages: List[Dict], params: Dict, content: str, usage=None):
+        """Add a response to the cassette and write the file."""
+        usage_data = None
+        if usage is not None:
+            usage_data = {
+                name: getattr(usage, name) for name in ("prompt_tokens", "completion_tokens")
+                if isinstance(getattr(usage, name, None), int)
+            }
+        with self._lock:
+            self._interactions[self.key(model, messages, params)] = {"content": content, "usage": usage_data}
+            self._save()
+        logger.info("Recorded %s response into %s", model, self.path)
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "interactions": self._interactions}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._interactions)
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    """Build a cassette from LLM_CASSETTE (file path) and LLM_CASSETTE_MODE."""
+    path = os.getenv("LLM_CASSETTE")
+    if not path:
+        return None
+    return Cassette(path, mode=os.getenv("LLM_CASSETTE_MODE", "replay"))
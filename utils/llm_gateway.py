@@ -0,0 +1,358 @@
+import asyncio
+import os
+import time
+import logging
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional
+
+from utils.env import load_env
+from utils.llm_cache import LLMCache, cache_from_env
+from utils.llm_cassette import Cassette, cassette_from_env
+from utils.llm_scheduler import LLMScheduler, RateLimitExceeded, estimate_tokens, scheduler_from_env
+from utils.metrics import (LLM_ESCALATIONS, LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS, PROMPT_REQUEST_SECONDS,
+                           PROMPT_REQUESTS, PROMPT_TOKENS)
+from utils.model_router import ModelRouter, router_from_env
+from utils.tracing import current_span, span
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq
+    from utils.prompts import PromptTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class LLMGateway:
+    """Single async entry point for every Groq chat completion.
+
+    All modules share one AsyncGroq client backed by a bounded, keep-alive
+    HTTP connection pool, so an in-flight LLM call only suspends its own
+    coroutine instead of blocking the event loop. Calls that pass a
+    ``cache_namespace`` are served from the optional response cache. With a
+    ``cassette``, provider calls are replayed from (or recorded to) a file.
+    Calls that name the ``template`` their prompt was rendered from are also
+    counted, timed and token-accounted per template version. With a
+    ``scheduler``, provider calls wait for rate-limit capacity in priority
+    order and 429s and transient errors are retried through it rather than
+    by the SDK, so a retry cannot jump the queue. With a ``router``, the
+    model a module asks for is replaced by the cheapest suitable tier for
+    its task, escalating only when the caller rejects the output.
+    """
+
+    # Replayed streams are cut into deltas of this many characters
+    REPLAY_CHUNK_SIZE = 16
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 max_connections: Optional[int] = None,
+                 max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: float = 30.0,
+                 timeout: float = 60.0,
+                 max_retries: int = 2,
+                 cache: Optional[LLMCache] = None,
+                 cassette: Optional[Cassette] = None,
+                 scheduler: Optional[LLMScheduler] = None,
+                 router: Optional[ModelRouter] = None):
+        load_env()
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+        self.max_keepalive_connections = max_keepalive_connections or int(
+            os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50")
+        )
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        self.cassette = cassette
+        self.scheduler = scheduler
+        self.router = router
+        self._client: Optional["AsyncGroq"] = None
+
+    @property
+    def client(self) -> "AsyncGroq":
+        """Lazily build the pooled AsyncGroq client on first use."""
+        if self._client is None:
+            # The SDK and httpx are only imported once a call actually goes out
+            import httpx
+            from groq import AsyncGroq
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(self.timeout)
+            )
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                http_client=http_client,
+                max_retries=0 if self.scheduler is not None else self.max_retries
+            )
+            logger.info(
+                f"LLM gateway connected (max_connections={self.max_connections}, "
+                f"keepalive={self.max_keepalive_connections})"
+            )
+        return self._client
+
+    def _cache_key(self, cache_namespace: Optional[str], model: str,
+                   messages: List[Dict], params: Dict) -> Optional[str]:
+        if self.cache is None or cache_namespace is None:
+            return None
+        return self.cache.make_key(model, messages, params)
+
+    @staticmethod
+    def _record_usage(module: str, model: str, usage, template: Optional["PromptTemplate"] = None):
+        """Count the prompt/completion tokens reported in a response's usage block."""
+        active = current_span()
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            if isinstance(tokens, int):
+                LLM_TOKENS.inc(tokens, module=module, model=model, kind=kind)
+                if template is not None:
+                    PROMPT_TOKENS.inc(tokens, template=template.name, version=template.version,
+                                      model=model, kind=kind)
+                if active is not None:
+                    active.set_attribute(f"{kind}_tokens", tokens)
+
+    def _record_request(self, module: str, model: str, outcome: str, template: Optional["PromptTemplate"] = None):
+        LLM_REQUESTS.inc(module=module, model=model, outcome=outcome)
+        if self.router is not None and outcome in ("ok", "error"):
+            self.router.observe_outcome(model, outcome == "ok")
+        if template is not None:
+            PROMPT_REQUESTS.inc(template=template.name, version=template.version, model=model, outcome=outcome)
+
+    def _record_latency(self, seconds: float, module: str, model: str, template: Optional["PromptTemplate"] = None):
+        LLM_REQUEST_SECONDS.observe(seconds, module=module, model=model)
+        if self.router is not None:
+            self.router.observe_latency(model, seconds)
+        if template is not None:
+            PROMPT_REQUEST_SECONDS.observe(seconds, template=template.name, version=template.version, model=model)
+
+    async def _create(self, model: str, messages: List[Dict], params: Dict,
+                      module: str, priority: Optional[int]):
+        """Send one chat completion request, through the scheduler if there is one."""
+        if self.scheduler is None:
+            return await self.client.chat.completions.create(model=model, messages=messages, **params)
+        if priority is None:
+            priority = self.scheduler.priority_for(module)
+        tokens = estimate_tokens(messages, params)
+        for attempt in range(self.scheduler.max_retries + 1):
+            await self.scheduler.acquire(model, priority, tokens)
+            try:
+                response = await self.client.chat.completions.create(model=model, messages=messages, **params)
+            except Exception as e:
+                # A rejected request used none of its estimate, and the retry takes a fresh one
+                self.scheduler.settle(model, tokens, 0)
+                status = getattr(e, "status_code", None)
+                if status == 429:
+                    self.scheduler.rate_limited(model, _retry_after(e))
+                    if attempt == self.scheduler.max_retries:
+                        raise RateLimitExceeded(f"{model} still rate limited after {attempt + 1} attempts") from e
+                elif attempt < self.scheduler.max_retries and _is_transient(e):
+                    await asyncio.sleep(self.scheduler.backoff(attempt))
+                else:
+                    raise
+                continue
+            self.scheduler.succeeded(model)
+            # Streams are settled by _stream_from_provider once they end
+            if not params.get("stream"):
+                self.scheduler.settle(model, tokens, getattr(getattr(response, "usage", None), "total_tokens", None))
+            return response
+
+    async def complete(self, model: str, messages: List[Dict],
+                       cache_namespace: Optional[str] = None,
+                       cache_check: Optional[Callable[[str], bool]] = None,
+                       module: Optional[str] = None,
+                       template: Optional["PromptTemplate"] = None,
+                       priority: Optional[int] = None,
+                       difficulty: Optional[str] = None,
+                       accept: Optional[Callable[[str], bool]] = None,
+                       **params) -> str:
+        """Run a chat completion and return the message content.
+        
+        Pass ``cache_namespace`` only for prompts whose answer does not depend on
+        the individual student; personalized prompts should leave it unset.
+        ``cache_check`` can reject responses that should not be cached, such as
+        output the caller cannot parse. ``module`` labels the call's metrics and
+        defaults to the cache namespace; ``template`` is the PromptTemplate the
+        messages were rendered from, for the per-template metrics. ``priority``
+        overrides the scheduler's queue priority for the module (lower first).
+        
+        With a router, ``difficulty`` (basic, intermediate or advanced) picks
+        the starting tier for the module's task, and an output that ``accept``
+        rejects is retried on the next larger model. The last model's output
+        is returned either way. ``accept`` also serves as the cache check.
+        """
+        module = module or cache_namespace or "unknown"
+        models = self.router.route(module, difficulty, default=model) if self.router is not None else [model]
+        cache_check = cache_check or accept
+        for index, candidate in enumerate(models):
+            content = await self._complete(candidate, messages, cache_namespace, cache_check,
+                                           module, template, priority, params)
+            if accept is None or index == len(models) - 1 or accept(content):
+                return content
+            LLM_ESCALATIONS.inc(module=module, model=candidate)
+            logger.info(f"Escalating {module} from {candidate} to {models[index + 1]} after a rejected output")
+
+    async def _complete(self, model: str, messages: List[Dict], cache_namespace: Optional[str],
+                        cache_check: Optional[Callable[[str], bool]], module: str,
+                        template: Optional["PromptTemplate"], priority: Optional[int], params: Dict) -> str:
+        with span("llm.complete", module=module, model=model) as llm_span:
+            if llm_span is not None and template is not None:
+                llm_span.set_attribute("template", template.label)
+            key = self._cache_key(cache_namespace, model, messages, params)
+            if key is not None:
+                cached = await self.cache.aget(cache_namespace, key)
+                if cached is not None:
+                    self._record_request(module, model, "cached", template)
+                    if llm_span is not None:
+                        llm_span.set_attribute("cached", True)
+                    return cached
+
+            recorded = self.cassette.lookup(model, messages, params) if self.cassette is not None else None
+            if recorded is not None:
+                outcome, content, usage = "replayed", recorded.content, recorded.usage
+            else:
+                start = time.perf_counter()
+                try:
+                    response = await self._create(model, messages, params, module, priority)
+                except Exception:
+                    self._record_request(module, model, "error", template)
+                    raise
+                finally:
+                    self._record_latency(time.perf_counter() - start, module, model, template)
+                outcome, content, usage = "ok", response.choices[0].message.content, getattr(response, "usage", None)
+                if self.cassette is not None:
+                    self.cassette.record(model, messages, params, content, usage)
+            self._record_request(module, model, outcome, template)
+            self._record_usage(module, model, usage, template)
+
+            if key is not None and content and (cache_check is None or cache_check(content)):
+                await self.cache.aset(cache_namespace, key, content)
+            return content
+
+    async def stream(self, model: str, messages: List[Dict],
+                     cache_namespace: Optional[str] = None,
+                     cache_check: Optional[Callable[[str], bool]] = None,
+                     module: Optional[str] = None,
+                     template: Optional["PromptTemplate"] = None,
+                     priority: Optional[int] = None,
+                     difficulty: Optional[str] = None,
+                     **params) -> AsyncIterator[str]:
+        """Run a streaming chat completion, yielding content deltas as they arrive.
+        
+        Deltas cannot be taken back, so a routed stream runs on the first
+        model the router picks and is never escalated.
+        """
+        module = module or cache_namespace or "unknown"
+        if self.router is not None:
+            model = self.router.route(module, difficulty, default=model)[0]
+        with span("llm.stream", module=module, model=model) as llm_span:
+            if llm_span is not None and template is not None:
+                llm_span.set_attribute("template", template.label)
+            key = self._cache_key(cache_namespace, model, messages, params)
+            if key is not None:
+                cached = await self.cache.aget(cache_namespace, key)
+                if cached is not None:
+                    self._record_request(module, model, "cached", template)
+                    if llm_span is not None:
+                        llm_span.set_attribute("cached", True)
+                    yield cached
+                    return
+
+            chunks = []
+            recorded = self.cassette.lookup(model, messages, params) if self.cassette is not None else None
+            if recorded is not None:
+                self._record_request(module, model, "replayed", template)
+                self._record_usage(module, model, recorded.usage, template)
+                for i in range(0, len(recorded.content), self.REPLAY_CHUNK_SIZE):
+                    chunks.append(recorded.content[i:i + self.REPLAY_CHUNK_SIZE])
+                    yield chunks[-1]
+            else:
+                provider = self._stream_from_provider(model, messages, params, module, chunks, template, priority)
+                try:
+                    async for delta in provider:
+                        yield delta
+                finally:
+                    # A consumer that stops early must still settle and record the call now, not at GC
+                    await provider.aclose()
+
+            if key is not None and chunks:
+                content = "".join(chunks)
+                if cache_check is None or cache_check(content):
+                    await self.cache.aset(cache_namespace, key, content)
+
+    async def _stream_from_provider(self, model: str, messages: List[Dict], params: Dict,
+                                    module: str, chunks: List[str],
+                                    template: Optional["PromptTemplate"] = None,
+                                    priority: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream deltas from Groq into ``chunks``, recording the result to the cassette."""
+        start = time.perf_counter()
+        usage = None
+        stream = None
+        try:
+            stream = await self._create(model, messages, {**params, "stream": True}, module, priority)
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                # Groq reports usage on the final chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                    usage = x_groq.usage
+                    self._record_usage(module, model, usage, template)
+        except Exception:
+            self._record_request(module, model, "error", template)
+            raise
+        finally:
+            self._record_latency(time.perf_counter() - start, module, model, template)
+            if stream is not None:
+                self._settle_stream(model, messages, params, chunks, usage)
+        self._record_request(module, model, "ok", template)
+        if self.cassette is not None and chunks:
+            self.cassette.record(model, messages, params, "".join(chunks), usage)
+
+    def _settle_stream(self, model: str, messages: List[Dict], params: Dict, chunks: List[str], usage):
+        """Correct the scheduler's token bucket once a stream ends, however it ended."""
+        if self.scheduler is None:
+            return
+        actual = getattr(usage, "total_tokens", None)
+        if not isinstance(actual, int):
+            # No usage chunk (e.g. the client went away): count what was sent and streamed
+            actual = estimate_tokens(messages, {}) + len("".join(chunks)) // 4
+        self.scheduler.settle(model, estimate_tokens(messages, {**params, "stream": True}), actual)
+
+    async def aclose(self):
+        """Close the underlying connection pool."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait in a 429's Retry-After headers, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(header)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _is_transient(error: Exception) -> bool:
+    """Errors the SDK would have retried: timeouts, conflicts, server errors and dropped connections."""
+    from groq import APIConnectionError
+    status = getattr(error, "status_code", None)
+    return isinstance(error, APIConnectionError) or status in (408, 409) or (status or 0) >= 500
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the process-wide LLM gateway, creating it if needed."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(cache=cache_from_env(), cassette=cassette_from_env(),
+                              scheduler=scheduler_from_env(), router=router_from_env())
+    return _gateway
@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import LLM_QUEUE_SECONDS, LLM_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: a student waiting on an answer check or a photo, then new
+# problems, then work nobody is waiting on yet (diagnostics, practice material)
+MODULE_PRIORITIES = {
+    "answer_validation": 0,
+    "image_extraction": 0,
+    "problem_analysis": 1,
+    "scaffolding": 1,
+    "feedback": 1,
+    "knowledge_assessment": 2,
+    "knowledge_reinforcement": 2,
+}
+DEFAULT_PRIORITY = 1
+
+
+class RateLimitExceeded(Exception):
+    """A call could not be sent within the provider's limits: it waited too long or kept getting 429s."""
+
+
+class TokenBucket:
+    """Refills continuously at ``per_minute`` up to a burst of one minute's worth.
+
+    Takes may overdraw the bucket (a request larger than the burst still goes
+    through once it is full), and later takes wait until the debt is repaid.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken, 0.0 if it can be now."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def credit(self, amount: float, now: float):
+        """Return (or, negative, charge) tokens once the real cost is known."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelQueue:
+    """Rate limits and waiting calls for one model."""
+
+    def __init__(self, requests_per_minute: Optional[float], tokens_per_minute: Optional[float]):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # Heap of (priority, arrival, tokens, future)
+        self.waiting: List[Tuple[int, int, int, asyncio.Future]] = []
+        self.blocked_until = 0.0
+        self.consecutive_limits = 0
+        self.pump: Optional[asyncio.Task] = None
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = self.blocked_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return max(wait, 0.0)
+
+    def take(self, tokens: int, now: float):
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None:
+            self.tokens.take(tokens, now)
+
+
+class LLMScheduler:
+    """Client-side admission control in front of the LLM provider.
+
+    Each model gets token buckets for requests and tokens per minute. A call
+    that would exceed them waits in a per-model priority queue, so when the
+    budget runs short, interactive answer checks go out before scaffolding
+    and scaffolding before background diagnostics and practice material.
+    A 429 blocks the whole model for its ``Retry-After`` (or an exponential
+    backoff when the provider gives none) instead of letting every waiting
+    call hit the limit again. Models without configured limits are only
+    held back by 429s.
+    """
+
+    def __init__(self,
+                 limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                 max_wait: float = 60.0,
+                 max_retries: int = 3,
+                 base_backoff: float = 1.0,
+                 max_backoff: float = 30.0):
+        # model -> (requests per minute, tokens per minute); "*" applies to models not listed
+        self.limits = limits or {}
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._arrivals = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            requests_per_minute, tokens_per_minute = self.limits.get(model, self.limits.get("*", (None, None)))
+            queue = self._queues[model] = _ModelQueue(requests_per_minute, tokens_per_minute)
+        return queue
+
+    @staticmethod
+    def priority_for(module: str) -> int:
+        return MODULE_PRIORITIES.get(module, DEFAULT_PRIORITY)
+
+    async def acquire(self, model: str, priority: int, tokens: int):
+        """Wait until a call to ``model`` estimated at ``tokens`` may be sent.
+
+        Raises RateLimitExceeded if that takes longer than ``max_wait``.
+        """
+        queue = self._queue(model)
+        now = time.monotonic()
+        if not queue.waiting and queue.wait_time(tokens, now) == 0.0:
+            queue.take(tokens, now)
+            LLM_QUEUE_SECONDS.observe(0.0, model=model, priority=priority)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiting, (priority, next(self._arrivals), tokens, future))
+        if queue.pump is None or queue.pump.done():
+            queue.pump = asyncio.create_task(self._pump(queue))
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            raise RateLimitExceeded(f"Waited over {self.max_wait}s for {model} capacity") from None
+        finally:
+            LLM_QUEUE_SECONDS.observe(time.monotonic() - now, model=model, priority=priority)
+
+    async def _pump(self, queue: _ModelQueue):
+        """Admit waiting calls in priority order as the buckets refill."""
+        while queue.waiting:
+            future = queue.waiting[0][3]
+            # Timed out, cancelled, or left behind by a closed event loop
+            if future.done() or future.get_loop().is_closed():
+                heapq.heappop(queue.waiting)
+                continue
+            now = time.monotonic()
+            wait = queue.wait_time(queue.waiting[0][2], now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, tokens, future = heapq.heappop(queue.waiting)
+            queue.take(tokens, now)
+            future.set_result(None)
+
+    def settle(self, model: str, estimated: int, actual: Optional[int]):
+        """Correct the token bucket with the usage the provider reported."""
+        queue = self._queue(model)
+        if queue.tokens is not None and isinstance(actual, int):
+            queue.tokens.credit(estimated - actual, time.monotonic())
+
+    def backoff(self, attempt: int) -> float:
+        """Jittered exponential delay before retry number ``attempt`` (from 0)."""
+        return min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def rate_limited(self, model: str, retry_after: Optional[float]) -> float:
+        """Hold back every call to ``model`` after a 429; returns the delay applied."""
+        queue = self._queue(model)
+        delay = retry_after if retry_after is not None else self.backoff(queue.consecutive_limits)
+        queue.consecutive_limits += 1
+        queue.blocked_until = max(queue.blocked_until, time.monotonic() + delay)
+        LLM_RATE_LIMITED.inc(model=model)
+        logger.warning(f"Rate limited on {model}, holding calls for {delay:.2f}s")
+        return delay
+
+    def succeeded(self, model: str):
+        self._queue(model).consecutive_limits = 0
+
+    def queue_depths(self) -> Dict[Tuple[str, str], int]:
+        """Calls currently waiting, per model and priority."""
+        depths: Dict[Tuple[str, str], int] = {}
+        for model, queue in self._queues.items():
+            for priority, _, _, future in queue.waiting:
+                if not future.done():
+                    key = (model, str(priority))
+                    depths[key] = depths.get(key, 0) + 1
+        return depths
+
+
+def estimate_tokens(messages: List[Dict], params: Dict) -> int:
+    """Rough token cost of a call: its text at four characters a token plus the completion budget."""
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    return chars // 4 + int(params.get("max_tokens") or 0)
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """Parse ``model=rpm:tpm`` entries such as ``"llama3-70b-8192=30:6000,*=60:"``; a blank side is unlimited."""
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        model, _, rates = item.partition("=")
+        requests_per_minute, _, tokens_per_minute = rates.partition(":")
+        limits[model.strip()] = (
+            float(requests_per_minute) if requests_per_minute.strip() else None,
+            float(tokens_per_minute) if tokens_per_minute.strip() else None
+        )
+    return limits
+
+
+def scheduler_from_env() -> Optional[LLMScheduler]:
+    """Build the shared scheduler from LLM_SCHEDULER and LLM_RATE_LIMITS."""
+    if os.getenv("LLM_SCHEDULER", "1") == "0":
+        return None
+    return LLMScheduler(
+        limits=parse_limits(os.getenv("LLM_RATE_LIMITS", "")),
+        max_wait=float(os.getenv("LLM_QUEUE_MAX_WAIT", "60")),
+        max_retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+    )
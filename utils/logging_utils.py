@@ -1,20 +1,74 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
 
+# LOG_ASYNC=0 restores synchronous handlers (useful when debugging the logging itself)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") != "0"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Fraction of calls whose full prompt/response payloads are written to the log
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+_listeners = []
+# Arguments of these types cannot change before the listener formats the record
+_IMMUTABLE_ARGS = (str, bytes, int, float, complex, type(None))
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread.
+
+    The stock QueueHandler formats every record in the calling thread before
+    enqueueing it; here only tracebacks are rendered up front (the frames
+    will be gone by the time the listener runs), along with messages whose
+    arguments are mutable objects the caller may change in the meantime.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not (isinstance(record.args, tuple)
+                                and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class DeferredRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that creates its directory and file on the first write.
+
+    Importing a module that sets up a logger then touches no files, which
+    keeps worker start-up cheap and read-only filesystems importable.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+
+    def _open(self):
+        directory = os.path.dirname(self.baseFilename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return super()._open()
+
+
 def setup_logger(name, log_file=None):
-    """Set up a logger with both file and console output."""
-    # Create logs directory if it doesn't exist
-    if log_file:
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    
+    """Set up a logger with both file and console output.
+
+    By default records are handed to a queue and written by a background
+    listener, so request handlers never block on disk or stdout.
+    """
     # Create logger
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    
+    logger.setLevel(LOG_LEVEL)
+
     # Remove existing handlers to avoid duplicates
     logger.handlers = []
-    
+
     # Create formatters
     detailed_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -22,22 +76,57 @@ def setup_logger(name, log_file=None):
     console_formatter = logging.Formatter(
         '🔍 %(levelname)s: %(message)s'
     )
-    
+
+    handlers = []
     # Add file handler if log_file is specified
     if log_file:
-        file_handler = logging.FileHandler(log_file)
+        file_handler = DeferredRotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+        )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(detailed_formatter)
-        logger.addHandler(file_handler)
-    
+        handlers.append(file_handler)
+
     # Add console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-    
+    handlers.append(console_handler)
+
+    if LOG_ASYNC:
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(LazyQueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
 
+def stop_logging():
+    """Flush queued records and stop the background listeners."""
+    while _listeners:
+        _listeners.pop().stop()
+
+atexit.register(stop_logging)
+
+def log_payload(logger, label, payload, error=False, level=logging.DEBUG):
+    """Log a large payload (prompt, raw response, base64) only when sampled.
+
+    The full payload is written at INFO for a LOG_PAYLOAD_SAMPLE_RATE
+    fraction of calls, so sampling works at the default LOG_LEVEL, and at
+    ERROR whenever ``error`` is set. Other calls log only its size at
+    ``level``, which is skipped entirely when that level is disabled.
+    """
+    if error:
+        logger.error("%s: %s", label, payload)
+    elif random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.info("%s: %s", label, payload)
+    elif logger.isEnabledFor(level):
+        logger.log(level, "%s: <%d chars, not sampled>", label, len(str(payload)))
+
 # Create loggers
 image_logger = setup_logger('image_processor', 'logs/image_processing.log')
 validation_logger = setup_logger('validator', 'logs/validation.log')
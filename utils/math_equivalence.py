@@ -0,0 +1,379 @@
+import math
+import random
+import re
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+# Parsed answers are small expression trees of tuples, e.g. ('add', ('num', 2.0), ('var', 'x'))
+Node = tuple
+# An answer such as "x = 2, x = -2" parses to one tree per part
+ParsedAnswer = Tuple[Node, ...]
+
+FUNCTIONS = {"sqrt": math.sqrt}
+
+UNICODE_REPLACEMENTS = {
+    "−": "-", "–": "-", "×": "*", "·": "*", "∙": "*", "÷": "/",
+    "²": "^2", "³": "^3", "√": "sqrt", "**": "^",
+}
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([a-zA-Z]+)|(\^|[-+*/()=]))")
+ANSWER_SEPARATORS = re.compile(r"\s*(?:,|;|\band\b|\bor\b)\s*")
+STEP_ARROWS = re.compile(r"->|→|=>")
+
+# Sample points are fixed so the same answer is always judged the same way
+SAMPLE_POINTS = 8
+MIN_VALID_POINTS = 3
+REL_TOLERANCE = 1e-6
+ABS_TOLERANCE = 1e-9
+# Longer expressions are left to the LLM; deeply nested ones would overflow the recursive parser
+MAX_EXPRESSION_CHARS = 300
+
+
+class ParseError(ValueError):
+    pass
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    for old, new in UNICODE_REPLACEMENTS.items():
+        text = text.replace(old, new)
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise ParseError(f"Unexpected character {text[pos]!r}")
+        number, word, op = match.groups()
+        if number is not None:
+            tokens.append(("num", number))
+        elif word is not None:
+            word = word.lower()
+            if word in FUNCTIONS:
+                tokens.append(("func", word))
+            elif len(word) <= 2:
+                # Short letter runs are implicit products of variables ("xy" -> x*y)
+                tokens.extend(("var", letter) for letter in word)
+            else:
+                raise ParseError(f"Unknown word {word!r}")
+        else:
+            tokens.append(("op", op))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser for arithmetic with implicit multiplication."""
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take_op(self, *ops: str) -> Optional[str]:
+        token = self.peek()
+        if token and token[0] == "op" and token[1] in ops:
+            self.pos += 1
+            return token[1]
+        return None
+
+    def parse_statement(self) -> Node:
+        left = self.parse_expr()
+        if self.take_op("="):
+            right = self.parse_expr()
+            node = ("eq", left, right)
+        else:
+            node = left
+        if self.peek() is not None:
+            raise ParseError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def parse_expr(self) -> Node:
+        node = self.parse_term()
+        while True:
+            op = self.take_op("+", "-")
+            if not op:
+                return node
+            node = ("add" if op == "+" else "sub", node, self.parse_term())
+
+    def parse_term(self) -> Node:
+        node = self.parse_unary()
+        while True:
+            op = self.take_op("*", "/")
+            if op:
+                node = ("mul" if op == "*" else "div", node, self.parse_unary())
+                continue
+            token = self.peek()
+            if token and (token[0] in ("var", "func", "num") or token == ("op", "(")):
+                node = ("mul", node, self.parse_power())
+                continue
+            return node
+
+    def parse_unary(self) -> Node:
+        op = self.take_op("+", "-")
+        if op == "-":
+            return ("neg", self.parse_unary())
+        if op == "+":
+            return self.parse_unary()
+        return self.parse_power()
+
+    def parse_power(self) -> Node:
+        base = self.parse_atom()
+        if self.take_op("^"):
+            return ("pow", base, self.parse_unary())
+        return base
+
+    def parse_atom(self) -> Node:
+        token = self.peek()
+        if token is None:
+            raise ParseError("Unexpected end of input")
+        kind, value = token
+        self.pos += 1
+        if kind == "num":
+            return ("num", float(value))
+        if kind == "var":
+            return ("var", value)
+        if kind == "func":
+            if self.take_op("("):
+                arg = self.parse_expr()
+                if not self.take_op(")"):
+                    raise ParseError("Unbalanced parentheses")
+                return ("func", value, arg)
+            # The √16 shorthand binds to the following factor
+            return ("func", value, self.parse_power())
+        if value == "(":
+            node = self.parse_expr()
+            if not self.take_op(")"):
+                raise ParseError("Unbalanced parentheses")
+            return node
+        raise ParseError(f"Unexpected token {value!r}")
+
+
+def parse(text: str) -> Node:
+    """Parse an expression or single equation into a tree; raises ParseError."""
+    if len(text) > MAX_EXPRESSION_CHARS:
+        raise ParseError("Answer too long")
+    tokens = _tokenize(text)
+    if not tokens:
+        raise ParseError("Empty answer")
+    try:
+        return _Parser(tokens).parse_statement()
+    except RecursionError:
+        raise ParseError("Answer nested too deeply") from None
+
+
+def variables(node: Node) -> Set[str]:
+    if node[0] == "var":
+        return {node[1]}
+    if node[0] == "num":
+        return set()
+    found = set()
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            found |= variables(child)
+    return found
+
+
+def evaluate(node: Node, values: Dict[str, float]) -> float:
+    kind = node[0]
+    if kind == "num":
+        return node[1]
+    if kind == "var":
+        return values[node[1]]
+    if kind == "neg":
+        return -evaluate(node[1], values)
+    if kind == "func":
+        return FUNCTIONS[node[1]](evaluate(node[2], values))
+    left, right = evaluate(node[1], values), evaluate(node[2], values)
+    if kind == "add":
+        return left + right
+    if kind in ("sub", "eq"):
+        # An equation L = R is evaluated as L - R
+        return left - right
+    if kind == "mul":
+        return left * right
+    if kind == "div":
+        return left / right
+    if kind == "pow":
+        result = left ** right
+        if isinstance(result, complex):
+            raise ValueError("Complex result")
+        return result
+    raise ParseError(f"Unknown node {kind}")
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= max(REL_TOLERANCE * max(abs(a), abs(b)), ABS_TOLERANCE)
+
+
+def _sample(nodes: List[Node], names: Set[str]) -> List[List[float]]:
+    """Evaluate every node at the same pseudo-random points, skipping undefined ones."""
+    rng = random.Random(7919)
+    samples = []
+    for _ in range(SAMPLE_POINTS):
+        values = {name: rng.choice((-1, 1)) * rng.uniform(0.5, 3.5) for name in sorted(names)}
+        try:
+            row = [evaluate(node, values) for node in nodes]
+        except (ArithmeticError, ValueError):
+            continue
+        if all(math.isfinite(value) for value in row):
+            samples.append(row)
+    return samples
+
+
+def _lone_variable_value(equation: Node) -> Optional[Node]:
+    """For 'x = expr' or 'expr = x' return expr, else None."""
+    left, right = equation[1], equation[2]
+    if left[0] == "var" and right[0] != "var":
+        return right
+    if right[0] == "var" and left[0] != "var":
+        return left
+    return None
+
+
+def _terms(node: Node) -> List[Node]:
+    """The additive terms of an expression, signs dropped."""
+    if node[0] in ("add", "sub"):
+        return _terms(node[1]) + _terms(node[2])
+    if node[0] == "neg":
+        return _terms(node[1])
+    return [node]
+
+
+def _shape(equation: Node) -> Tuple[FrozenSet[FrozenSet[str]], ...]:
+    """Which kinds of term (by their variables) each side of an equation has, sides in either order."""
+    sides = [frozenset(frozenset(variables(term)) for term in _terms(side)) for side in equation[1:]]
+    return tuple(sorted(sides, key=lambda side: sorted(sorted(term) for term in side)))
+
+
+def _equivalent(expected: Node, actual: Node) -> Optional[bool]:
+    """Compare two parsed answers; None when the comparison is inconclusive."""
+    expected_is_eq, actual_is_eq = expected[0] == "eq", actual[0] == "eq"
+    if expected_is_eq != actual_is_eq:
+        # Accept a bare value for "x = value" (and vice versa)
+        equation, other = (expected, actual) if expected_is_eq else (actual, expected)
+        value = _lone_variable_value(equation)
+        if value is None:
+            return None
+        expected, actual = (value, other) if expected_is_eq else (other, value)
+        expected_is_eq = actual_is_eq = False
+
+    names = variables(expected) | variables(actual)
+    if variables(expected) != variables(actual) and variables(expected) and variables(actual):
+        # Different variable names usually mean a notation mismatch, not a wrong answer
+        return None
+
+    samples = _sample([expected, actual], names)
+    if len(samples) < MIN_VALID_POINTS:
+        return None
+
+    if not expected_is_eq:
+        return all(_close(e, a) for e, a in samples)
+
+    # An intermediate step such as "-2x + 6 = -2" must keep its kinds of terms on each
+    # side and may only be rearranged or negated, or "x = 4" (or "x - 3 = 1") would pass
+    # for it and let a student skip steps. Only a solved form ("x = 4", "y = 2x + 1")
+    # may also be scaled.
+    intermediate = _lone_variable_value(expected) is None
+    if intermediate and _shape(expected) != _shape(actual):
+        return False
+
+    # Equations are equivalent up to rearrangement and scaling: (L1 - R1) = c * (L2 - R2)
+    ratio = None
+    for e, a in samples:
+        if abs(e) <= ABS_TOLERANCE or abs(a) <= ABS_TOLERANCE:
+            if not (abs(e) <= ABS_TOLERANCE and abs(a) <= ABS_TOLERANCE):
+                return False
+            continue
+        current = a / e
+        if ratio is None:
+            ratio = current
+        elif not _close(ratio, current):
+            return False
+    return not intermediate or ratio is None or _close(abs(ratio), 1.0)
+
+
+def _split_answer(text: str) -> List[str]:
+    # Step-by-step work like "2x = 10 -> x = 5" is judged by its final form
+    text = STEP_ARROWS.split(text)[-1]
+    return [part for part in ANSWER_SEPARATORS.split(text.strip()) if part]
+
+
+def parse_answer(text: str) -> Optional[ParsedAnswer]:
+    """Parse a (possibly multi-part) answer; None when any part cannot be parsed."""
+    try:
+        parts = tuple(parse(part) for part in _split_answer(text))
+    except ParseError:
+        return None
+    return parts or None
+
+
+def parse_alternates(expected_answer: str) -> Tuple[Optional[ParsedAnswer], ...]:
+    """Parse each '|'-separated alternate form of an expected answer."""
+    return tuple(parse_answer(form) for form in str(expected_answer).split("|"))
+
+
+def compare_answers(expected_forms: Sequence[Optional[ParsedAnswer]],
+                    actual_parts: Optional[ParsedAnswer]) -> Optional[bool]:
+    """Compare a parsed student answer against parsed alternate forms."""
+    if not actual_parts:
+        return None
+    try:
+        return _compare_answers(expected_forms, actual_parts)
+    except RecursionError:
+        # A tree that only just parsed can still be too deep to evaluate
+        return None
+
+
+def _compare_answers(expected_forms: Sequence[Optional[ParsedAnswer]],
+                     actual_parts: ParsedAnswer) -> Optional[bool]:
+
+    verdict = None
+    for expected_parts in expected_forms:
+        if expected_parts is None:
+            continue
+        if len(expected_parts) != len(actual_parts):
+            verdict = False if verdict is None else verdict
+            continue
+
+        # Every expected part must match a distinct student part, in any order
+        remaining = list(actual_parts)
+        matched = True
+        for expected in expected_parts:
+            inconclusive = False
+            for i, actual in enumerate(remaining):
+                result = _equivalent(expected, actual)
+                if result:
+                    del remaining[i]
+                    break
+                if result is None:
+                    inconclusive = True
+            else:
+                if inconclusive:
+                    return None
+                matched = False
+                break
+        if matched:
+            return True
+        verdict = False
+    return verdict
+
+
+def check_equivalence(expected_answer: str, user_answer: str) -> Optional[bool]:
+    """Decide locally whether a student answer matches the expected answer.
+
+    ``expected_answer`` may list alternate forms separated by '|'. Returns True
+    or False when both sides parse, and None when the answer cannot be judged
+    without the LLM (free text, unknown notation, mismatched variables).
+    """
+    return compare_answers(parse_alternates(expected_answer), parse_answer(user_answer))
+
+
+def is_final_answer(user_answer: str) -> bool:
+    """True when the answer has the form 'variable = constant'."""
+    parts = parse_answer(user_answer)
+    return bool(parts) and all(
+        part[0] == "eq" and _lone_variable_value(part) is not None
+        and not variables(_lone_variable_value(part))
+        for part in parts
+    )
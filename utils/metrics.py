@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+from utils.tracing import span
+
+# Latency buckets in seconds, from in-memory work up to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket counts (plus +Inf), sum, count
+        self._series: Dict[LabelValues, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[2] if series else 0
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them as Prometheus text.
+
+    Collectors are callables run at scrape time that return extra sample
+    lines, used for values other components already track (cache stats).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, documentation: str, samples: Dict[LabelValues, float],
+                labelnames: Sequence[str] = ()) -> List[str]:
+    """Render scrape-time gauge samples for a collector."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for key, value in sorted(samples.items()):
+        lines.append(f"{name}{_format_labels(labelnames, key)} {value}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "tutor_stage_duration_seconds", "Time spent in each request pipeline stage", ["stage"]
+)
+LLM_REQUEST_SECONDS = registry.histogram(
+    "tutor_llm_request_duration_seconds", "Latency of LLM provider calls", ["module", "model"]
+)
+LLM_TOKENS = registry.counter(
+    "tutor_llm_tokens_total", "Tokens reported by the provider", ["module", "model", "kind"]
+)
+LLM_REQUESTS = registry.counter(
+    "tutor_llm_requests_total", "LLM calls by outcome (ok, cached, replayed, error)", ["module", "model", "outcome"]
+)
+PROMPT_TOKENS = registry.counter(
+    "tutor_prompt_tokens_total", "Tokens reported by the provider per prompt template",
+    ["template", "version", "model", "kind"]
+)
+PROMPT_REQUESTS = registry.counter(
+    "tutor_prompt_requests_total", "LLM calls per prompt template by outcome",
+    ["template", "version", "model", "outcome"]
+)
+PROMPT_REQUEST_SECONDS = registry.histogram(
+    "tutor_prompt_request_duration_seconds", "Latency of LLM provider calls per prompt template",
+    ["template", "version", "model"]
+)
+LLM_ESCALATIONS = registry.counter(
+    "tutor_llm_escalations_total", "Outputs rejected by the caller and retried on a larger model", ["module", "model"]
+)
+LLM_QUEUE_SECONDS = registry.histogram(
+    "tutor_llm_queue_wait_seconds", "Time LLM calls waited for rate-limit capacity", ["model", "priority"]
+)
+LLM_RATE_LIMITED = registry.counter(
+    "tutor_llm_rate_limited_total", "429 responses from the LLM provider", ["model"]
+)
+FALLBACKS = registry.counter(
+    "tutor_fallbacks_total", "Times a module returned default output instead of a model result",
+    ["module", "reason"]
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the duration of a pipeline stage (and a span, inside a trace)."""
+    with span(stage), STAGE_SECONDS.time(stage=stage):
+        yield
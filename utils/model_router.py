@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+# How far up a task's tier list a call starts, as a fraction of the list
+DIFFICULTY_LEVELS = {"basic": 0.0, "intermediate": 0.5, "advanced": 1.0}
+
+# Cheapest first; a call escalates up the list only when the output is rejected.
+# Tasks not listed always use the model the module asks for. OCR is left out on
+# purpose: a misread from a smaller vision model still parses, so it would never escalate.
+DEFAULT_TIERS = {
+    "answer_validation": ["llama3-8b-8192", "mixtral-8x7b-32768"],
+    "problem_analysis": ["llama3-8b-8192", "mixtral-8x7b-32768"],
+    "scaffolding": ["llama3-8b-8192", "llama3-70b-8192"],
+}
+
+
+def estimate_difficulty(text: str) -> str:
+    """Guess how hard a problem or answer is from its text alone.
+
+    A bare expression such as ``x = 4`` is basic, a long word problem is
+    advanced and anything in between is intermediate.
+    """
+    words = len(re.findall(r"[A-Za-z]{3,}", text))
+    if len(text) <= 40 and words <= 2:
+        return "basic"
+    if len(text) > 240 or words > 40:
+        return "advanced"
+    return "intermediate"
+
+
+class _ModelStats:
+    """Exponentially weighted latency and error rate of one model's provider calls."""
+
+    def __init__(self):
+        self.latency = 0.0
+        self.latency_samples = 0
+        self.latency_updated = 0.0
+        self.error_rate = 0.0
+        self.outcome_samples = 0
+        self.last_error = 0.0
+
+
+class ModelRouter:
+    """Picks the model for each call from a per-task tier list.
+
+    The starting tier follows the call's difficulty: basic work starts on
+    the cheapest model and advanced work on the largest. From there a
+    model is passed over while its recent error rate is above
+    ``max_error_rate`` (until it has been error-free for
+    ``recovery_seconds``), or while it is answering slower than the next
+    tier up. Either verdict expires after ``recovery_seconds`` without
+    calls, so a passed-over model is tried again. ``route`` returns the remaining models in escalation order;
+    the gateway only moves along them when the caller rejects an output.
+    """
+
+    def __init__(self,
+                 tiers: Optional[Dict[str, Sequence[str]]] = None,
+                 max_error_rate: float = 0.5,
+                 recovery_seconds: float = 30.0,
+                 min_samples: int = 5,
+                 smoothing: float = 0.2):
+        self.tiers = {task: list(models) for task, models in (DEFAULT_TIERS if tiers is None else tiers).items()}
+        self.max_error_rate = max_error_rate
+        self.recovery_seconds = recovery_seconds
+        # Latency and error rates are trusted once a model has this many calls
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self._stats: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(model, _ModelStats())
+        return stats
+
+    def observe_latency(self, model: str, seconds: float):
+        stats = self._model_stats(model)
+        with self._lock:
+            weight = self.smoothing if stats.latency_samples else 1.0
+            stats.latency += weight * (seconds - stats.latency)
+            stats.latency_samples += 1
+            stats.latency_updated = time.monotonic()
+
+    def observe_outcome(self, model: str, ok: bool):
+        stats = self._model_stats(model)
+        with self._lock:
+            weight = self.smoothing if stats.outcome_samples else 1.0
+            stats.error_rate += weight * ((0.0 if ok else 1.0) - stats.error_rate)
+            stats.outcome_samples += 1
+            if not ok:
+                stats.last_error = time.monotonic()
+
+    def _failing(self, model: str) -> bool:
+        stats = self._stats.get(model)
+        return (stats is not None and stats.outcome_samples >= self.min_samples
+                and stats.error_rate > self.max_error_rate
+                and time.monotonic() - stats.last_error < self.recovery_seconds)
+
+    def _slower(self, model: str, than: str) -> bool:
+        stats, other = self._stats.get(model), self._stats.get(than)
+        return (stats is not None and other is not None
+                and min(stats.latency_samples, other.latency_samples) >= self.min_samples
+                and time.monotonic() - stats.latency_updated < self.recovery_seconds
+                and stats.latency > other.latency)
+
+    def route(self, task: str, difficulty: Optional[str] = None, default: Optional[str] = None) -> List[str]:
+        """Models to try for a call, in escalation order; just ``default`` for tasks without tiers."""
+        tiers = self.tiers.get(task)
+        if not tiers:
+            return [default] if default is not None else []
+        start = int(DIFFICULTY_LEVELS.get(difficulty, 0.0) * (len(tiers) - 1))
+        chain = tiers[start:]
+        while len(chain) > 1 and (self._failing(chain[0]) or self._slower(chain[0], chain[1])):
+            chain = chain[1:]
+        return chain
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Current smoothed latency and error rate per model."""
+        with self._lock:
+            return {model: {"latency_seconds": stats.latency, "error_rate": stats.error_rate}
+                    for model, stats in self._stats.items()}
+
+
+def parse_tiers(value: str) -> Dict[str, List[str]]:
+    """Parse ``task=model,model;task=model`` tier lists, cheapest model first."""
+    tiers = {}
+    for item in value.split(";"):
+        if not item.strip():
+            continue
+        task, _, models = item.partition("=")
+        tiers[task.strip()] = [model.strip() for model in models.split(",") if model.strip()]
+    return tiers
+
+
+def router_from_env() -> Optional[ModelRouter]:
+    """Build the shared router from LLM_ROUTER and LLM_MODEL_TIERS (which override the default tiers per task)."""
+    if os.getenv("LLM_ROUTER", "1") == "0":
+        return None
+    return ModelRouter(
+        tiers={**DEFAULT_TIERS, **parse_tiers(os.getenv("LLM_MODEL_TIERS", ""))},
+        max_error_rate=float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+    )
@@ -0,0 +1,118 @@
+import os
+import string
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.env import load_env
+
+# Rough characters per token for English prompt text, for sizing static prefixes offline
+CHARS_PER_TOKEN = 4
+
+
+class PromptTemplate:
+    """A versioned prompt, parsed once into literal text and named fields.
+
+    ``render`` fills the fields by concatenation instead of re-parsing the
+    format string on every call, and gives the same result as
+    ``str.format``. ``{{`` and ``}}`` are literal braces as usual.
+    """
+
+    def __init__(self, name: str, version: int, text: str):
+        self.name = name
+        self.version = version
+        self.text = text
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Prompt {self.label} has an unsupported field {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = tuple(dict.fromkeys(field for _, field in self._parts if field is not None))
+        self.static_text = "".join(literal for literal, _ in self._parts)
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    @property
+    def static_tokens(self) -> int:
+        """Estimated tokens in the fixed part of the prompt, paid on every call."""
+        return -(-len(self.static_text) // CHARS_PER_TOKEN)
+
+    def render(self, **values) -> str:
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.label} is missing {', '.join(missing)}")
+        return "".join(
+            literal if field is None else literal + str(values[field])
+            for literal, field in self._parts
+        )
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate({self.label!r})"
+
+
+def parse_versions(value: str) -> Dict[str, int]:
+    """Parse ``name=version`` pins such as ``"scaffolding=2,answer_validation=1"``."""
+    pins = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, version = item.partition("=")
+        pins[name.strip()] = int(version)
+    return pins
+
+
+class PromptRegistry:
+    """Every module's prompts, by name and version.
+
+    Modules register their templates at import time and look them up when
+    they are constructed. Each name has a default version; another one is
+    picked with ``PROMPT_VERSIONS=name=version,...``, so a compacted variant
+    can be tried on live traffic and compared in the per-template token and
+    latency metrics before it becomes the default.
+    """
+
+    def __init__(self, pins: Optional[Dict[str, int]] = None):
+        self._templates: Dict[str, Dict[int, PromptTemplate]] = {}
+        self._defaults: Dict[str, int] = {}
+        self._pins = pins
+        self._lock = threading.Lock()
+
+    @property
+    def pins(self) -> Dict[str, int]:
+        if self._pins is None:
+            load_env()
+            self._pins = parse_versions(os.getenv("PROMPT_VERSIONS", ""))
+        return self._pins
+
+    def register(self, name: str, version: int, text: str, default: bool = False) -> PromptTemplate:
+        """Add a template; the first version registered for a name is its default unless a later one sets ``default``."""
+        template = PromptTemplate(name, version, text)
+        with self._lock:
+            versions = self._templates.setdefault(name, {})
+            if version in versions and versions[version].text != text:
+                raise ValueError(f"Prompt {template.label} is already registered with different text")
+            versions[version] = template
+            if default or name not in self._defaults:
+                self._defaults[name] = version
+        return template
+
+    def get(self, name: str, version: Optional[int] = None) -> PromptTemplate:
+        """The requested version, else the pinned one, else the default."""
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"No prompt registered as {name!r}")
+        version = version or self.pins.get(name) or self._defaults[name]
+        if version not in versions:
+            raise KeyError(f"Prompt {name!r} has no version {version}")
+        return versions[version]
+
+    def templates(self) -> List[PromptTemplate]:
+        """Every registered version of every prompt, sorted by name and version."""
+        return sorted(
+            (template for versions in self._templates.values() for template in versions.values()),
+            key=lambda template: (template.name, template.version)
+        )
+
+
+prompts = PromptRegistry()
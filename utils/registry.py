@@ -0,0 +1,127 @@
+import time
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from modules.feedback.feedback_engine import FeedbackEngine
+    from modules.image_processing.image_processor import ImageProcessor
+    from modules.knowledge_assessment.diagnoser import KnowledgeAssessor
+    from modules.knowledge_reinforcement.reinforcer import KnowledgeReinforcer
+    from modules.problem_understanding.analyzer import ProblemAnalyzer
+    from modules.scaffolding.engine import ScaffoldingEngine
+    from utils.llm_gateway import LLMGateway
+    from utils.session_store import SessionStore
+    from utils.validation import AnswerValidator
+
+
+class ComponentRegistry:
+    """Builds the tutoring components on first use, all sharing one LLM gateway.
+
+    Nothing is imported or constructed until a component is first asked for,
+    so a worker that only serves text problems never loads PIL, and one that
+    has not made an LLM call yet has not loaded the Groq SDK. Build times are
+    kept in ``build_seconds`` for cold-start measurements.
+    """
+
+    def __init__(self, llm: Optional["LLMGateway"] = None):
+        self._llm = llm
+        self._components: Dict[str, object] = {}
+        # Re-entrant: building a module asks for the shared gateway
+        self._lock = threading.RLock()
+        self.build_seconds: Dict[str, float] = {}
+
+    def _get(self, name: str, build: Callable[[], object]):
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    start = time.perf_counter()
+                    component = build()
+                    self.build_seconds[name] = time.perf_counter() - start
+                    self._components[name] = component
+        return component
+
+    def built(self, name: str) -> bool:
+        return name in self._components
+
+    @property
+    def llm(self) -> "LLMGateway":
+        def build():
+            from utils.llm_gateway import get_llm_gateway
+            return self._llm or get_llm_gateway()
+        return self._get("llm", build)
+
+    @property
+    def problem_analyzer(self) -> "ProblemAnalyzer":
+        def build():
+            from modules.problem_understanding.analyzer import ProblemAnalyzer
+            return ProblemAnalyzer(llm=self.llm)
+        return self._get("problem_analyzer", build)
+
+    @property
+    def scaffolding_engine(self) -> "ScaffoldingEngine":
+        def build():
+            from modules.scaffolding.engine import ScaffoldingEngine
+            return ScaffoldingEngine(llm=self.llm)
+        return self._get("scaffolding_engine", build)
+
+    @property
+    def image_processor(self) -> "ImageProcessor":
+        def build():
+            from modules.image_processing.image_processor import ImageProcessor
+            return ImageProcessor(llm=self.llm)
+        return self._get("image_processor", build)
+
+    @property
+    def answer_validator(self) -> "AnswerValidator":
+        def build():
+            from utils.validation import AnswerValidator
+            return AnswerValidator(llm=self.llm)
+        return self._get("answer_validator", build)
+
+    @property
+    def knowledge_assessor(self) -> "KnowledgeAssessor":
+        def build():
+            from modules.knowledge_assessment.diagnoser import KnowledgeAssessor
+            return KnowledgeAssessor(llm=self.llm)
+        return self._get("knowledge_assessor", build)
+
+    @property
+    def feedback_engine(self) -> "FeedbackEngine":
+        def build():
+            from modules.feedback.feedback_engine import FeedbackEngine
+            return FeedbackEngine(llm=self.llm)
+        return self._get("feedback_engine", build)
+
+    @property
+    def reinforcer(self) -> "KnowledgeReinforcer":
+        def build():
+            from modules.knowledge_reinforcement.reinforcer import KnowledgeReinforcer
+            return KnowledgeReinforcer(llm=self.llm)
+        return self._get("reinforcer", build)
+
+    @property
+    def session_store(self) -> "SessionStore":
+        def build():
+            from utils.session_store import session_store_from_env
+            return session_store_from_env()
+        return self._get("session_store", build)
+
+    async def aclose(self):
+        """Close whatever was built: the gateway's connection pool and the session store."""
+        if self.built("llm"):
+            await self.llm.aclose()
+        if self.built("session_store"):
+            self.session_store.close()
+
+
+_registry: Optional[ComponentRegistry] = None
+
+
+def get_registry() -> ComponentRegistry:
+    """Return the process-wide component registry, creating it if needed."""
+    global _registry
+    if _registry is None:
+        _registry = ComponentRegistry()
+    return _registry
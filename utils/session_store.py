@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from modules.scaffolding.models import Scaffolding, Step
+
+logger = logging.getLogger(__name__)
+
+
+class TutoringSession:
+    """Progress of one learner through the scaffolding steps of one problem."""
+
+    __slots__ = ("session_id", "problem", "scaffolding", "current_step", "attempts",
+                 "completed", "created_at", "last_active")
+
+    def __init__(self,
+                 session_id: str,
+                 problem: str,
+                 scaffolding: Scaffolding,
+                 current_step: int = 0,
+                 attempts: Optional[List[int]] = None,
+                 completed: bool = False,
+                 created_at: Optional[float] = None,
+                 last_active: Optional[float] = None):
+        self.session_id = session_id
+        self.problem = problem
+        self.scaffolding = scaffolding
+        self.current_step = current_step
+        # Wrong attempts per step, so a learner can come back to an earlier step
+        self.attempts = attempts or [0] * len(scaffolding)
+        self.completed = completed
+        self.created_at = created_at or time.time()
+        self.last_active = last_active or self.created_at
+
+    @property
+    def total_steps(self) -> int:
+        return len(self.scaffolding)
+
+    def step(self, index: Optional[int] = None) -> Step:
+        """Return a step by index (the current step by default), raising IndexError if out of range."""
+        index = self.current_step if index is None else index
+        if not 0 <= index < self.total_steps:
+            raise IndexError(f"Step {index} out of range for {self.total_steps} steps")
+        return self.scaffolding[index]
+
+    def record_attempt(self, index: int, is_correct: bool, max_attempts: int) -> bool:
+        """Record an answer to a step and advance past it when it is done.
+
+        A step is done once answered correctly or after ``max_attempts`` wrong
+        answers. Returns True when the step is done.
+        """
+        done = is_correct
+        if not is_correct:
+            self.attempts[index] += 1
+            done = self.attempts[index] >= max_attempts
+        if done and index == self.current_step:
+            self.current_step += 1
+            self.completed = self.current_step >= self.total_steps
+        return done
+
+    def progress(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "current_step": self.current_step,
+            "total_steps": self.total_steps,
+            "completed": self.completed
+        }
+
+    def state(self) -> Dict:
+        """The mutable part of a session."""
+        return {
+            "current_step": self.current_step,
+            "attempts": self.attempts,
+            "completed": self.completed
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.progress(),
+            **self.state(),
+            "problem": self.problem,
+            "steps": self.scaffolding.to_dict()["steps"],
+            "created_at": self.created_at,
+            "last_active": self.last_active
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TutoringSession":
+        return cls(
+            session_id=data["session_id"],
+            problem=data["problem"],
+            scaffolding=Scaffolding.from_dict(data),
+            current_step=data["current_step"],
+            attempts=data["attempts"],
+            completed=data["completed"],
+            created_at=data["created_at"],
+            last_active=data["last_active"]
+        )
+
+
+class SessionStore:
+    """Per-learner tutoring sessions keyed by session id.
+
+    Live sessions are held in an in-memory LRU bounded by ``max_sessions`` and
+    evicted after ``idle_ttl`` seconds without activity. With a ``db_path`` every
+    change is also written to SQLite, so evicted sessions, and sessions from
+    before a restart, can be resumed until ``resume_ttl`` expires.
+    """
+
+    def __init__(self,
+                 db_path: Optional[str] = None,
+                 max_sessions: int = 50000,
+                 idle_ttl: float = 3600,
+                 resume_ttl: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.resume_ttl = resume_ttl
+
+        self._sessions: "OrderedDict[str, TutoringSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "hits": 0, "resumed": 0, "misses": 0, "evictions": 0}
+
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS tutoring_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    problem TEXT NOT NULL,
+                    steps TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_active REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                "DELETE FROM tutoring_sessions WHERE last_active <= ?", (time.time() - resume_ttl,)
+            )
+
+    def create(self, problem: str, scaffolding: Scaffolding) -> TutoringSession:
+        """Start a new session for a problem."""
+        session = TutoringSession(uuid.uuid4().hex, problem, scaffolding)
+        with self._lock:
+            self._stats["created"] += 1
+            self._remember(session)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO tutoring_sessions (session_id, problem, steps, state, created_at, last_active) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session.session_id, session.problem, json.dumps(session.scaffolding.to_dict()["steps"]),
+                     json.dumps(session.state()), session.created_at, session.last_active)
+                )
+        return session
+
+    def get(self, session_id: str) -> Optional[TutoringSession]:
+        """Return a live or resumable session, or None if it is unknown or expired."""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_active = now
+                self._sessions.move_to_end(session_id)
+                self._stats["hits"] += 1
+                return session
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT problem, steps, state, created_at, last_active FROM tutoring_sessions "
+                    "WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                if row is not None and row[4] > now - self.resume_ttl:
+                    problem, steps, state, created_at, _ = row
+                    session = TutoringSession.from_dict({
+                        "session_id": session_id,
+                        "problem": problem,
+                        "steps": json.loads(steps),
+                        **json.loads(state),
+                        "created_at": created_at,
+                        "last_active": now
+                    })
+                    logger.debug(f"Resumed session {session_id} from disk")
+                    self._remember(session)
+                    self._stats["resumed"] += 1
+                    return session
+
+            self._stats["misses"] += 1
+            return None
+
+    def save(self, session: TutoringSession):
+        """Mark a session active and persist its progress (the steps never change)."""
+        session.last_active = time.time()
+        with self._lock:
+            self._remember(session)
+            if self._db is not None:
+                self._db.execute(
+                    "UPDATE tutoring_sessions SET state = ?, last_active = ? WHERE session_id = ?",
+                    (json.dumps(session.state()), session.last_active, session.session_id)
+                )
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM tutoring_sessions WHERE session_id = ?", (session_id,))
+
+    def _remember(self, session: TutoringSession):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_idle(self, now: float):
+        # Sessions are kept in order of last use, so idle ones are at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_active > now - self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"active_sessions": len(self._sessions), **self._stats}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def session_store_from_env() -> SessionStore:
+    """Build the session store from SESSION_* environment variables."""
+    return SessionStore(
+        db_path=os.getenv("SESSION_DB", "cache/sessions.db") or None,
+        max_sessions=int(os.getenv("SESSION_MAX_ACTIVE", "50000")),
+        idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+        resume_ttl=float(os.getenv("SESSION_RESUME_TTL", str(7 * 24 * 3600)))
+    )
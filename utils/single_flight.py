@@ -0,0 +1,42 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def normalize_problem_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different submissions share a key."""
+    return " ".join(str(text).split()).casefold()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one in-flight call.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task and get a copy of its result. Nothing
+    is kept once the call finishes, so later callers start a fresh call (or
+    hit whatever cache sits underneath).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # Followers get their own copy so nobody mutates a shared result
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(func())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # Shield so a cancelled leader does not cancel the call for its followers
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
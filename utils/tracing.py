@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import secrets
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# TRACING_ENABLED=0 turns every span into a no-op
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+
+# Client-supplied trace ids are kept only if they look like ours (or an OpenTelemetry id)
+TRACE_ID_PATTERN = re.compile(r"[0-9a-f]{16,32}")
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = ("trace", "span_id", "parent_span_id", "name", "attributes",
+                 "start_ns", "end_ns", "status", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_span_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def to_dict(self) -> Dict:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            **({"error": self.error} if self.error else {})
+        }
+
+
+class Trace:
+    """All spans of one request, exported together once the root span ends."""
+
+    __slots__ = ("trace_id", "spans", "_lock")
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        root = spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root["name"],
+            "duration_ms": root["duration_ms"],
+            "status": root["status"],
+            "spans": spans
+        }
+
+
+class JsonlExporter:
+    """Appends finished traces to a JSONL file from a background thread.
+
+    Like the rotating log files, the file is rolled over to ``path.1`` ...
+    ``path.<backup_count>`` once it reaches ``max_bytes``, so it never grows
+    past ``max_bytes * (backup_count + 1)``.
+    """
+
+    def __init__(self, path: str, max_bytes: int = TRACE_MAX_BYTES, backup_count: int = TRACE_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue: "queue.SimpleQueue[Optional[Dict]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(trace.to_dict())
+
+    def _rotate(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a")
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                line = json.dumps(record, default=str) + "\n"
+                if self.max_bytes and f.tell() and f.tell() + len(line) > self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a")
+                f.write(line)
+                if self._queue.empty():
+                    f.flush()
+        finally:
+            f.close()
+
+    def shutdown(self):
+        """Write out queued traces and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_exporter: Optional[JsonlExporter] = None
+
+
+def get_exporter() -> JsonlExporter:
+    """Return the process-wide trace exporter, creating it if needed."""
+    global _exporter
+    if _exporter is None:
+        _exporter = JsonlExporter(TRACE_FILE)
+    return _exporter
+
+
+def set_exporter(exporter: Optional[JsonlExporter]):
+    global _exporter
+    _exporter = exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes):
+    """Open the root span of a new trace and make it current.
+
+    A ``trace_id`` that is not 16-32 hex characters is replaced by a new one.
+    Returns ``(span, token)``; pass both to ``end_trace`` when the request is
+    done. Use this where the end of the request is not a single block (such as
+    a streamed response); otherwise prefer the ``trace`` context manager.
+    """
+    if not TRACING_ENABLED:
+        return None, None
+    if trace_id is not None:
+        trace_id = trace_id.lower()
+        if not TRACE_ID_PATTERN.fullmatch(trace_id):
+            trace_id = None
+    root = Span(Trace(trace_id), name, None, attributes)
+    root.trace.add(root)
+    return root, _current_span.set(root)
+
+
+def end_trace(root: Optional[Span], token=None, error: Optional[BaseException] = None):
+    """Close a root span opened by ``start_trace`` and export its trace."""
+    if root is None:
+        return
+    if token is not None:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Ended from a different context (e.g. after a streamed body)
+            pass
+    if error is not None:
+        root.record_error(error)
+    root.end()
+    get_exporter().export(root.trace)
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Run a block as the root span of a new trace."""
+    root, token = start_trace(name, **attributes)
+    try:
+        yield root
+    except BaseException as e:
+        end_trace(root, token, e)
+        raise
+    end_trace(root, token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Run a block as a child of the current span.
+
+    Outside a trace this yields None and records nothing, so library code can
+    open spans unconditionally.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.add(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.record_error(e)
+        raise
+    finally:
+        child.end()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # An async generator resumed from another context
+            pass
+
+
+def traced(name: str):
+    """Decorator that runs a coroutine function inside a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def shutdown_tracing():
+    if _exporter is not None:
+        _exporter.shutdown()
+
+atexit.register(shutdown_tracing)
@@ -1,18 +1,20 @@
 import os
-from typing import Dict, Union, Tuple
-from groq import Groq
-from modules.image_processing.image_processor import ImageProcessor
+from typing import TYPE_CHECKING, Dict, Optional, Union, Tuple
+from utils.llm_gateway import LLMGateway, get_llm_gateway
+from modules.scaffolding.models import Step
+from utils.math_equivalence import is_final_answer
 from utils.logging_utils import validation_logger as logger
+from utils.metrics import FALLBACKS
+from utils.model_router import estimate_difficulty
+from utils.prompts import prompts
+from utils.tracing import traced
 import json
 import re
 
-class AnswerValidator:
-    def __init__(self):
-        """Initialize the validator."""
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        logger.info("AnswerValidator initialized")
-        
-        self.validation_prompt = """
+if TYPE_CHECKING:
+    from modules.image_processing.image_processor import ImageProcessor
+
+VALIDATION_PROMPT = prompts.register("answer_validation", 1, """
         You are a math tutor validating student answers. Compare the student's answer to the expected answer and provide feedback.
         
         Step instruction: {step_instruction}
@@ -27,7 +29,31 @@ class AnswerValidator:
             "understanding_level": "full/partial/none",
             "is_final_answer": true/false
         }}
-        """
+        """)
+
+# Compacted: no indentation or blank lines, which the tokenizer bills for, and the answers last
+prompts.register("answer_validation", 2, """You are a math tutor validating student answers. Compare the student's answer to the expected answer. Respond with only this JSON:
+{{"is_correct": true/false, "explanation": "what is right or wrong", "normalized_answer": "student answer in standard form", "understanding_level": "full/partial/none", "is_final_answer": true/false}}
+Step instruction: {step_instruction}
+Expected answer: {expected_answer}
+Student answer: {student_answer}""")
+
+class AnswerValidator:
+    def __init__(self, llm: Optional[LLMGateway] = None, image_processor: Optional["ImageProcessor"] = None):
+        """Initialize the validator."""
+        self.llm = llm or get_llm_gateway()
+        self._image_processor = image_processor
+        logger.info("AnswerValidator initialized")
+        
+        self.validation_prompt = prompts.get("answer_validation")
+
+    @property
+    def image_processor(self) -> "ImageProcessor":
+        """Image processor for image answers, built (and PIL imported) on first use."""
+        if self._image_processor is None:
+            from modules.image_processing.image_processor import ImageProcessor
+            self._image_processor = ImageProcessor(llm=self.llm)
+        return self._image_processor
 
     def _is_image_path(self, answer: str) -> bool:
         """Check if the answer is an image path or URL."""
@@ -55,24 +81,29 @@ class AnswerValidator:
             return any(form == actual_norm for form in expected_forms)
         return expected_forms == actual_norm
 
-    def validate_answer(self, step_instruction: str, expected_answer: str, user_answer: str) -> Dict:
+    async def validate_answer(self, step_instruction: str, expected_answer: str, user_answer: str) -> Dict:
         """Validate a user's answer."""
-        logger.info(f"\nValidating answer for step: {step_instruction}")
-        logger.info(f"Expected answer: {expected_answer}")
-        logger.info(f"User answer: {user_answer}")
+        step = Step(instruction=step_instruction, expected_answer=expected_answer, hint="", explanation="")
+        return await self.validate_step(step, user_answer)
+
+    @traced("validation.validate_step")
+    async def validate_step(self, step: Step, user_answer: str) -> Dict:
+        """Validate a user's answer against a pre-compiled step."""
+        step_instruction, expected_answer = step.instruction, step.expected_answer
+        logger.debug("\nValidating answer for step: %s", step_instruction)
+        logger.debug("Expected answer: %s", expected_answer)
+        logger.debug("User answer: %s", user_answer)
         
         # First check if this is an image answer
         if os.path.exists(user_answer):
-            logger.info(f"Processing image answer: {user_answer}")
-            from modules.image_processing.image_processor import ImageProcessor
-            image_processor = ImageProcessor()
-            result = image_processor.process_image(user_answer, mode="answer")
+            logger.info("Processing image answer: %s", user_answer)
+            result = await self.image_processor.process_image(user_answer, mode="answer")
             
             # Log the raw result for debugging
-            logger.info(f"Image processing result: {result}")
+            logger.info("Image processing result: %s", result)
             
             if "error" in result:
-                logger.error(f"Error processing image: {result['error']}")
+                logger.error("Error processing image: %s", result['error'])
                 return {
                     "is_correct": False,
                     "explanation": f"Could not process image: {result['error']}",
@@ -82,47 +113,82 @@ class AnswerValidator:
                 }
                 
             user_answer = result.get("answer_text", "")
-            logger.info(f"Extracted answer from image: {user_answer}")
+            logger.info("Extracted answer from image: %s", user_answer)
             
-        # Try LLM validation first
+        # Decide locally when both answers parse; only free text reaches the LLM
+        local = self._validate_locally(step, user_answer)
+        if local is not None:
+            logger.debug("Local validation result: %s", local)
+            return local
+
         try:
-            validation = self._validate_with_llm(step_instruction, expected_answer, user_answer)
-            logger.info(f"LLM validation result: {validation}")
+            validation = await self._validate_with_llm(step_instruction, expected_answer, user_answer)
+            logger.debug("LLM validation result: %s", validation)
             return validation
         except Exception as e:
-            logger.error(f"Validation error: {str(e)}")
+            logger.error("Validation error: %s", e)
             # Fallback to basic comparison
             return self._basic_validation(expected_answer, user_answer)
 
-    def _validate_with_llm(self, step_instruction: str, expected_answer: str, student_answer: str) -> Dict:
+    def _validate_locally(self, step: Step, user_answer: str) -> Optional[Dict]:
+        """Validate parseable answers without the LLM; None when the LLM is needed."""
+        is_correct = step.check_answer(user_answer)
+        if is_correct is None:
+            return None
+        return {
+            "is_correct": is_correct,
+            "explanation": ("Your answer is equivalent to the expected answer." if is_correct
+                            else "Your answer is not equivalent to the expected answer."),
+            "normalized_answer": user_answer.strip(),
+            "understanding_level": "full" if is_correct else "none",
+            "is_final_answer": is_final_answer(user_answer)
+        }
+
+    @staticmethod
+    def _parse_verdict(result: str) -> Dict:
+        """The JSON object in a validation response, raising ValueError if there is none."""
+        result = result.strip()
+        
+        # Extract JSON from response
+        start = result.find('{')
+        end = result.rfind('}') + 1
+        if start >= 0 and end > start:
+            return json.loads(result[start:end])
+        else:
+            raise ValueError("No JSON in response")
+
+    def _is_verdict(self, result: str) -> bool:
+        """Whether a response parses into a verdict with a boolean is_correct."""
+        try:
+            return isinstance(self._parse_verdict(result).get("is_correct"), bool)
+        except (ValueError, AttributeError):
+            return False
+
+    async def _validate_with_llm(self, step_instruction: str, expected_answer: str, student_answer: str) -> Dict:
         """Use LLM to validate answer."""
         try:
-            response = self.client.chat.completions.create(
+            result = await self.llm.complete(
                 model="mixtral-8x7b-32768",
                 messages=[{
                     "role": "user",
-                    "content": self.validation_prompt.format(
+                    "content": self.validation_prompt.render(
                         step_instruction=step_instruction,
                         expected_answer=expected_answer,
                         student_answer=student_answer
                     )
                 }],
                 temperature=0.1,
-                max_tokens=200
+                max_tokens=200,
+                cache_namespace="answer_validation",
+                template=self.validation_prompt,
+                difficulty=estimate_difficulty(f"{expected_answer} {student_answer}"),
+                accept=self._is_verdict
             )
-            
-            result = response.choices[0].message.content.strip()
-            
-            # Extract JSON from response
-            start = result.find('{')
-            end = result.rfind('}') + 1
-            if start >= 0 and end > start:
-                return json.loads(result[start:end])
-            else:
-                raise ValueError("No JSON in response")
+            return self._parse_verdict(result)
                 
         except Exception as e:
-            logger.error(f"LLM validation failed: {str(e)}")
+            logger.error("LLM validation failed: %s", e)
+            FALLBACKS.inc(module="answer_validation", reason="error")
             return self._basic_validation(expected_answer, student_answer)
             
     def _basic_validation(self, expected_answer: str, student_answer: str) -> Dict: